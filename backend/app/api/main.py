@@ -1,7 +1,9 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
 
-from app.api.routes import utils
+from app.api.routes import admin, utils
+from app.dependencies import require_admin
 
 api_router = APIRouter()
 
 api_router.include_router(utils.router, prefix="/utils", tags=["utils"])
+api_router.include_router(admin.router, prefix="/admin", tags=["admin"], dependencies=[Depends(require_admin)])
@@ -0,0 +1,102 @@
+import logging
+from typing import List, Optional
+
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import FileResponse
+
+from app import memory, tracing
+from app.core.config import settings
+from app.profiling import SORT_KEYS, profile_store
+from app.schemas import AllocationSite, MemoryDiff, MemoryStats, ProfileInfo, ProfileReport, TraceInfo, TraceSummary
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+@router.get("/profiles", response_model=List[ProfileInfo], summary="Сохранённые профили запросов")
+async def list_profiles(limit: int = Query(50, ge=1, le=1000)):
+    """Профили запросов (по X-Profile / ?profile=1 или по выборке), новые первыми."""
+    return profile_store.list()[:limit]
+
+
+@router.get("/profiles/{request_id}", response_model=ProfileReport, summary="Самые затратные функции запроса")
+async def read_profile(request_id: str, limit: int = Query(30, ge=1, le=500),
+                       sort: str = Query("cumulative", pattern=f"^({'|'.join(SORT_KEYS)})$")):
+    """
+    Первые limit функций профиля: по умолчанию по накопленному времени (cumulative),
+    то есть с учётом всего, что вызвано изнутри функции.
+    """
+    try:
+        return profile_store.report(request_id, limit, sort)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Профиль запроса '{request_id}' не найден")
+
+
+@router.get("/profiles/{request_id}/download", summary="Файл профиля (pstats)")
+async def download_profile(request_id: str):
+    """Профиль в формате pstats — для snakeviz или pstats.Stats."""
+    try:
+        path = profile_store.stats_path(request_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Профиль запроса '{request_id}' не найден")
+    return FileResponse(path, media_type="application/octet-stream", filename=f"{request_id}.prof")
+
+
+@router.get("/memory", response_model=MemoryStats, summary="Память воркера")
+async def read_memory(top_types: int = Query(20, ge=1, le=200)):
+    """
+    RSS и счётчики объектов ответившего воркера, размеры его кэшей (схемы, сессии
+    пересчёта, справочник, свойства воды) и RSS соседних воркеров контейнера.
+    """
+    return memory.process_memory(top_types)
+
+
+@router.get("/memory/allocations", response_model=List[AllocationSite], summary="Крупнейшие места выделения")
+async def read_allocations(limit: int = Query(25, ge=1, le=500),
+                           group: str = Query("lineno", pattern=f"^({'|'.join(memory.GROUP_KEYS)})$")):
+    """Живая память по местам выделения; доступно, если tracemalloc включён при старте (TRACEMALLOC_FRAMES)."""
+    try:
+        return memory.top_allocations(limit, group)
+    except RuntimeError:
+        raise HTTPException(status_code=409, detail="tracemalloc не включён: задайте TRACEMALLOC_FRAMES "
+                                                    "или используйте /memory/tracemalloc")
+
+
+@router.get("/memory/tracemalloc", response_model=MemoryDiff, summary="Рост памяти за интервал")
+async def diff_memory(seconds: float = Query(10.0, gt=0),
+                      limit: int = Query(25, ge=1, le=500),
+                      group: str = Query("lineno", pattern=f"^({'|'.join(memory.GROUP_KEYS)})$")):
+    """
+    Два снимка tracemalloc с интервалом seconds и места выделения с наибольшим
+    ростом. Ответ приходит через seconds; замер относится к ответившему воркеру.
+    """
+    if seconds > settings.MEMORY_DIFF_MAX_SECONDS:
+        raise HTTPException(status_code=400,
+                            detail=f"Интервал замера больше допустимого ({settings.MEMORY_DIFF_MAX_SECONDS:g} с)")
+    try:
+        return await memory.tracemalloc_diff(seconds, limit, group)
+    except memory.MemoryDiagnosticsBusy:
+        raise HTTPException(status_code=409, detail="Замер памяти уже выполняется в этом воркере")
+
+
+@router.get("/traces", response_model=List[TraceSummary], summary="Самые медленные запросы")
+async def list_traces(limit: int = Query(20, ge=1, le=1000), route: Optional[str] = None):
+    """
+    Трассы самых медленных запросов ответившего воркера (TRACE_SLOW_KEEP штук), самые
+    медленные первыми; route — только запросы к этому шаблону маршрута.
+    """
+    traces = tracing.slow_traces.traces()
+    if route is not None:
+        traces = [t for t in traces if t.root.attributes.get("http.route") == route]
+    return [t.summary() for t in traces[:limit]]
+
+
+@router.get("/traces/{trace_id}", response_model=TraceInfo, summary="Дерево спанов запроса")
+async def read_trace(trace_id: str):
+    """Полное дерево спанов: запрос, поиск штока, расчёт по участкам, отсосы, запись в БД, сериализация."""
+    try:
+        trace = tracing.slow_traces.get(trace_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Трасса '{trace_id}' не найдена среди медленных")
+    return dict(trace.summary(), root=trace.tree())
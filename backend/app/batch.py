@@ -0,0 +1,379 @@
+from __future__ import annotations
+
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from app.calc_core import ph
+from app.schemas import (
+    CalculationParams,
+    CalculationResult,
+    StockCalculationOutcome,
+    SuctionLoad,
+    TurbineCalculationParams,
+    TurbineCalculationResult,
+    ValveInfo,
+)
+from app.utils import CalculationError, ValveCalculator
+
+logger = logging.getLogger(__name__)
+
+# кгс/см² -> МПа
+KGF_TO_MPA = 0.0980665
+
+# Коэффициенты трения λ(Re) — РТМ 108.020.33-86 С.36 Табл.10 (та же таблица, что в WSAProperties.lambda_calc)
+_LAMBDA_RE = np.array([
+    100, 200, 300, 400, 500, 600, 700, 800, 900, 1000, 1100, 1200,
+    1300, 1400, 1500, 1600, 1700, 1800, 1900, 2000, 2500, 3000,
+    4000, 5000, 6000, 8000, 10000, 15000, 20000, 30000, 40000,
+    50000, 60000, 80000, 100000, 150000, 200000, 300000, 400000,
+    500000, 600000, 800000, 1000000, 1500000, 2000000, 3000000,
+    4000000, 5000000, 8000000, 10000000, 15000000, 20000000,
+    30000000, 60000000, 80000000, 100000000,
+], dtype=float)
+_LAMBDA_VALUES = np.array([
+    0.640, 0.320, 0.213, 0.160, 0.128, 0.107, 0.092, 0.080, 0.071,
+    0.064, 0.058, 0.053, 0.049, 0.046, 0.043, 0.040, 0.038, 0.036,
+    0.034, 0.032, 0.034, 0.040, 0.040, 0.038, 0.036, 0.033, 0.032,
+    0.028, 0.026, 0.024, 0.022, 0.021, 0.020, 0.019, 0.018, 0.017,
+    0.016, 0.015, 0.014, 0.013, 0.013, 0.012, 0.012, 0.011, 0.011,
+    0.010, 0.010, 0.009, 0.009, 0.008, 0.008, 0.008, 0.007, 0.007,
+    0.006, 0.006,
+], dtype=float)
+_LAMBDA_SLOPE_LOW = (_LAMBDA_VALUES[1] - _LAMBDA_VALUES[0]) / (_LAMBDA_RE[1] - _LAMBDA_RE[0])
+_LAMBDA_SLOPE_HIGH = (_LAMBDA_VALUES[-1] - _LAMBDA_VALUES[-2]) / (_LAMBDA_RE[-1] - _LAMBDA_RE[-2])
+
+
+def lambda_calc_vec(re: np.ndarray) -> np.ndarray:
+    """
+    Векторный аналог WSAProperties.lambda_calc: линейная интерполяция
+    с линейной экстраполяцией за пределами таблицы.
+    """
+    re = np.asarray(re, dtype=float)
+    lam = np.interp(re, _LAMBDA_RE, _LAMBDA_VALUES)
+    low = re < _LAMBDA_RE[0]
+    if low.any():
+        lam[low] = _LAMBDA_VALUES[0] + (re[low] - _LAMBDA_RE[0]) * _LAMBDA_SLOPE_LOW
+    high = re > _LAMBDA_RE[-1]
+    if high.any():
+        lam[high] = _LAMBDA_VALUES[-1] + (re[high] - _LAMBDA_RE[-1]) * _LAMBDA_SLOPE_HIGH
+    return lam
+
+
+# Коэффициент смягчения входа ξ(r/2δ) — РТМ 108.020.33-86 С.36 Табл.11 (как в WSAProperties.ksi_calc)
+_KSI_RATIO = np.array([0.00, 0.01, 0.02, 0.03, 0.04, 0.05, 0.06, 0.08, 0.12, 0.16, 0.20, 10.0])
+_KSI_VALUES = np.array([0.50, 0.43, 0.36, 0.31, 0.26, 0.22, 0.20, 0.15, 0.09, 0.06, 0.03, 0.03])
+
+
+def ksi_calc_vec(ratio: np.ndarray) -> np.ndarray:
+    """
+    Векторный аналог WSAProperties.ksi_calc (interp1d с линейной экстраполяцией).
+    """
+    ratio = np.asarray(ratio, dtype=float)
+    ksi = np.interp(ratio, _KSI_RATIO, _KSI_VALUES)
+    low = ratio < _KSI_RATIO[0]
+    if low.any():
+        slope = (_KSI_VALUES[1] - _KSI_VALUES[0]) / (_KSI_RATIO[1] - _KSI_RATIO[0])
+        ksi[low] = _KSI_VALUES[0] + (ratio[low] - _KSI_RATIO[0]) * slope
+    high = ratio > _KSI_RATIO[-1]
+    if high.any():
+        slope = (_KSI_VALUES[-1] - _KSI_VALUES[-2]) / (_KSI_RATIO[-1] - _KSI_RATIO[-2])
+        ksi[high] = _KSI_VALUES[-1] + (ratio[high] - _KSI_RATIO[-1]) * slope
+    return ksi
+
+
+def check_part_rows(
+    p_first_mpa: np.ndarray,
+    p_second_mpa: np.ndarray,
+    v: np.ndarray,
+    dyn_viscosity: np.ndarray,
+    len_part_m: np.ndarray,
+    delta_clearance_m: np.ndarray,
+    area_S: np.ndarray,
+) -> Tuple[np.ndarray, List[Optional[str]]]:
+    """
+    Проверки _part_props_detection для набора участков.
+
+    Returns:
+        Скорректированное p_first (разлепление равных давлений) и список
+        сообщений об ошибке по строкам (None — строка корректна).
+    """
+    p_first = np.array(p_first_mpa, dtype=float)
+    errors: List[Optional[str]] = [None] * len(p_first)
+
+    equal = np.abs(p_first - p_second_mpa) < 1e-9
+    p_first[equal] += 0.003  # «разлепление» как в старом коде (в МПа)
+
+    kin_vis = v * dyn_viscosity
+    with np.errstate(divide="ignore", invalid="ignore"):
+        under_root = ((p_first * 1e6) ** 2 - (p_second_mpa * 1e6) ** 2) / (p_first * 1e6 * v)
+
+    for i in np.flatnonzero(
+        (p_first <= p_second_mpa) | (area_S <= 0) | (delta_clearance_m <= 0) | (len_part_m <= 0)
+        | (kin_vis <= 0) | ~(under_root > 0)
+    ):
+        if p_first[i] <= p_second_mpa[i]:
+            errors[i] = (f"Для течения нужно P_first > P_second: p1={p_first[i]:.6f} MPa, "
+                         f"p2={p_second_mpa[i]:.6f} MPa")
+        elif area_S[i] <= 0 or delta_clearance_m[i] <= 0 or len_part_m[i] <= 0:
+            errors[i] = "Некорректная геометрия участка (S, delta_clearance, len_part должны быть > 0)"
+        elif kin_vis[i] <= 0:
+            errors[i] = f"Кинематическая вязкость должна быть > 0, получено: {kin_vis[i]:.3e}"
+        else:
+            errors[i] = f"Отрицательное/нулевое выражение под корнем: {under_root[i]:.3e}"
+    return p_first, errors
+
+
+def part_props_detection_batch(
+    p_first_mpa: np.ndarray,
+    p_second_mpa: np.ndarray,
+    v: np.ndarray,
+    dyn_viscosity: np.ndarray,
+    len_part_m: np.ndarray,
+    delta_clearance_m: np.ndarray,
+    area_S: np.ndarray,
+    ksi: np.ndarray,
+    last_part: np.ndarray,
+    w_min: float = 1.0,
+    w_max: float = 1000.0,
+    tolerance: float = 1e-3,
+) -> np.ndarray:
+    """
+    Векторный аналог _part_props_detection: бинарный поиск скорости сразу по всем участкам.
+
+    Входные данные должны быть предварительно проверены check_part_rows.
+    tolerance — точность по скорости, м/с (1e-3 — как в ValveCalculator).
+    Возвращает массовые расходы G (т/ч).
+    """
+    p1_pa = np.asarray(p_first_mpa, dtype=float) * 1e6
+    p2_pa = np.asarray(p_second_mpa, dtype=float) * 1e6
+    kin_vis = v * dyn_viscosity
+    # Подкоренное выражение не зависит от скорости — считаем один раз
+    flow_term = area_S * np.sqrt((p1_pa ** 2 - p2_pa ** 2) / (p1_pa * v)) * 3.6
+    friction_term = 0.5 * len_part_m / delta_clearance_m
+
+    def mass_flow(w: np.ndarray) -> np.ndarray:
+        re = (w * 2.0 * delta_clearance_m) / kin_vis
+        alpha = 1.0 / np.sqrt(1.0 + ksi + lambda_calc_vec(re) * friction_term)
+        g = alpha * flow_term
+        return np.where(last_part, np.maximum(0.001, g), g)
+
+    lo = np.full(p1_pa.shape, w_min, dtype=float)
+    hi = np.full(p1_pa.shape, w_max, dtype=float)
+    iters = 0
+    active = (hi - lo) > tolerance
+    while active.any():
+        w_mid = 0.5 * (lo + hi)
+        w_calc = v * (mass_flow(w_mid) / 3.6) / area_S
+        above = (w_mid - w_calc) > 0.0
+        hi = np.where(active & above, w_mid, hi)
+        lo = np.where(active & ~above, w_mid, lo)
+        active = (hi - lo) > tolerance
+
+        iters += 1
+        if iters > 1000:  # предохранитель
+            break
+
+    return mass_flow(0.5 * (lo + hi))
+
+
+# ------------------------- Пакетный расчёт штоков ------------------------- #
+class _DeferredValveCalculator(ValveCalculator):
+    """
+    ValveCalculator, который только собирает задачи по участкам.
+    Сами расходы решаются одним векторным шагом для всего пакета.
+    """
+
+    def __init__(self, params: CalculationParams, valve_info: ValveInfo):
+        # (part_index, аргументы _part_props_detection) в порядке вызова;
+        # повторный расчёт участка (2 участка: пересчёт на давление эжектора) перезапишет G
+        self.pending: List[Tuple[int, Tuple]] = []
+        super().__init__(params, valve_info)
+
+    def _solve_part(self, part_index: int, *args, last_part: bool = False) -> float:
+        self.pending.append((part_index, (*args, last_part)))
+        return float("nan")
+
+
+BatchOutcome = Union[CalculationResult, CalculationError]
+
+
+def calculate_batch(cases: Sequence[Tuple[CalculationParams, ValveInfo]],
+                    tolerance: float = 1e-3) -> List[BatchOutcome]:
+    """
+    Пакетный расчёт: термопараметры по участкам считаются как в ValveCalculator,
+    а поиск расходов выполняется одной векторной бисекцией по всем участкам всех случаев.
+
+    Args:
+        cases: Пары (параметры расчёта, геометрия штока).
+        tolerance: Точность бисекции по скорости, м/с (сетевой режим использует свою).
+
+    Returns:
+        Список той же длины: CalculationResult или CalculationError для каждого случая.
+    """
+    outcomes: List[Optional[BatchOutcome]] = [None] * len(cases)
+    calculators: List[Tuple[int, _DeferredValveCalculator]] = []
+
+    for idx, (params, valve_info) in enumerate(cases):
+        if params.network is not None:
+            # Сетевой режим сам решает участки пакетно (итерации Ньютона)
+            from app.network import NetworkValveCalculator
+            try:
+                outcomes[idx] = NetworkValveCalculator(params, valve_info).perform_calculations()
+            except CalculationError as ce:
+                outcomes[idx] = ce
+            continue
+        try:
+            calc = _DeferredValveCalculator(params, valve_info)
+            calc.calculate_areas()
+            calculators.append((idx, calc))
+        except CalculationError as ce:
+            outcomes[idx] = ce
+        except Exception as e:
+            outcomes[idx] = CalculationError(f"Ошибка в расчётах: {e}")
+
+    # Раскладываем отложенные задачи в столбцы
+    owners: List[Tuple[int, int]] = []  # (позиция в calculators, индекс участка)
+    rows: List[Tuple] = []
+    for pos, (_, calc) in enumerate(calculators):
+        for part_index, args in calc.pending:
+            owners.append((pos, part_index))
+            rows.append(args)
+
+    if rows:
+        columns = [np.array(col, dtype=float) for col in zip(*rows)]
+        p1, p2, v, mu, length, delta, area, ksi, last = columns
+        p1, row_errors = check_part_rows(p1, p2, v, mu, length, delta, area)
+        valid = np.array([err is None for err in row_errors])
+
+        g = np.full(len(rows), np.nan)
+        if valid.any():
+            g[valid] = part_props_detection_batch(
+                p1[valid], p2[valid], v[valid], mu[valid], length[valid],
+                delta[valid], area[valid], ksi[valid], last[valid].astype(bool),
+                tolerance=tolerance,
+            )
+
+        failed: Dict[int, str] = {}
+        for (pos, part_index), g_value, err in zip(owners, g, row_errors):
+            if err is not None:
+                failed.setdefault(pos, err)
+            else:
+                calculators[pos][1].g_parts[part_index] = float(g_value)
+    else:
+        failed = {}
+
+    for pos, (idx, calc) in enumerate(calculators):
+        if pos in failed:
+            outcomes[idx] = CalculationError(failed[pos])
+            continue
+        try:
+            outcomes[idx] = calc.collect_results()
+        except CalculationError as ce:
+            outcomes[idx] = ce
+        except Exception as e:
+            outcomes[idx] = CalculationError(f"Ошибка в расчётах: {e}")
+
+    return outcomes
+
+
+def aggregate_suction_loads(results: Sequence[CalculationResult]) -> Tuple[List[SuctionLoad], List[SuctionLoad]]:
+    """
+    Суммирует отсосы нескольких штоков по уровням давления.
+
+    Расходы складываются, энтальпия — средневзвешенная по расходу,
+    температура смеси пересчитывается по IF97 при давлении уровня.
+
+    Returns:
+        (нагрузки на деаэратор, нагрузки на эжектор) — списки по возрастанию давления.
+    """
+    def _collect(groups: Dict[float, List[float]], g: float, h: float, p: float) -> None:
+        if g <= 0:
+            return
+        level = groups.setdefault(round(p, 6), [0.0, 0.0, 0])
+        level[0] += g
+        level[1] += g * h
+        level[2] += 1
+
+    deaerator: Dict[float, List[float]] = {}
+    ejector: Dict[float, List[float]] = {}
+    for result in results:
+        g, _, h, p = result.deaerator_props
+        _collect(deaerator, g, h, p)
+        for props in result.ejector_props:
+            _collect(ejector, props["g"], props["h"], props["p"])
+
+    def _levels(groups: Dict[float, List[float]]) -> List[SuctionLoad]:
+        loads = []
+        for p, (g_sum, gh_sum, sources) in sorted(groups.items()):
+            h_mix = gh_sum / g_sum
+            loads.append(SuctionLoad(p=p, g=g_sum, h=h_mix, t=ph(p * KGF_TO_MPA, h_mix, 1), sources=int(sources)))
+        return loads
+
+    return _levels(deaerator), _levels(ejector)
+
+
+def calculate_turbine(turbine_name: str, valves: Sequence[ValveInfo],
+                      request: TurbineCalculationParams) -> TurbineCalculationResult:
+    """
+    Расчёт всех штоков турбины одним пакетом и сводные нагрузки на деаэратор/эжектор.
+
+    Каждому штоку турбины сопоставляются условия из request.stocks (по valve_id или имени),
+    иначе — request.default. Штоки без условий и с ошибкой расчёта попадают в ответ
+    с текстом ошибки и в суммы не входят.
+    """
+    by_id = {v.id: v for v in valves}
+    by_name = {v.name: v for v in valves}
+
+    outcomes: List[StockCalculationOutcome] = []
+    cases: List[Tuple[CalculationParams, ValveInfo]] = []
+    case_outcomes: List[StockCalculationOutcome] = []
+    covered = set()
+
+    for conditions in request.stocks:
+        valve = by_id.get(conditions.valve_id) if conditions.valve_id is not None \
+            else by_name.get(conditions.valve_drawing)
+        if valve is None:
+            outcomes.append(StockCalculationOutcome(
+                valve_id=conditions.valve_id, valve_drawing=conditions.valve_drawing,
+                error=f"Шток не найден среди штоков турбины '{turbine_name}'",
+            ))
+            continue
+        covered.add(valve.id)
+        cases.append((conditions, valve))
+
+    for valve in valves:
+        if valve.id in covered:
+            continue
+        if request.default is None:
+            outcomes.append(StockCalculationOutcome(
+                valve_id=valve.id, valve_drawing=valve.name, error="Не заданы условия работы штока",
+            ))
+            continue
+        cases.append((request.default, valve))
+
+    cases = [
+        (params.model_copy(update={"turbine_name": turbine_name, "valve_drawing": valve.name,
+                                   "valve_id": valve.id}), valve)
+        for params, valve in cases
+    ]
+    results: List[CalculationResult] = []
+    for (_, valve), outcome in zip(cases, calculate_batch(cases)):
+        entry = StockCalculationOutcome(valve_id=valve.id, valve_drawing=valve.name)
+        if isinstance(outcome, CalculationError):
+            entry.error = outcome.message
+        else:
+            entry.result = outcome
+            results.append(outcome)
+        case_outcomes.append(entry)
+
+    deaerator_loads, ejector_loads = aggregate_suction_loads(results)
+    return TurbineCalculationResult(
+        turbine_name=turbine_name,
+        stocks=case_outcomes + outcomes,
+        deaerator_loads=deaerator_loads,
+        ejector_loads=ejector_loads,
+        total_deaerator_g=sum(load.g for load in deaerator_loads),
+        total_ejector_g=sum(load.g for load in ejector_loads),
+    )
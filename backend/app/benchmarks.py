@@ -0,0 +1,253 @@
+"""
+Микробенчмарки горячих путей расчёта.
+
+Пример:
+    python -m app.benchmarks -o bench.json
+    python -m app.benchmarks -o bench.json --baseline baseline.json --threshold 0.2
+
+Результат — JSON со временем одного вызова (мкс) по каждому бенчмарку. При заданном
+--baseline медианы сравниваются с базовыми; если какая-то медиана выросла больше чем
+на threshold (доля), команда завершается с кодом 1.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app import calc_core
+from app.schemas import CalculationParams, CalculationResultDB, ValveInfo
+from app.utils import ValveCalculator
+
+logger = logging.getLogger(__name__)
+
+SEED = 20240501
+
+# Допустимый рост медианы относительно базового прогона (доля)
+DEFAULT_THRESHOLD = 0.25
+
+# Минимальная длительность одного повтора: число вызовов подбирается под неё
+MIN_TIME = 0.1
+
+# Представительные штоки из db/init.dump (2-5 участков) с типовыми условиями
+CASES: Dict[int, Tuple[CalculationParams, ValveInfo]] = {
+    2: (CalculationParams(temperature_start=555, t_air=40, count_valves=2,
+                          p_ejector=[0.97], p_values=[130, 1.03]),
+        ValveInfo(name="2 parts", count_parts=2, round_radius=2, clearance=0.23, diameter=50,
+                  len_part1=190, len_part2=110)),
+    3: (CalculationParams(temperature_start=555, t_air=40, count_valves=2,
+                          p_ejector=[0.97, 0.97], p_values=[130, 10, 1.03]),
+        ValveInfo(name="БТ-236455", count_parts=3, round_radius=2, clearance=0.271, diameter=36,
+                  len_part1=513, len_part2=89, len_part3=68)),
+    4: (CalculationParams(temperature_start=555, t_air=40, count_valves=4,
+                          p_ejector=[0.97, 0.97, 0.97], p_values=[130, 7, 0.97, 1.03]),
+        ValveInfo(name="БТ-250792", count_parts=4, round_radius=2, clearance=0.205, diameter=36,
+                  len_part1=438.5, len_part2=50, len_part3=25, len_part4=37.5)),
+    5: (CalculationParams(temperature_start=555, t_air=40, count_valves=4,
+                          p_ejector=[0.97, 0.8, 0.7], p_values=[130, 7, 3, 2, 1.03]),
+        ValveInfo(name="УТЗ-302063", count_parts=5, round_radius=2, clearance=0.29, diameter=50,
+                  len_part1=132, len_part2=125, len_part3=60, len_part4=50, len_part5=53)),
+}
+
+_PROPERTY_FUNCTIONS = (calc_core.pt2h, calc_core.ph, calc_core.ph2v, calc_core.ph2t, calc_core.air_calc)
+
+
+def clear_property_caches() -> None:
+    """Новый режим расчёта — промахи кэша свойств; бенчмарки меряют именно их."""
+    for func in _PROPERTY_FUNCTIONS:
+        func.cache_clear()
+
+
+# ------------------------------ Набор бенчмарков ------------------------------ #
+def _calculation_benchmarks() -> Dict[str, Callable[[], object]]:
+    benchmarks: Dict[str, Callable[[], object]] = {}
+
+    # Участки — на пятиучастковом штоке: все ветви (пар, воздух, отсосы)
+    params, valve = CASES[5]
+    calc = ValveCalculator(params, valve)
+    for n in range(1, 6):
+        def area(method=getattr(calc, f"calculate_area{n}")):
+            clear_property_caches()
+            method()
+        benchmarks[f"calculate_area{n}"] = area
+
+    # Решение участка: аргументы первого участка того же штока
+    calc.calculate_area1()
+    part_args = (calc.P_values[0], calc.P_values[1], calc.v_parts[0], calc.din_vis_parts[0],
+                 calc.len_parts[0], calc.delta_clearance, calc.S, float(calc.KSI))
+    benchmarks["part_props_detection"] = lambda: calc_core._part_props_detection(*part_args)
+
+    for parts, (params, valve) in CASES.items():
+        def full(params=params, valve=valve):
+            clear_property_caches()
+            return ValveCalculator(params, valve).perform_calculations()
+        benchmarks[f"perform_calculations_{parts}parts"] = full
+    return benchmarks
+
+
+def _property_benchmarks(points: int = 256) -> Dict[str, Callable[[], object]]:
+    """Обёртки IF97 на случайных (P, h) из области пара штоков; каждый вызов — промах кэша."""
+    rng = np.random.default_rng(SEED)
+    p = rng.uniform(0.09, 13.0, points).tolist()  # МПа
+    t = rng.uniform(200.0, 560.0, points).tolist()  # °C
+    h = [calc_core.pt2h(pi, ti) for pi, ti in zip(p, t)]
+    pairs = list(zip(p, h))
+
+    def run(func, args):
+        def bench():
+            func.cache_clear()
+            for a in args:
+                func(*a)
+        return bench
+
+    return {
+        "if97_pt2h": run(calc_core.pt2h, list(zip(p, t))),
+        "if97_ph_v": run(calc_core.ph, [(pi, hi, 3) for pi, hi in pairs]),
+        "if97_ph_mu": run(calc_core.ph, [(pi, hi, 24) for pi, hi in pairs]),
+        "if97_ph2v": run(calc_core.ph2v, pairs),
+        "if97_ph2t": run(calc_core.ph2t, pairs),
+    }
+
+
+def _persistence_benchmarks() -> Dict[str, Callable[[], object]]:
+    """Путь сохранения результата: JSON как в crud.create_calculation_result и обратно в схему ответа."""
+    params, valve = CASES[5]
+    result = ValveCalculator(params, valve).perform_calculations()
+    stored = {"input_data": json.dumps(params.model_dump()), "output_data": json.dumps(result.model_dump())}
+
+    def dump():
+        return json.dumps(params.model_dump()), json.dumps(result.model_dump())
+
+    def load():
+        return CalculationResultDB(
+            id=1, stock_name=valve.name, turbine_name="bench", calc_timestamp=datetime.now(timezone.utc),
+            input_data=json.loads(stored["input_data"]), output_data=json.loads(stored["output_data"]),
+        )
+
+    return {"json_dump_result": dump, "json_load_result": load}
+
+
+def _diagram_benchmarks(output_dir: str) -> Dict[str, Callable[[], object]]:
+    from app.save_to_drowio import TEMPLATES_DIR, DiagramGenerator
+
+    generator = DiagramGenerator(TEMPLATES_DIR, output_dir)
+    # Только штоки, для которых в поставке есть шаблон
+    return {f"generate_diagram_{parts}parts": (lambda valve=valve: generator.generate_diagram(valve))
+            for parts, (_, valve) in CASES.items() if os.path.exists(generator.template_mapping[parts])}
+
+
+# ------------------------------ Замер и сравнение ------------------------------ #
+def measure(func: Callable[[], object], repeat: int, min_time: float = MIN_TIME) -> Dict[str, float]:
+    """
+    Время одного вызова, мкс: число вызовов в повторе подбирается так, чтобы
+    повтор длился не меньше min_time; по повторам — минимум, медиана, среднее.
+    """
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time or number >= 1_000_000:
+            break
+        number *= 2 if elapsed <= 0 else max(2, min(10, int(min_time / elapsed) + 1))
+    timings = [elapsed / number]
+    for _ in range(repeat - 1):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - started) / number)
+    timings = [x * 1e6 for x in timings]
+    return {"min_us": min(timings), "median_us": statistics.median(timings),
+            "mean_us": statistics.fmean(timings), "number": number, "repeat": repeat}
+
+
+def run_benchmarks(names: Optional[Sequence[str]] = None, repeat: int = 5,
+                   min_time: float = MIN_TIME) -> Dict:
+    """
+    Прогон бенчмарков (всех или с подстрокой из names в имени).
+
+    Returns:
+        {"meta": {...}, "results": {имя: замер measure}}.
+    """
+    results: Dict[str, Dict[str, float]] = {}
+    with tempfile.TemporaryDirectory() as output_dir:
+        benchmarks = {**_calculation_benchmarks(), **_property_benchmarks(),
+                      **_persistence_benchmarks(), **_diagram_benchmarks(output_dir)}
+        for name, func in benchmarks.items():
+            if names and not any(part in name for part in names):
+                continue
+            results[name] = measure(func, repeat, min_time)
+            logger.info(f"{name}: медиана {results[name]['median_us']:.1f} мкс")
+    return {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "seed": SEED,
+        },
+        "results": results,
+    }
+
+
+def compare(current: Dict, baseline: Dict, threshold: float = DEFAULT_THRESHOLD) -> List[Dict[str, float]]:
+    """
+    Сравнение медиан с базовым прогоном.
+
+    Returns:
+        Регрессии: бенчмарки, медиана которых выросла больше чем на threshold.
+    """
+    regressions = []
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        ratio = result["median_us"] / base["median_us"]
+        if ratio > 1.0 + threshold:
+            regressions.append({"name": name, "baseline_us": base["median_us"],
+                                "current_us": result["median_us"], "ratio": ratio})
+    return regressions
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Микробенчмарки горячих путей расчёта")
+    parser.add_argument("-o", "--output", required=True, help="JSON с результатами")
+    parser.add_argument("--baseline", help="JSON базового прогона для сравнения")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Допустимый рост медианы, доля (0.25 — на 25%%)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=MIN_TIME, help="Минимальная длительность повтора, с")
+    parser.add_argument("-k", "--filter", action="append", default=[],
+                        help="Только бенчмарки с этой подстрокой в имени")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.filter, args.repeat, args.min_time)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+    if not args.baseline:
+        return 0
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(report, baseline, args.threshold)
+    for r in regressions:
+        logger.error(f"Регрессия {r['name']}: {r['baseline_us']:.1f} -> {r['current_us']:.1f} мкс "
+                     f"(x{r['ratio']:.2f})")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    # Построчный лог расчётчика и генератора схем не должен попадать в замер
+    logging.getLogger("app").setLevel(logging.ERROR)
+    sys.exit(main())
@@ -0,0 +1,72 @@
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, Optional
+
+from app.core.config import settings
+from app.schemas import CalculationParams, ValveInfo
+
+if TYPE_CHECKING:
+    from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogSnapshot:
+    """Неизменяемый срез справочника штоков: поиск по ID и по имени чертежа без обращения к БД."""
+
+    def __init__(self, valves: Dict[int, ValveInfo]):
+        self.by_id = valves
+        self.by_name: Dict[str, ValveInfo] = {}
+        for valve in valves.values():
+            # Как db.query(...).first(): при совпадении имён — шток с меньшим ID
+            if valve.name is not None and valve.name not in self.by_name:
+                self.by_name[valve.name] = valve
+
+    def find(self, params: CalculationParams) -> Optional[ValveInfo]:
+        """Шток для расчёта: по valve_id, если он передан, иначе по имени чертежа."""
+        if params.valve_id is not None:
+            return self.by_id.get(params.valve_id)
+        return self.by_name.get(params.valve_drawing)
+
+    def __len__(self) -> int:
+        return len(self.by_id)
+
+
+class ValveCatalog:
+    """
+    Кэш справочника штоков для потоковых расчётов.
+
+    Таблица штоков небольшая, поэтому загружается целиком и живёт ttl секунд;
+    эндпоинты, меняющие штоки, сбрасывают кэш через invalidate().
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def snapshot(self, db: "Session") -> CatalogSnapshot:
+        # Модели — только здесь: CatalogSnapshot используется офлайн-расчётом без БД
+        from app.models import Valve
+
+        with self._lock:
+            if self._snapshot is None or time.monotonic() - self._loaded_at > self.ttl:
+                valves = db.query(Valve).order_by(Valve.id).all()
+                self._snapshot = CatalogSnapshot({v.id: ValveInfo.model_validate(v) for v in valves})
+                self._loaded_at = time.monotonic()
+                logger.info(f"Справочник штоков загружен: {len(self._snapshot)} шт.")
+            return self._snapshot
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._snapshot = None
+
+    def __len__(self) -> int:
+        """Число штоков в загруженном срезе (0, если срез не загружен)."""
+        with self._lock:
+            return len(self._snapshot) if self._snapshot is not None else 0
+
+
+valve_catalog = ValveCatalog(ttl=settings.VALVE_CATALOG_TTL)
@@ -0,0 +1,114 @@
+"""
+Объединение одинаковых одновременных расчётов (single-flight).
+
+Одинаковые запросы /calculate (тот же шток и режим — двойная отправка формы, несколько
+пользователей на одной точке) определяются по отпечатку канонического JSON запроса.
+В воркере второй и следующие запросы ждут уже идущий расчёт и получают его результат:
+один расчёт и одна запись в БД. Между воркерами uvicorn расчёт по отпечатку
+сериализует транзакционная advisory-блокировка PostgreSQL на соединении сессии
+запроса (её снимает фиксация результата): дождавшийся её воркер берёт результат,
+записанный за время ожидания, вместо повторного расчёта. На других СУБД (SQLite в
+тестах и на нагрузочном стенде) объединение работает только внутри воркера.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, Iterator, Optional, TypeVar
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from app import metrics
+from app.schemas import CalculationParams
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def fingerprint(params: CalculationParams, valve_id: int, diagnostics: bool = False) -> str:
+    """
+    Отпечаток расчёта: найденный шток и входные данные без учёта порядка ключей и
+    записи чисел (130 и 130.0 совпадают), плюс флаг диагностики — он меняет результат.
+    """
+    payload = {
+        "valve_id": valve_id,
+        "params": params.model_dump(mode="json", exclude={"valve_id", "valve_drawing"}),
+        "diagnostics": diagnostics,
+    }
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def lock_key(key: str) -> int:
+    """Ключ advisory-блокировки (bigint со знаком) по отпечатку."""
+    return int.from_bytes(bytes.fromhex(key[:16]), "big", signed=True)
+
+
+class SingleFlight:
+    """Одна выполняемая задача на ключ в цикле событий воркера; остальные вызовы ждут её результат."""
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key: str, func: Callable[[], Awaitable[T]]) -> T:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            metrics.calculations_coalesced.labels(scope="worker").inc()
+        # Отмена одного запроса (клиент отключился) не отменяет расчёт для остальных
+        return await asyncio.shield(task)
+
+
+@contextmanager
+def advisory_lock(db: Session, key: str, timeout: float) -> Iterator[Optional[datetime]]:
+    """
+    Advisory-блокировка PostgreSQL на отпечаток до конца транзакции сессии запроса.
+
+    Блокировка берётся на соединении самой сессии (pg_advisory_xact_lock), а не на
+    отдельном соединении пула, и снимается фиксацией результата расчёта. По выходе
+    транзакция завершается в любом случае: commit (результат взят готовым — писать
+    нечего) или rollback при исключении.
+
+    Yields:
+        Момент начала ожидания, если блокировку держал другой воркер (его результат
+        записан не раньше этого момента), иначе None. Не PostgreSQL или истёк timeout
+        ожидания — None без блокировки: расчёт выполняется независимо.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        yield None
+        return
+    lock_id = lock_key(key)
+    conn = db.connection()
+    waited_since = None
+    if not conn.execute(text("SELECT pg_try_advisory_xact_lock(:k)"), {"k": lock_id}).scalar():
+        waited_since = datetime.now(timezone.utc)
+        try:
+            conn.execute(text("SELECT set_config('lock_timeout', :t, true)"), {"t": f"{int(timeout * 1000)}ms"})
+            conn.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": lock_id})
+            conn.execute(text("SET LOCAL lock_timeout TO DEFAULT"))
+        except OperationalError:
+            logger.warning(f"Не дождались блокировки расчёта {key[:12]} за {timeout:g} с, считаем независимо")
+            db.rollback()
+            waited_since = None
+    try:
+        yield waited_since
+    except BaseException:
+        db.rollback()
+        raise
+    db.commit()
+
+
+single_flight = SingleFlight()
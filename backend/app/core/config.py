@@ -43,6 +43,64 @@ class Settings(BaseSettings):
     POSTGRES_USER: str = "postgres"
     POSTGRES_PASSWORD: str = "password"
     POSTGRES_DB: str = "postgres"
+    # Строка подключения вместо POSTGRES_* (например, sqlite:///loadtest.db для нагрузочного стенда)
+    DATABASE_URL: str | None = None
+
+    # Кэш сгенерированных схем draw.io
+    DIAGRAM_CACHE_SIZE: int = 256
+    DIAGRAM_CACHE_DIR: str | None = None  # общий для воркеров дисковый кэш (опционально)
+
+    # Карты режимов штоков (по умолчанию — app/operating_maps)
+    OPERATING_MAP_DIR: str | None = None
+
+    # Монте-Карло: число процессов (0 — в текущем процессе) и предел выборки
+    MONTE_CARLO_WORKERS: int = 4
+    MONTE_CARLO_MAX_SAMPLES: int = 1_000_000
+
+    # Потоковые расчёты: предел числа точек развёртки, время жизни кэша справочника штоков, с
+    SWEEP_MAX_POINTS: int = 100_000
+    VALVE_CATALOG_TTL: float = 300.0
+
+    # Пересчёт результатов: сколько сессий с промежуточными величинами держать в памяти
+    CALCULATION_SESSIONS: int = 256
+
+    # Фоновые задачи: число одновременно выполняемых задач в процессе,
+    # ограничения по видам задач (на все процессы), опрос очереди и признак «зависшей» задачи
+    JOB_WORKERS: int = 2
+    JOB_KIND_LIMITS: dict[str, int] = {"optimization": 1, "monte_carlo": 1}
+    JOB_POLL_INTERVAL: float = 1.0
+    JOB_STALE_SECONDS: float = 60.0
+    JOB_MAX_ATTEMPTS: int = 3
+    # Таблица задач в отдельной БД (например, sqlite:///jobs.db); по умолчанию — основная БД
+    JOBS_DATABASE_URL: str | None = None
+
+    # Профилирование запросов: по заголовку X-Profile / ?profile=1 (кроме production)
+    # и каждый N-й запрос (0 — выборка выключена); каталог профилей (по умолчанию
+    # app/profiles) и сколько последних профилей хранить
+    PROFILE_SAMPLE_RATE: int = 0
+    PROFILE_DIR: str | None = None
+    PROFILE_KEEP: int = 200
+
+    # Диагностика памяти: глубина стека tracemalloc, включаемого при старте
+    # (0 — включается только на время замера), и предел интервала замера, с
+    TRACEMALLOC_FRAMES: int = 0
+    MEMORY_DIFF_MAX_SECONDS: float = 300.0
+
+    # Служебные эндпоинты /admin (профили, память, трассы): с заданным токеном — только
+    # с заголовком X-Admin-Token; без токена — везде, кроме production
+    ADMIN_TOKEN: str | None = None
+
+    # Трассировка запросов: сколько самых медленных трасс хранить в воркере и файл
+    # JSON Lines для экспорта всех трасс (опционально — только не быстрее TRACE_FILE_MIN_MS)
+    TRACING_ENABLED: bool = True
+    TRACE_SLOW_KEEP: int = 20
+    TRACE_FILE: str | None = None
+    TRACE_FILE_MIN_MS: float = 0.0
+
+    # Объединение одинаковых одновременных /calculate: один расчёт и одна запись в БД;
+    # между воркерами — advisory-блокировка PostgreSQL с этим пределом ожидания, с
+    COALESCE_CALCULATIONS: bool = True
+    COALESCE_LOCK_TIMEOUT: float = 60.0
 
     @computed_field
     @property
@@ -140,6 +140,33 @@ def get_results_by_valve_drawing(db: Session, valve_drawing: str):
                             detail=f"Не удалось получить результаты: {e}")
 
 
+def find_recent_calculation_result(db: Session, valve_id: int, key: str, since: datetime,
+                                   diagnostics: bool = False) -> Optional[CalculationResultDB]:
+    """
+    Последний результат по штоку с тем же отпечатком входных данных (app.coalescing.fingerprint:
+    шток задан по ID или по чертежу — неважно), записанный не раньше since; diagnostics —
+    с диагностикой решателя в output_data или без неё.
+    """
+    from app.coalescing import fingerprint
+
+    candidates = (
+        db.query(CalculationResultDB)
+        .filter(CalculationResultDB.valve_id == valve_id, CalculationResultDB.calc_timestamp >= since)
+        .order_by(CalculationResultDB.id.desc())
+        .all()
+    )
+    for result in candidates:
+        try:
+            params = schemas.CalculationParams.model_validate(json.loads(result.input_data))
+        except ValueError:
+            continue
+        if fingerprint(params, valve_id, diagnostics) != key:
+            continue
+        if bool(json.loads(result.output_data).get("metadata")) == diagnostics:
+            return result
+    return None
+
+
 def get_calculation_result_by_id(db: Session, result_id: int) -> Optional[CalculationResultDB]:
     """
     Получает один результат расчета по его ID.
@@ -179,3 +206,12 @@ def get_valve_by_id(db: Session, valve_id: int) -> Optional[models.Valve]:
     except Exception as e:
         logger.error(f"Ошибка базы данных при получении клапана по ID {valve_id}: {str(e)}")
         return None
+
+
+def get_valve_for_params(db: Session, params: schemas.CalculationParams) -> Optional[models.Valve]:
+    """
+    Находит шток для расчёта: по valve_id, если он передан, иначе по имени чертежа.
+    """
+    if params.valve_id is not None:
+        return get_valve_by_id(db, valve_id=params.valve_id)
+    return db.query(models.Valve).filter(models.Valve.name == params.valve_drawing).first()
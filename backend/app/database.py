@@ -3,7 +3,22 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
 
-engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI))
+
+def engine_options(url: str) -> dict:
+    """
+    Параметры движка по строке подключения. SQLite (нагрузочный стенд, тесты):
+    схема autocalc отображается на схему по умолчанию, соединение доступно из
+    пула потоков обработчиков.
+    """
+    if url.startswith("sqlite"):
+        return {"connect_args": {"check_same_thread": False},
+                "execution_options": {"schema_translate_map": {"autocalc": None}}}
+    return {}
+
+
+DATABASE_URL = settings.DATABASE_URL or str(settings.SQLALCHEMY_DATABASE_URI)
+
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL))
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
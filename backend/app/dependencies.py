@@ -1,3 +1,9 @@
+import secrets
+from typing import Optional
+
+from fastapi import Header, HTTPException, status
+
+from app.core.config import settings
 from app.database import SessionLocal
 
 
@@ -7,3 +13,16 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    """
+    Доступ к служебным эндпоинтам: профили и трассы раскрывают запросы, а замер
+    tracemalloc замедляет весь воркер.
+    """
+    if settings.ADMIN_TOKEN:
+        if x_admin_token is None or not secrets.compare_digest(x_admin_token, settings.ADMIN_TOKEN):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Неверный токен администратора")
+    elif settings.ENVIRONMENT == "production":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                            detail="Служебные эндпоинты в production доступны только с ADMIN_TOKEN")
@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+import logging
+import re
+from math import pi
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from scipy.optimize import brentq
+
+from app.batch import _DeferredValveCalculator, check_part_rows, ksi_calc_vec, part_props_detection_batch
+from app.network import make_calculator
+from app.schemas import CalculationParams, DesignParams, DesignResult, ValveInfo
+from app.sensitivity import SOLVER_TOLERANCE
+from app.utils import CalculationError
+
+logger = logging.getLogger(__name__)
+
+FREE_VARIABLE_RE = re.compile(r"^(clearance|round_radius|len_part[1-5])$")
+TARGET_RE = re.compile(r"^(G[1-5]|deaerator|ejector[1-3]|ejector_total)$")
+
+# Диапазон поиска по умолчанию — доли номинала; сетка для поиска смены знака
+DEFAULT_BOUNDS = (0.2, 5.0)
+BRACKET_POINTS = 17
+
+
+class FrozenGeometry:
+    """
+    Расходы по участкам штока при варьировании зазора, радиуса скругления и длин.
+
+    Свойства пара и воздуха по участкам (IF97, WSAProperties) от этих величин
+    не зависят, поэтому считаются один раз; для набора геометрий пересчитываются
+    только S, KSI и сами расходы — одной пакетной бисекцией.
+    Объект содержит только числа и массивы и передаётся в процессы пула.
+    """
+
+    def __init__(self, params: CalculationParams, valve: ValveInfo):
+        if params.network is not None:
+            raise CalculationError("Расчёт с варьируемой геометрией не поддерживает сетевой режим.")
+        calc = _DeferredValveCalculator(params, valve)
+        calc.calculate_areas()
+        self.count_parts = calc.count_parts
+        self.count_valves = calc.count_valves
+        self.diameter_stock = calc.diameter_stock
+        self.nominal: Dict[str, float] = {
+            "clearance": float(valve.clearance),
+            "round_radius": float(valve.round_radius),
+            **{f"len_part{i + 1}": L * 1000.0 for i, L in enumerate(calc.len_parts)},
+        }
+        # Строки задач: (part_index, p1, p2, v, mu, L, delta, S, ksi, last)
+        self.rows = np.array([(k, *args) for k, args in calc.pending], dtype=float)
+
+    def part_flows(self, geometry: Dict[str, np.ndarray]) -> np.ndarray:
+        """
+        G по участкам (т/ч) для m геометрий.
+
+        Args:
+            geometry: Значения (мм) для части ключей clearance, round_radius,
+                len_part<i>; недостающие берутся из номинала.
+
+        Returns:
+            Массив (m, count_parts); геометрии вне области решения — NaN.
+        """
+        m = len(next(iter(geometry.values())))
+        values = {key: np.broadcast_to(np.asarray(geometry.get(key, nominal), dtype=float), (m,))
+                  for key, nominal in self.nominal.items()}
+        n = len(self.rows)
+        rows = np.tile(self.rows, (m, 1))
+        part = rows[:, 0].astype(int)
+
+        delta = np.repeat(values["clearance"], n) / 1000.0
+        radius = np.repeat(values["round_radius"], n) / 1000.0
+        lengths = np.stack([values[f"len_part{i + 1}"] for i in range(self.count_parts)], axis=1) / 1000.0
+        rows[:, 5] = lengths[np.repeat(np.arange(m), n), part]
+        rows[:, 6] = delta
+        rows[:, 7] = delta * pi * self.diameter_stock
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rows[:, 8] = ksi_calc_vec(radius / (2.0 * delta))
+
+        _, p1, p2, v, mu, length, delta, area, ksi, last = rows.T
+        p1, errors = check_part_rows(p1, p2, v, mu, length, delta, area)
+        valid = np.array([e is None for e in errors])
+        g = np.full(len(rows), np.nan)
+        if valid.any():
+            g[valid] = part_props_detection_batch(
+                p1[valid], p2[valid], v[valid], mu[valid], length[valid], delta[valid],
+                area[valid], ksi[valid], last[valid].astype(bool), tolerance=SOLVER_TOLERANCE,
+            )
+
+        # Повторный расчёт участка перезаписывает G, как в ValveCalculator
+        flows = np.full((m, self.count_parts), np.nan)
+        g = g.reshape(m, n)
+        for j, part_index in enumerate(self.rows[:, 0].astype(int)):
+            flows[:, part_index] = g[:, j]
+        invalid = np.isnan(g).any(axis=1)
+        flows[invalid] = np.nan
+        return flows
+
+    def suction_loads(self, flows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Векторные формулы ValveCalculator.deaerator_options/ejector_options (только расходы).
+
+        Returns:
+            (расход в деаэратор, суммарный расход в эжектор), т/ч, для каждой строки flows.
+        """
+        g = flows.T
+        n = self.count_parts
+        if n == 2:
+            deaerator = np.zeros(flows.shape[0])
+            ejector = g[0] + g[1]
+        elif n == 3:
+            deaerator = g[0] - g[1]
+            ejector = g[1] + g[2]
+        elif n == 4:
+            deaerator = g[0] - g[1] - g[2]
+            ejector = np.maximum(g[1] - g[2] - g[3], 0.0) + np.abs(g[2] - g[3])
+        elif n == 5:
+            deaerator = g[0] - g[1] - g[2] - g[3]
+            ejector = np.maximum(g[1] - g[2] - g[3], 0.0) + np.abs(g[2] - g[3]) + g[3] + g[4]
+        else:
+            raise CalculationError("Неверное количество участков для отсосов.")
+        return deaerator * self.count_valves, ejector * self.count_valves
+
+
+class FrozenDesignProblem:
+    """Обратная задача с одной свободной геометрической величиной."""
+
+    def __init__(self, params: CalculationParams, valve: ValveInfo, free_variable: str, target: str):
+        if not FREE_VARIABLE_RE.match(free_variable):
+            raise CalculationError(f"Неподдерживаемая свободная величина: {free_variable}")
+        if not TARGET_RE.match(target):
+            raise CalculationError(f"Неподдерживаемая цель: {target}")
+
+        self.geometry = FrozenGeometry(params, valve)
+        # Для отсосов по отдельности — формулы ValveCalculator на замороженных термопараметрах
+        self.calc: Optional[_DeferredValveCalculator] = None
+        if target not in ("deaerator", "ejector_total") and not target.startswith("G"):
+            self.calc = _DeferredValveCalculator(params, valve)
+            self.calc.calculate_areas()
+        self.free_variable = free_variable
+        self.target = target
+        self.evaluations = 0
+
+        count_parts = self.geometry.count_parts
+        if free_variable.startswith("len_part") and int(free_variable[-1]) > count_parts:
+            raise CalculationError(f"У штока нет участка {free_variable[-1]}")
+        if target.startswith("G") and int(target[1:]) > count_parts:
+            raise CalculationError(f"У штока нет участка {target[1:]}")
+
+    @property
+    def nominal(self) -> float:
+        return self.geometry.nominal[self.free_variable]
+
+    def evaluate(self, values: np.ndarray) -> np.ndarray:
+        """Целевая величина (т/ч) для набора значений свободной величины; вне области решения — NaN."""
+        values = np.asarray(values, dtype=float)
+        self.evaluations += len(values)
+        flows = self.geometry.part_flows({self.free_variable: values})
+
+        if self.target.startswith("G"):
+            return flows[:, int(self.target[1:]) - 1]
+        if self.target in ("deaerator", "ejector_total"):
+            deaerator, ejector = self.geometry.suction_loads(flows)
+            return deaerator if self.target == "deaerator" else ejector
+
+        index = int(self.target[len("ejector"):]) - 1
+        out = np.full(len(values), np.nan)
+        for i, row in enumerate(flows):
+            if np.isnan(row).any():
+                continue
+            self.calc.g_parts = row.tolist()
+            g_list = self.calc.ejector_options()[0]
+            if index >= len(g_list):
+                raise CalculationError(f"У штока нет отсоса {self.target}")
+            out[i] = g_list[index]
+        return out
+
+
+def _bracket(f: Callable[[np.ndarray], np.ndarray], lo: float, hi: float, nominal: float) -> Tuple[float, float]:
+    """Поиск смены знака на логарифмической сетке (один пакетный расчёт), ближайшей к номиналу."""
+    grid = np.geomspace(lo, hi, BRACKET_POINTS)
+    values = f(grid)
+    candidates: List[Tuple[float, float, float]] = []
+    for a, b, fa, fb in zip(grid[:-1], grid[1:], values[:-1], values[1:]):
+        if np.isfinite(fa) and np.isfinite(fb) and fa * fb <= 0:
+            candidates.append((abs(np.log(np.sqrt(a * b) / nominal)), a, b))
+    if not candidates:
+        finite = values[np.isfinite(values)]
+        span = f"[{finite.min():.6g}, {finite.max():.6g}]" if finite.size else "нет решений"
+        raise CalculationError(f"Цель недостижима в диапазоне [{lo:.6g}, {hi:.6g}]: отклонение {span}")
+    _, a, b = min(candidates)
+    return float(a), float(b)
+
+
+def solve_design(request: DesignParams, valve: ValveInfo) -> DesignResult:
+    """
+    Обратная задача: значение свободной величины, при котором цель равна target_value.
+
+    Корень отделяется на сетке одним пакетным расчётом, затем уточняется методом Брента.
+    Итоговая геометрия проверяется полным расчётом.
+    """
+    problem = FrozenDesignProblem(request.params, valve, request.free_variable, request.target)
+    nominal = problem.nominal
+    if request.bounds is not None:
+        lo, hi = request.bounds
+    else:
+        lo, hi = nominal * DEFAULT_BOUNDS[0], nominal * DEFAULT_BOUNDS[1]
+    if not 0 < lo < hi:
+        raise CalculationError("Диапазон поиска должен удовлетворять 0 < min < max.")
+
+    def residual(values: np.ndarray) -> np.ndarray:
+        return problem.evaluate(values) - request.target_value
+
+    a, b = _bracket(residual, lo, hi, nominal)
+    value = brentq(lambda x: float(residual(np.array([x]))[0]), a, b, xtol=1e-9 * max(abs(a), 1.0))
+
+    designed = valve.model_copy(update={request.free_variable: float(value)})
+    result = make_calculator(request.params, designed).perform_calculations()
+    achieved = float(problem.evaluate(np.array([value]))[0])
+    logger.info(
+        f"Обратная задача: {request.free_variable}={value:.6g} для {request.target}={request.target_value} "
+        f"({problem.evaluations} вычислений)"
+    )
+    return DesignResult(
+        free_variable=request.free_variable,
+        value=float(value),
+        target=request.target,
+        target_value=request.target_value,
+        achieved=achieved,
+        evaluations=problem.evaluations,
+        valve=designed,
+        result=result,
+    )
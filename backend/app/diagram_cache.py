@@ -0,0 +1,101 @@
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class DiagramCache:
+    """
+    Контентно-адресуемый кэш сгенерированных схем.
+
+    Ключ — отпечаток геометрии и версии шаблона, значение — готовый XML (bytes).
+    В памяти хранится не более max_entries схем с вытеснением LRU; если задан
+    cache_dir, схемы дополнительно пишутся на диск и видны всем воркерам uvicorn.
+    """
+
+    def __init__(self, max_entries: int = 256, cache_dir: Optional[str] = None):
+        """
+        Args:
+            max_entries (int): Максимальное число схем в памяти.
+            cache_dir (Optional[str]): Общая директория для дискового уровня кэша.
+        """
+        self.max_entries = max(0, int(max_entries))
+        self.cache_dir = cache_dir
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.drawio")
+
+    def _remember(self, key: str, content: bytes) -> None:
+        if self.max_entries == 0:
+            return
+        with self._lock:
+            self._entries[key] = content
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Возвращает схему по ключу или None при промахе."""
+        with self._lock:
+            content = self._entries.get(key)
+            if content is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return content
+
+        if self.cache_dir:
+            try:
+                with open(self._disk_path(key), "rb") as f:
+                    content = f.read()
+            except FileNotFoundError:
+                content = None
+            except OSError as e:
+                logger.warning(f"Не удалось прочитать схему {key} из дискового кэша: {e}")
+                content = None
+            if content is not None:
+                self._remember(key, content)
+                with self._lock:
+                    self.hits += 1
+                return content
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, content: bytes) -> None:
+        """Сохраняет схему в памяти и (если настроено) на диске."""
+        self._remember(key, content)
+        if not self.cache_dir:
+            return
+        # Атомарная запись: другой воркер никогда не увидит недописанный файл
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, self._disk_path(key))
+        except OSError as e:
+            logger.warning(f"Не удалось записать схему {key} в дисковый кэш: {e}")
+
+    def clear(self) -> None:
+        """Очищает уровень кэша в памяти."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def memory_bytes(self) -> int:
+        """Суммарный размер схем в памяти, байт."""
+        with self._lock:
+            return sum(len(content) for content in self._entries.values())
@@ -0,0 +1,56 @@
+import hashlib
+import json
+from typing import Any, Dict
+
+from app.schemas import ValveInfo
+
+# Поля геометрии, от которых зависит схема и расчёт (имя/тип/турбина не влияют)
+GEOMETRY_FIELDS = ("count_parts", "clearance", "diameter", "round_radius")
+
+
+def _canonical_number(value: Any) -> Any:
+    """Приводит число к каноническому виду: 89 и 89.0 дают одинаковый отпечаток."""
+    if value is None:
+        return None
+    return repr(float(value))
+
+
+def geometry_payload(valve_info: ValveInfo) -> Dict[str, Any]:
+    """
+    Каноническое представление геометрии штока.
+
+    Длины берутся только для первых count_parts участков — остальные
+    в схему не попадают и на результат не влияют.
+    """
+    payload: Dict[str, Any] = {
+        "count_parts": valve_info.count_parts,
+        "clearance": _canonical_number(valve_info.clearance),
+        "diameter": _canonical_number(valve_info.diameter),
+        "round_radius": _canonical_number(valve_info.round_radius),
+    }
+    count_parts = valve_info.count_parts or 0
+    for i in range(1, count_parts + 1):
+        payload[f"len_part{i}"] = _canonical_number(getattr(valve_info, f"len_part{i}", None))
+    return payload
+
+
+def fingerprint(payload: Dict[str, Any]) -> str:
+    """SHA-256 от канонического JSON-представления словаря."""
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def geometry_fingerprint(valve_info: ValveInfo, **salt: Any) -> str:
+    """
+    Отпечаток геометрии штока.
+
+    Args:
+        valve_info: Параметры штока.
+        **salt: Дополнительные поля ключа (например, версия шаблона).
+
+    Returns:
+        Шестнадцатеричная строка SHA-256.
+    """
+    payload = geometry_payload(valve_info)
+    payload.update(salt)
+    return fingerprint(payload)
@@ -0,0 +1,289 @@
+"""
+Эталонный корпус: точность и скорость альтернативных движков расчёта.
+
+Пример:
+    python -m app.golden generate -o corpus.npz --size 5000
+    python -m app.golden replay corpus.npz --engine batch --engine batch_coarse -o report.json
+
+Корпус — случайные режимы и геометрии штоков (2-5 участков) вокруг представительных
+штоков из db/init.dump, посчитанные точным скалярным ValveCalculator. Воспроизведение
+прогоняет корпус через движок из ENGINES и сообщает относительную погрешность каждого
+выхода (максимум и перцентили) и пропускную способность. Движок принимается, если
+максимальная погрешность всех выходов не больше --max-rel-error и он решает все случаи,
+которые решает эталон. Новый режим подключается декоратором register_engine.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.batch import BatchOutcome, calculate_batch
+from app.benchmarks import CASES, clear_property_caches
+from app.schemas import CalculationParams, CalculationResult, ValveInfo
+from app.utils import CalculationError, ValveCalculator
+
+logger = logging.getLogger(__name__)
+
+MAX_PARTS = 5
+MAX_SUCTIONS = 3
+
+# Выходы в порядке хранения (ширина — по пятиучастковому штоку; лишние — NaN)
+OUTPUTS = ([f"G{i}" for i in range(1, MAX_PARTS + 1)] + ["deaerator_g", "deaerator_t", "deaerator_h"]
+           + [f"ejector{i}_{x}" for i in range(1, MAX_SUCTIONS + 1) for x in ("g", "t", "h")])
+
+# Погрешность считается относительно max(|эталон|, ABS_FLOOR): нулевые выходы не делят на ноль
+ABS_FLOOR = 1e-9
+
+DEFAULT_MAX_REL_ERROR = 1e-3
+
+PERCENTILES = (50, 95, 99)
+
+# Давление в камере не ниже max(выход, отсосы) с этим запасом: иначе режим без решения
+CHAMBER_MARGIN = 1.05
+
+Case = Tuple[CalculationParams, ValveInfo]
+Engine = Callable[[Sequence[Case]], List[BatchOutcome]]
+
+ENGINES: Dict[str, Engine] = {}
+
+
+def register_engine(name: str) -> Callable[[Engine], Engine]:
+    """Регистрирует движок: функция от списка случаев, возвращающая результат или ошибку для каждого."""
+    def decorator(engine: Engine) -> Engine:
+        ENGINES[name] = engine
+        return engine
+    return decorator
+
+
+@register_engine("scalar")
+def _scalar_engine(cases: Sequence[Case]) -> List[BatchOutcome]:
+    outcomes: List[BatchOutcome] = []
+    for params, valve in cases:
+        try:
+            outcomes.append(ValveCalculator(params, valve).perform_calculations())
+        except CalculationError as e:
+            outcomes.append(e)
+    return outcomes
+
+
+@register_engine("batch")
+def _batch_engine(cases: Sequence[Case]) -> List[BatchOutcome]:
+    return calculate_batch(cases)
+
+
+@register_engine("batch_coarse")
+def _batch_coarse_engine(cases: Sequence[Case]) -> List[BatchOutcome]:
+    # Грубая бисекция по скорости: меньше итераций на участок
+    return calculate_batch(cases, tolerance=1e-2)
+
+
+def flatten(result: CalculationResult) -> np.ndarray:
+    """Результат -> строка OUTPUTS."""
+    row = np.full(len(OUTPUTS), np.nan)
+    row[:len(result.Gi)] = result.Gi
+    row[MAX_PARTS:MAX_PARTS + 3] = result.deaerator_props[:3]
+    for i, props in enumerate(result.ejector_props):
+        start = MAX_PARTS + 3 + 3 * i
+        row[start:start + 3] = (props["g"], props["t"], props["h"])
+    return row
+
+
+# ------------------------------ Корпус ------------------------------ #
+class GoldenCorpus:
+    """Входы (колонками, NaN — нет участка/отсоса) и эталонные выходы OUTPUTS."""
+
+    def __init__(self, parts: np.ndarray, count_valves: np.ndarray, mode: np.ndarray, geometry: np.ndarray,
+                 lengths: np.ndarray, p_values: np.ndarray, p_ejector: np.ndarray,
+                 reference: np.ndarray, ok: np.ndarray, meta: Dict):
+        self.parts = parts                # (n,) число участков
+        self.count_valves = count_valves  # (n,)
+        self.mode = mode                  # (n, 2): temperature_start, t_air
+        self.geometry = geometry          # (n, 3): clearance, diameter, round_radius, мм
+        self.lengths = lengths            # (n, MAX_PARTS), мм
+        self.p_values = p_values          # (n, MAX_PARTS), кгс/см²
+        self.p_ejector = p_ejector        # (n, MAX_SUCTIONS), кгс/см²
+        self.reference = reference        # (n, len(OUTPUTS))
+        self.ok = ok                      # (n,) эталон решается
+        self.meta = meta
+
+    def __len__(self) -> int:
+        return len(self.parts)
+
+    def cases(self) -> List[Case]:
+        cases = []
+        for i in range(len(self)):
+            n = int(self.parts[i])
+            lengths = self.lengths[i, :n].tolist()
+            params = CalculationParams(
+                temperature_start=float(self.mode[i, 0]), t_air=float(self.mode[i, 1]),
+                count_valves=int(self.count_valves[i]), p_values=self.p_values[i, :n].tolist(),
+                p_ejector=[float(p) for p in self.p_ejector[i] if not np.isnan(p)],
+            )
+            clearance, diameter, round_radius = self.geometry[i].tolist()
+            valve = ValveInfo(name=f"golden-{i}", count_parts=n, clearance=clearance, diameter=diameter,
+                              round_radius=round_radius,
+                              **{f"len_part{k + 1}": length for k, length in enumerate(lengths)})
+            cases.append((params, valve))
+        return cases
+
+    def save(self, path: str) -> None:
+        np.savez_compressed(
+            path, parts=self.parts, count_valves=self.count_valves, mode=self.mode, geometry=self.geometry,
+            lengths=self.lengths, p_values=self.p_values, p_ejector=self.p_ejector,
+            reference=self.reference, ok=self.ok, outputs=np.array(OUTPUTS),
+            meta=np.array(json.dumps(self.meta, ensure_ascii=False)),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "GoldenCorpus":
+        with np.load(path, allow_pickle=False) as data:
+            if [str(name) for name in data["outputs"]] != OUTPUTS:
+                raise CalculationError("Состав выходов корпуса не совпадает с текущим")
+            return cls(data["parts"], data["count_valves"], data["mode"], data["geometry"], data["lengths"],
+                       data["p_values"], data["p_ejector"], data["reference"], data["ok"],
+                       json.loads(str(data["meta"])))
+
+
+def _sample_case(rng: np.random.Generator) -> Tuple[int, int, List[float], List[float], List[float],
+                                                     List[float], List[float]]:
+    """Случайный режим и геометрия вокруг представительного штока со случайным числом участков."""
+    n = int(rng.integers(2, MAX_PARTS + 1))
+    params, valve = CASES[n]
+    geometry = [valve.clearance * rng.uniform(0.7, 1.3), valve.diameter * rng.uniform(0.8, 1.2),
+                valve.round_radius * rng.uniform(0.5, 1.5)]
+    lengths = [length * rng.uniform(0.7, 1.3) for length in valve.section_lengths[:n]]
+    p_inlet = rng.uniform(20.0, 140.0)
+    p_outlet = params.p_values[-1] * rng.uniform(0.97, 1.03)
+    p_ejector = [p * rng.uniform(0.85, 1.0) for p in params.p_ejector]
+    # Камеры: давления базового штока с разбросом, по убыванию, ниже входного
+    # и выше выхода и отсосов
+    floor = CHAMBER_MARGIN * max(p_outlet, *p_ejector)
+    chambers = sorted((p * rng.uniform(0.6, 1.4) for p in params.p_values[1:-1]), reverse=True)
+    chambers = [min(max(p, floor), 0.9 * p_inlet) for p in chambers]
+    p_values = [p_inlet, *chambers, p_outlet]
+    mode = [rng.uniform(380.0, 570.0), rng.uniform(0.0, 60.0)]
+    return n, params.count_valves, mode, geometry, lengths, p_values, p_ejector
+
+
+def generate_corpus(size: int, seed: int = 0) -> GoldenCorpus:
+    """Корпус из size случаев, посчитанных точным скалярным ValveCalculator."""
+    rng = np.random.default_rng(seed)
+    parts = np.zeros(size, dtype=np.int8)
+    count_valves = np.zeros(size, dtype=np.int16)
+    mode = np.zeros((size, 2))
+    geometry = np.zeros((size, 3))
+    lengths = np.full((size, MAX_PARTS), np.nan)
+    p_values = np.full((size, MAX_PARTS), np.nan)
+    p_ejector = np.full((size, MAX_SUCTIONS), np.nan)
+    for i in range(size):
+        n, valves, mode[i], geometry[i], case_lengths, case_p, case_ejector = _sample_case(rng)
+        parts[i], count_valves[i] = n, valves
+        lengths[i, :n] = case_lengths
+        p_values[i, :n] = case_p
+        p_ejector[i, :len(case_ejector)] = case_ejector
+
+    corpus = GoldenCorpus(parts, count_valves, mode, geometry, lengths, p_values, p_ejector,
+                          np.full((size, len(OUTPUTS)), np.nan), np.zeros(size, dtype=bool),
+                          {"seed": seed, "size": size, "created": datetime.now(timezone.utc).isoformat()})
+    for i, outcome in enumerate(_scalar_engine(corpus.cases())):
+        if not isinstance(outcome, CalculationError):
+            corpus.reference[i] = flatten(outcome)
+            corpus.ok[i] = True
+    logger.info(f"Корпус: {size} случаев, без решения {int((~corpus.ok).sum())}")
+    return corpus
+
+
+# ------------------------------ Воспроизведение ------------------------------ #
+def replay(corpus: GoldenCorpus, engine: str, max_rel_error: float = DEFAULT_MAX_REL_ERROR) -> Dict:
+    """
+    Прогон корпуса через движок.
+
+    Returns:
+        Отчёт: пропускная способность, расхождения по решаемости, погрешности по выходам
+        (max и перцентили PERCENTILES) и вердикт accepted.
+    """
+    if engine not in ENGINES:
+        raise CalculationError(f"Неизвестный движок: {engine}. Доступны: {', '.join(sorted(ENGINES))}")
+    cases = corpus.cases()
+    # Движки сравниваются без кэша свойств, прогретого предыдущим движком
+    clear_property_caches()
+    started = time.perf_counter()
+    outcomes = ENGINES[engine](cases)
+    elapsed = time.perf_counter() - started
+
+    values = np.full_like(corpus.reference, np.nan)
+    solved = np.zeros(len(corpus), dtype=bool)
+    for i, outcome in enumerate(outcomes):
+        if not isinstance(outcome, CalculationError):
+            values[i] = flatten(outcome)
+            solved[i] = True
+    both = corpus.ok & solved
+    with np.errstate(invalid="ignore"):
+        errors = np.abs(values[both] - corpus.reference[both]) / np.maximum(np.abs(corpus.reference[both]),
+                                                                           ABS_FLOOR)
+
+    outputs = {}
+    for j, name in enumerate(OUTPUTS):
+        column = errors[:, j][~np.isnan(errors[:, j])]
+        if len(column) == 0:
+            continue
+        outputs[name] = {"max": float(column.max()), "cases": int(len(column)),
+                         **{f"p{q}": float(np.percentile(column, q)) for q in PERCENTILES}}
+
+    missed = int((corpus.ok & ~solved).sum())
+    worst = max((stats["max"] for stats in outputs.values()), default=0.0)
+    report = {
+        "engine": engine,
+        "cases": len(corpus),
+        "seconds": elapsed,
+        "cases_per_second": len(corpus) / elapsed if elapsed > 0 else float("inf"),
+        "missed": missed,                                  # эталон решён, движок — нет
+        "extra": int((~corpus.ok & solved).sum()),         # движок решил то, что эталон не решает
+        "max_rel_error": worst,
+        "accepted": missed == 0 and worst <= max_rel_error,
+        "outputs": outputs,
+    }
+    logger.info(f"{engine}: {report['cases_per_second']:.0f} случаев/с, макс. погрешность {worst:.2e}, "
+                f"пропущено {missed} -> {'принят' if report['accepted'] else 'отклонён'}")
+    return report
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Эталонный корпус: точность и скорость движков расчёта")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate = commands.add_parser("generate", help="Посчитать корпус точным ValveCalculator")
+    generate.add_argument("-o", "--output", required=True, help="Файл корпуса .npz")
+    generate.add_argument("--size", type=int, default=5000)
+    generate.add_argument("--seed", type=int, default=0)
+
+    run = commands.add_parser("replay", help="Прогнать корпус через движки")
+    run.add_argument("corpus", help="Файл корпуса .npz")
+    run.add_argument("--engine", action="append", choices=sorted(ENGINES), help="Движок (по умолчанию — все)")
+    run.add_argument("--max-rel-error", type=float, default=DEFAULT_MAX_REL_ERROR)
+    run.add_argument("-o", "--output", help="JSON с отчётом")
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        generate_corpus(args.size, args.seed).save(args.output)
+        return 0
+
+    corpus = GoldenCorpus.load(args.corpus)
+    reports = [replay(corpus, engine, args.max_rel_error) for engine in (args.engine or sorted(ENGINES))]
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(reports, f, ensure_ascii=False, indent=1)
+    return 0 if all(r["accepted"] for r in reports) else 1
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger("app.calc_core").setLevel(logging.WARNING)
+    sys.exit(main())
@@ -0,0 +1,225 @@
+"""
+Расчёт протечек по архиву измерений (историану): давления и температуры по времени.
+
+Пример:
+    python -m app.historian log.csv -o leakage.npz --params params.json
+
+Вход — CSV с колонкой timestamp и колонками измеряемых входов в обозначениях
+развёртки и Монте-Карло: temperature_start, t_air, p_values.<i>, p_ejector.<i>.
+Не измеряемые входы берутся из базового режима (--params, JSON CalculationParams).
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.batch import calculate_batch
+from app.calc_core import metric_names, metric_values
+from app.monte_carlo import nominal_value
+from app.schemas import CalculationParams, ValveInfo
+from app.sensitivity import perturbed
+from app.utils import CalculationError
+
+logger = logging.getLogger(__name__)
+
+# Сколько отсчётов передавать в пакетный движок за раз
+CHUNK_SIZE = 4096
+
+# Отсчёт не пересчитывается, если все входы отличаются от последнего рассчитанного
+# не больше чем на эту долю (или на абсолютный допуск колонки, если он больше)
+DEFAULT_REL_TOLERANCE = 1e-4
+
+# Происхождение значения в выходном ряду
+COMPUTED, REUSED, FAILED = 0, 1, -1
+
+
+class HistorianSeries:
+    """Результат по времени: колонки показателей metric_names и происхождение значений."""
+
+    def __init__(self, timestamps: np.ndarray, names: List[str], values: np.ndarray, source: np.ndarray):
+        self.timestamps = timestamps
+        self.names = names
+        self.values = values  # (n, len(names)); для FAILED — NaN
+        self.source = source  # COMPUTED / REUSED / FAILED
+
+    @property
+    def computed(self) -> int:
+        return int((self.source == COMPUTED).sum())
+
+    def column(self, name: str) -> np.ndarray:
+        return self.values[:, self.names.index(name)]
+
+
+def _compute(params: CalculationParams, valve: ValveInfo, keys: List[str], inputs: np.ndarray,
+             indices: List[int], values: np.ndarray, source: np.ndarray) -> None:
+    """Пакетный расчёт отсчётов indices с записью в values/source."""
+    cases = []
+    for i in indices:
+        case_params, case_valve = params, valve
+        for key, value in zip(keys, inputs[i]):
+            case_params, case_valve = perturbed(case_params, case_valve, key, float(value))
+        cases.append((case_params, case_valve))
+    for i, outcome in zip(indices, calculate_batch(cases)):
+        if not isinstance(outcome, CalculationError):
+            values[i] = metric_values(outcome)
+            source[i] = COMPUTED
+
+
+def historian_series(params: CalculationParams, valve: ValveInfo, timestamps: Sequence,
+                     columns: Dict[str, np.ndarray], rel_tolerance: float = DEFAULT_REL_TOLERANCE,
+                     abs_tolerance: Optional[Dict[str, float]] = None,
+                     chunk_size: int = CHUNK_SIZE) -> HistorianSeries:
+    """
+    Протечки для каждого отсчёта ряда.
+
+    Отсчёты, у которых все входы в пределах допуска от последнего рассчитанного
+    («опорного») отсчёта, получают его результат без расчёта. Остальные считаются
+    пакетным движком порциями по chunk_size. Отсчёты с пропусками (NaN) и
+    отсчёты вне области решения помечаются FAILED и опорными не становятся.
+    """
+    keys = sorted(columns)
+    for key in keys:
+        nominal_value(params, valve, key)
+    n = len(timestamps)
+    inputs = np.column_stack([np.asarray(columns[key], dtype=float) for key in keys]) if keys \
+        else np.zeros((n, 0))
+    if len(inputs) != n:
+        raise CalculationError("Длины колонок ряда не совпадают с числом отсчётов")
+    abs_tol = np.array([(abs_tolerance or {}).get(key, 0.0) for key in keys])
+
+    count_parts = valve.count_parts or len([x for x in valve.section_lengths if x is not None])
+    names = metric_names(count_parts)
+    values = np.full((n, len(names)), np.nan)
+    source = np.full(n, FAILED, dtype=np.int8)
+    anchor: Optional[int] = None
+
+    for start in range(0, n, chunk_size):
+        stop = min(start + chunk_size, n)
+        computed: List[int] = []
+        reused: List[Tuple[int, int]] = []
+        for i in range(start, stop):
+            row = inputs[i]
+            if np.isnan(row).any():
+                continue
+            if anchor is not None:
+                reference = inputs[anchor]
+                if (np.abs(row - reference) <= np.maximum(abs_tol, rel_tolerance * np.abs(reference))).all():
+                    reused.append((i, anchor))
+                    continue
+            computed.append(i)
+            anchor = i
+
+        _compute(params, valve, keys, inputs, computed, values, source)
+        # Опорный отсчёт оказался вне области решения — его повторы считаем сами
+        retry = [i for i, reference in reused if source[reference] != COMPUTED]
+        _compute(params, valve, keys, inputs, retry, values, source)
+        for i, reference in reused:
+            if source[reference] == COMPUTED:
+                values[i] = values[reference]
+                source[i] = REUSED
+        ok = [i for i in computed + retry if source[i] == COMPUTED]
+        if ok:
+            anchor = max(ok)
+        elif anchor is not None and source[anchor] != COMPUTED:
+            anchor = None
+
+    series = HistorianSeries(np.asarray(timestamps), names, values, source)
+    logger.info(f"Историан: {n} отсчётов, рассчитано {series.computed}, "
+                f"повторов {int((source == REUSED).sum())}, без решения {int((source == FAILED).sum())}")
+    return series
+
+
+# ------------------------------ Файлы ------------------------------ #
+def read_series(path: str) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """CSV с колонкой timestamp -> (метки времени, колонки входов); пустые ячейки — NaN."""
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        if "timestamp" not in header:
+            raise CalculationError("В файле нет колонки timestamp")
+        t_index = header.index("timestamp")
+        keys = [(j, name) for j, name in enumerate(header) if j != t_index]
+        timestamps: List[str] = []
+        rows: List[List[float]] = []
+        for record in reader:
+            if not record:
+                continue
+            timestamps.append(record[t_index])
+            rows.append([float(record[j]) if j < len(record) and record[j].strip() else np.nan for j, _ in keys])
+    data = np.array(rows, dtype=float).reshape(len(rows), len(keys))
+    return np.array(timestamps), {name: data[:, k] for k, (_, name) in enumerate(keys)}
+
+
+def write_series(path: str, series: HistorianSeries) -> None:
+    """
+    Колоночный вывод: .npz (сжатый, float32) или .csv.
+    """
+    if path.endswith(".csv"):
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["timestamp", *series.names, "source"])
+            for t, row, src in zip(series.timestamps, series.values, series.source):
+                writer.writerow([t, *("" if np.isnan(v) else f"{v:.6g}" for v in row), int(src)])
+        return
+    np.savez_compressed(
+        path,
+        timestamp=series.timestamps.astype(str),
+        source=series.source,
+        **{name: series.values[:, j].astype(np.float32) for j, name in enumerate(series.names)},
+    )
+
+
+# ------------------------------ CLI ------------------------------ #
+def _load_valve(params: CalculationParams, valve_path: Optional[str]) -> ValveInfo:
+    if valve_path:
+        with open(valve_path, encoding="utf-8") as f:
+            return ValveInfo.model_validate(json.load(f))
+    from app import crud
+    from app.database import SessionLocal
+
+    with SessionLocal() as db:
+        valve = crud.get_valve_for_params(db, params)
+        if valve is None:
+            raise CalculationError(f"Клапан '{params.valve_id or params.valve_drawing}' не найден")
+        return ValveInfo.model_validate(valve)
+
+
+def _parse_tolerances(items: Sequence[str]) -> Dict[str, float]:
+    tolerances = {}
+    for item in items:
+        key, _, value = item.partition("=")
+        tolerances[key] = float(value)
+    return tolerances
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Протечки по архиву измерений давления и температуры")
+    parser.add_argument("input", help="CSV с колонкой timestamp и колонками входов")
+    parser.add_argument("-o", "--output", required=True, help="Результат: .npz или .csv")
+    parser.add_argument("--params", required=True, help="JSON базового режима (CalculationParams)")
+    parser.add_argument("--valve", help="JSON геометрии штока (ValveInfo); по умолчанию — из БД")
+    parser.add_argument("--rel-tolerance", type=float, default=DEFAULT_REL_TOLERANCE,
+                        help="Относительный допуск повторного отсчёта")
+    parser.add_argument("--tolerance", action="append", default=[], metavar="KEY=VALUE",
+                        help="Абсолютный допуск колонки, например p_values.0=0.05")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    with open(args.params, encoding="utf-8") as f:
+        params = CalculationParams.model_validate(json.load(f))
+    valve = _load_valve(params, args.valve)
+    timestamps, columns = read_series(args.input)
+    series = historian_series(params, valve, timestamps, columns, rel_tolerance=args.rel_tolerance,
+                              abs_tolerance=_parse_tolerances(args.tolerance), chunk_size=args.chunk_size)
+    write_series(args.output, series)
+    logger.info(f"Результат записан в {args.output}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.schemas import CalculationParams, CalculationResult, ValveInfo
+from app.utils import ValveCalculator
+
+logger = logging.getLogger(__name__)
+
+# Ключ решения участка: (индекс участка, p1, p2, v, μ, L, δ, S, ξ, последний)
+PartKey = Tuple
+
+
+class CalculationSession:
+    """
+    Промежуточные величины расчёта одного штока для повторных расчётов.
+
+    Граф зависимостей: свойства пара и воздуха (h, v, T, μ) зависят только от
+    давления/энтальпии участка или t_air и кэшируются в app.calc_core; расход G участка
+    зависит только от аргументов решения (давления по краям, v, μ, геометрия) и
+    хранится здесь по этим аргументам. При изменении t_air меняются аргументы только
+    воздушных участков, при изменении давления отсоса — только участков этого отсоса;
+    остальные G берутся из сессии без бисекции.
+    """
+
+    def __init__(self):
+        self._solutions: Dict[PartKey, float] = {}
+        self._lock = threading.Lock()
+
+    def copy(self) -> "CalculationSession":
+        """Новая сессия с теми же решениями: пересчёт производного результата не меняет исходную."""
+        session = CalculationSession()
+        with self._lock:
+            session._solutions = dict(self._solutions)
+        return session
+
+    def calculate(self, params: CalculationParams, valve: ValveInfo,
+                  diagnostics: bool = False) -> Tuple[CalculationResult, List[int]]:
+        """
+        Args:
+            diagnostics: Добавить в результат диагностику решателя (по пересчитанным участкам).
+
+        Returns:
+            (результат, номера пересчитанных участков с 1).
+        """
+        with self._lock:
+            calc = _SessionValveCalculator(params, valve, self._solutions)
+            calc.include_metadata = diagnostics
+            result = calc.perform_calculations()
+            # В сессии остаются только решения последнего расчёта
+            self._solutions = calc.used
+            return result, sorted(calc.recomputed)
+
+
+class _SessionValveCalculator(ValveCalculator):
+    """ValveCalculator, который берёт G участка из сессии, если аргументы решения не изменились."""
+
+    def __init__(self, params: CalculationParams, valve_info: ValveInfo, solutions: Dict[PartKey, float]):
+        super().__init__(params, valve_info)
+        self.solutions = solutions
+        self.used: Dict[PartKey, float] = {}
+        self.recomputed: set = set()
+
+    def _solve_part(self, part_index, p_first_mpa, p_second_mpa, v, dyn_viscosity,
+                    len_part_m, delta_clearance_m, area_S, ksi, last_part=False) -> float:
+        # ξ из interp1d — 0-мерный массив, приводим всё к float
+        key = (part_index, *map(float, (p_first_mpa, p_second_mpa, v, dyn_viscosity,
+                                        len_part_m, delta_clearance_m, area_S, ksi)), last_part)
+        g = self.solutions.get(key)
+        if g is None:
+            g = super()._solve_part(part_index, p_first_mpa, p_second_mpa, v, dyn_viscosity,
+                                    len_part_m, delta_clearance_m, area_S, ksi, last_part)
+            self.recomputed.add(part_index + 1)
+        self.used[key] = g
+        return g
+
+
+class SessionStore:
+    """Сессии по ID сохранённых результатов (LRU, в памяти процесса)."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._sessions: "OrderedDict[int, CalculationSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, result_id: int) -> Optional[CalculationSession]:
+        with self._lock:
+            session = self._sessions.get(result_id)
+            if session is not None:
+                self._sessions.move_to_end(result_id)
+            return session
+
+    def put(self, result_id: int, session: CalculationSession) -> None:
+        with self._lock:
+            self._sessions[result_id] = session
+            self._sessions.move_to_end(result_id)
+            while len(self._sessions) > self.max_entries:
+                self._sessions.popitem(last=False)
+
+    def discard(self, result_id: int) -> None:
+        with self._lock:
+            self._sessions.pop(result_id, None)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+
+calculation_sessions = SessionStore(settings.CALCULATION_SESSIONS)
@@ -0,0 +1,425 @@
+from __future__ import annotations
+
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from sqlalchemy import create_engine, func, select, text, update
+from sqlalchemy.orm import Session, aliased, sessionmaker
+
+from app.core.config import settings
+from app.models import JobDB
+from app.schemas import JobInfo, JobList, JobResultPage
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ("queued", "running")
+
+# Как часто обработчик может писать прогресс в БД, с
+PROGRESS_FLUSH_INTERVAL = 0.5
+
+
+class JobCancelled(Exception):
+    """Задача отменена пользователем."""
+
+
+class JobReporter:
+    """
+    Передаётся обработчику задачи: прогресс, проверка отмены и сессия БД приложения.
+    Прогресс пишется в таблицу задач не чаще PROGRESS_FLUSH_INTERVAL; при записи
+    заодно читается флаг отмены.
+    """
+
+    def __init__(self, executor: "JobExecutor", job_id: str):
+        self._executor = executor
+        self.job_id = job_id
+        self.progress = 0.0
+        self.message: Optional[str] = None
+        self._cancelled = False
+        self._last_flush = 0.0
+
+    def update(self, progress: float, message: Optional[str] = None) -> None:
+        self.progress = min(max(float(progress), 0.0), 1.0)
+        if message is not None:
+            self.message = message
+        self._flush()
+
+    def _flush(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._last_flush < PROGRESS_FLUSH_INTERVAL:
+            return
+        self._last_flush = now
+        self._cancelled = self._executor._report(self.job_id, self.progress, self.message)
+
+    @property
+    def cancelled(self) -> bool:
+        self._flush()
+        return self._cancelled
+
+    def check_cancelled(self) -> None:
+        if self.cancelled:
+            raise JobCancelled()
+
+    @contextmanager
+    def session(self) -> Iterator[Session]:
+        """Сессия основной БД (штоки, результаты расчётов)."""
+        db = self._executor.data_session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+
+# Обработчик: (payload, reporter) -> JSON-совместимый результат
+JobHandler = Callable[[Dict[str, Any], JobReporter], Dict[str, Any]]
+
+
+def _default_session_factory() -> sessionmaker:
+    from app.database import SessionLocal, engine_options
+
+    if settings.JOBS_DATABASE_URL:
+        engine = create_engine(settings.JOBS_DATABASE_URL, **engine_options(settings.JOBS_DATABASE_URL))
+        return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    return SessionLocal
+
+
+def _kind_lock_key(kind: str) -> int:
+    """Ключ advisory-блокировки захвата задач вида kind."""
+    return zlib.crc32(f"jobs:{kind}".encode())
+
+
+class JobExecutor:
+    """
+    Фоновые задачи в таблице autocalc.jobs и пул потоков рядом с приложением.
+
+    Каждый процесс uvicorn запускает свой диспетчер: он забирает задачи из очереди
+    (по приоритету, затем по времени постановки) условным UPDATE, поэтому одну
+    задачу берёт ровно один процесс. Ограничения: JOB_WORKERS задач в процессе
+    и JOB_KIND_LIMITS задач каждого вида на все процессы (проверяется в том же
+    UPDATE, на PostgreSQL — под advisory-блокировкой вида задачи). Выполняющиеся задачи
+    обновляют heartbeat; задачи с устаревшим heartbeat (процесс упал или был
+    перезапущен) возвращаются в очередь и выполняются заново.
+    """
+
+    def __init__(self, session_factory: Optional[Callable[[], Session]] = None,
+                 data_session_factory: Optional[Callable[[], Session]] = None,
+                 workers: Optional[int] = None):
+        self._session_factory = session_factory
+        self._data_session_factory = data_session_factory
+        self.workers = workers or settings.JOB_WORKERS
+        self.kind_limits: Dict[str, int] = dict(settings.JOB_KIND_LIMITS)
+        self.poll_interval = settings.JOB_POLL_INTERVAL
+        self.stale_after = settings.JOB_STALE_SECONDS
+        self.max_attempts = settings.JOB_MAX_ATTEMPTS
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+        self._handlers: Dict[str, JobHandler] = {}
+        self._paginate: Dict[str, str] = {}
+        self._running: Set[str] = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._table_ready = False
+        self._thread: Optional[threading.Thread] = None
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    # ------------------------------ Настройка ------------------------------ #
+    @property
+    def session_factory(self) -> Callable[[], Session]:
+        if self._session_factory is None:
+            self._session_factory = _default_session_factory()
+        return self._session_factory
+
+    @property
+    def data_session_factory(self) -> Callable[[], Session]:
+        if self._data_session_factory is None:
+            from app.database import SessionLocal
+            self._data_session_factory = SessionLocal
+        return self._data_session_factory
+
+    def configure(self, session_factory: Callable[[], Session],
+                  data_session_factory: Optional[Callable[[], Session]] = None) -> None:
+        self._session_factory = session_factory
+        self._data_session_factory = data_session_factory or session_factory
+
+    def register(self, kind: str, handler: JobHandler, paginate: Optional[str] = None) -> None:
+        """
+        Регистрирует обработчик вида задачи.
+
+        Args:
+            paginate: Поле-список результата, которое отдаётся постранично.
+        """
+        self._handlers[kind] = handler
+        if paginate:
+            self._paginate[kind] = paginate
+
+    @property
+    def kinds(self) -> List[str]:
+        return sorted(self._handlers)
+
+    @property
+    def running(self) -> int:
+        """Число задач, выполняющихся в этом процессе."""
+        with self._lock:
+            return len(self._running)
+
+    @contextmanager
+    def _session(self) -> Iterator[Session]:
+        db = self.session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    # ------------------------------ Жизненный цикл ------------------------------ #
+    def _ensure_table(self) -> bool:
+        """
+        Создаёт таблицу задач, если её нет. БД недоступна — False: приложение
+        запускается, диспетчер повторяет попытку на следующем опросе.
+        """
+        if self._table_ready:
+            return True
+        try:
+            with self._session() as db:
+                JobDB.__table__.create(bind=db.get_bind(), checkfirst=True)
+        except Exception as e:
+            logger.warning(f"Таблица задач недоступна, повторим позже: {e}")
+            return False
+        self._table_ready = True
+        return True
+
+    def start(self) -> None:
+        """Запускает диспетчер; таблица задач создаётся при первом доступе к БД."""
+        if self._thread is not None:
+            return
+        self._ensure_table()
+        self._stop.clear()
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+        self._thread = threading.Thread(target=self._dispatch_loop, name="job-dispatcher", daemon=True)
+        self._thread.start()
+        logger.info(f"Диспетчер задач запущен ({self.worker_id}, потоков: {self.workers})")
+
+    def stop(self, wait: bool = True) -> None:
+        """Останавливает диспетчер; выполняющиеся задачи дорабатывают (при wait=True)."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+        self._pool.shutdown(wait=wait)
+        self._thread = None
+        self._pool = None
+
+    # ------------------------------ API задач ------------------------------ #
+    def submit(self, kind: str, payload: Dict[str, Any], priority: int = 0) -> JobInfo:
+        if kind not in self._handlers:
+            raise KeyError(kind)
+        self._ensure_table()
+        with self._session() as db:
+            job = JobDB(id=uuid.uuid4().hex, kind=kind, status="queued", priority=priority,
+                        progress=0.0, payload=payload, attempts=0, cancel_requested=False,
+                        created_at=datetime.now(timezone.utc))
+            db.add(job)
+            db.commit()
+            db.refresh(job)
+            info = JobInfo.model_validate(job)
+        self._wake.set()
+        return info
+
+    def get(self, job_id: str) -> Optional[JobInfo]:
+        with self._session() as db:
+            job = db.get(JobDB, job_id)
+            return JobInfo.model_validate(job) if job is not None else None
+
+    def list(self, status: Optional[str] = None, kind: Optional[str] = None,
+             offset: int = 0, limit: int = 50) -> JobList:
+        with self._session() as db:
+            query = db.query(JobDB)
+            if status:
+                query = query.filter(JobDB.status == status)
+            if kind:
+                query = query.filter(JobDB.kind == kind)
+            total = query.count()
+            jobs = query.order_by(JobDB.created_at.desc()).offset(offset).limit(limit).all()
+            return JobList(total=total, items=[JobInfo.model_validate(job) for job in jobs])
+
+    def cancel(self, job_id: str) -> Optional[JobInfo]:
+        """Задача в очереди отменяется сразу, выполняющаяся — при следующей проверке обработчиком."""
+        with self._session() as db:
+            job = db.get(JobDB, job_id)
+            if job is None:
+                return None
+            if job.status == "queued":
+                job.status = "cancelled"
+                job.finished_at = datetime.now(timezone.utc)
+            elif job.status == "running":
+                job.cancel_requested = True
+            db.commit()
+            db.refresh(job)
+            return JobInfo.model_validate(job)
+
+    def result(self, job_id: str, offset: int = 0, limit: Optional[int] = None) -> Optional[Tuple[JobInfo, JobResultPage]]:
+        with self._session() as db:
+            job = db.get(JobDB, job_id)
+            if job is None:
+                return None
+            info = JobInfo.model_validate(job)
+            result = dict(job.result or {})
+        field = self._paginate.get(info.kind)
+        total = None
+        if field and isinstance(result.get(field), list):
+            items = result[field]
+            total = len(items)
+            result[field] = items[offset: offset + limit if limit is not None else None]
+        return info, JobResultPage(job_id=job_id, total=total, offset=offset, limit=limit, result=result)
+
+    # ------------------------------ Диспетчер ------------------------------ #
+    def _dispatch_loop(self) -> None:
+        last_maintenance = 0.0
+        while not self._stop.is_set():
+            try:
+                if not self._ensure_table():
+                    self._wake.wait(self.poll_interval)
+                    continue
+                now = time.monotonic()
+                if now - last_maintenance >= min(self.poll_interval * 5, self.stale_after / 4):
+                    self._heartbeat()
+                    self._requeue_stale()
+                    last_maintenance = now
+                while self._free_slots() > 0:
+                    claimed = self._claim()
+                    if claimed is None:
+                        break
+                    with self._lock:
+                        self._running.add(claimed[0])
+                    self._pool.submit(self._run, *claimed)
+            except Exception as e:
+                logger.error(f"Ошибка диспетчера задач: {e}")
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def _free_slots(self) -> int:
+        with self._lock:
+            return self.workers - len(self._running)
+
+    def _claim(self) -> Optional[Tuple[str, str, Dict[str, Any]]]:
+        """Забирает следующую задачу из очереди с учётом приоритетов и ограничений по видам."""
+        with self._session() as db:
+            running = dict(
+                db.query(JobDB.kind, func.count(JobDB.id)).filter(JobDB.status == "running")
+                .group_by(JobDB.kind).all()
+            )
+            blocked = [kind for kind, limit in self.kind_limits.items() if running.get(kind, 0) >= limit]
+            query = db.query(JobDB.id, JobDB.kind).filter(JobDB.status == "queued", JobDB.kind.in_(self.kinds))
+            if blocked:
+                query = query.filter(JobDB.kind.notin_(blocked))
+            candidates = query.order_by(JobDB.priority.desc(), JobDB.created_at).limit(10).all()
+
+            postgres = db.get_bind().dialect.name == "postgresql"
+            now = datetime.now(timezone.utc)
+            for job_id, kind in candidates:
+                claim = update(JobDB).where(JobDB.id == job_id, JobDB.status == "queued")
+                limit = self.kind_limits.get(kind)
+                if limit is not None:
+                    # Подсчёт выполняющихся и захват — одним UPDATE; на PostgreSQL захваты
+                    # одного вида сериализует блокировка до конца транзакции (SQLite
+                    # и так пишет по одной транзакции)
+                    if postgres:
+                        db.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": _kind_lock_key(kind)})
+                    other = aliased(JobDB)
+                    running_count = (
+                        select(func.count()).select_from(other)
+                        .where(other.kind == kind, other.status == "running").scalar_subquery()
+                    )
+                    claim = claim.where(running_count < limit)
+                claimed = db.execute(
+                    claim.values(status="running", worker=self.worker_id, started_at=now, heartbeat_at=now,
+                                 attempts=JobDB.attempts + 1)
+                ).rowcount
+                db.commit()
+                if claimed == 1:
+                    job = db.get(JobDB, job_id)
+                    return job.id, job.kind, job.payload
+        return None
+
+    def _run(self, job_id: str, kind: str, payload: Dict[str, Any]) -> None:
+        reporter = JobReporter(self, job_id)
+        values: Dict[str, Any]
+        try:
+            result = self._handlers[kind](payload, reporter)
+            values = {"status": "done", "progress": 1.0, "result": result}
+        except JobCancelled:
+            values = {"status": "cancelled"}
+        except Exception as e:
+            logger.error(f"Задача {kind} {job_id} завершилась с ошибкой: {e}")
+            values = {"status": "failed", "error": getattr(e, "message", None) or str(e)}
+        finally:
+            with self._lock:
+                self._running.discard(job_id)
+        try:
+            with self._session() as db:
+                db.execute(
+                    update(JobDB).where(JobDB.id == job_id, JobDB.worker == self.worker_id)
+                    .values(finished_at=datetime.now(timezone.utc), message=reporter.message, **values)
+                )
+                db.commit()
+        except Exception as e:
+            logger.error(f"Не удалось сохранить результат задачи {job_id}: {e}")
+        self._wake.set()
+
+    def _report(self, job_id: str, progress: float, message: Optional[str]) -> bool:
+        """Пишет прогресс и heartbeat; возвращает флаг отмены."""
+        try:
+            with self._session() as db:
+                db.execute(
+                    update(JobDB).where(JobDB.id == job_id)
+                    .values(progress=progress, message=message, heartbeat_at=datetime.now(timezone.utc))
+                )
+                db.commit()
+                return bool(db.query(JobDB.cancel_requested).filter(JobDB.id == job_id).scalar())
+        except Exception as e:
+            logger.warning(f"Не удалось обновить прогресс задачи {job_id}: {e}")
+            return False
+
+    def _heartbeat(self) -> None:
+        with self._lock:
+            running = list(self._running)
+        if not running:
+            return
+        with self._session() as db:
+            db.execute(
+                update(JobDB).where(JobDB.id.in_(running), JobDB.worker == self.worker_id)
+                .values(heartbeat_at=datetime.now(timezone.utc))
+            )
+            db.commit()
+
+    def _requeue_stale(self) -> None:
+        """Возвращает в очередь задачи процессов, переставших обновлять heartbeat."""
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.stale_after)
+        with self._session() as db:
+            stale = db.query(JobDB).filter(JobDB.status == "running", JobDB.heartbeat_at < cutoff).all()
+            for job in stale:
+                if job.attempts >= self.max_attempts:
+                    job.status = "failed"
+                    job.error = f"Задача прервана {job.attempts} раз(а)"
+                    job.finished_at = datetime.now(timezone.utc)
+                elif job.cancel_requested:
+                    job.status = "cancelled"
+                    job.finished_at = datetime.now(timezone.utc)
+                else:
+                    logger.info(f"Задача {job.id} ({job.kind}) возвращена в очередь после остановки {job.worker}")
+                    job.status = "queued"
+                    job.progress = 0.0
+                job.worker = None
+            db.commit()
+
+
+job_executor = JobExecutor()
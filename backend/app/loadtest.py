@@ -0,0 +1,479 @@
+"""
+Нагрузочный стенд: воспроизведение смеси запросов против запущенного приложения.
+
+Пример:
+    python -m app.loadtest run -o head.json --workers 4 --concurrency 16 --duration 60
+    python -m app.loadtest run -o head.json --base-url http://localhost:8000
+    python -m app.loadtest compare base.json head.json --threshold 0.2
+    python -m app.loadtest revisions origin/main HEAD -o compare.json --duration 30
+
+run без --base-url поднимает uvicorn из этого дерева на свободном порту; база —
+временный SQLite, заполненный из db/init.dump (--database-url — своя база, её можно
+заполнить командой seed). Смесь: справочник турбин и штоков, /calculate по штокам
+всех геометрий, списки результатов и генерация схем. Отчёт — JSON с пропускной
+способностью и перцентилями задержки (p50/p95/p99, мс) по шаблонам маршрутов.
+
+compare сравнивает p95 маршрутов двух отчётов и завершается с кодом 1, если какой-то
+вырос больше чем на threshold (доля). revisions прогоняет одну и ту же смесь против
+двух ревизий git (каждая — в своём worktree со свежей базой) и сравнивает их.
+Стенд подставляет базу через переменную DATABASE_URL, поэтому обе ревизии должны её
+читать (app.core.config.Settings.DATABASE_URL); более ранние ревизии не поддерживаются.
+
+SQLite с несколькими воркерами сериализует записи /calculate: для замеров, близких к
+боевым, задайте --database-url на PostgreSQL.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import quote
+
+import httpx
+
+from app.benchmarks import CASES
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+API = "/api/v1"
+# Готовность сервера: схема OpenAPI отдаётся во всех ревизиях (health-check появился позже)
+READY_PROBE = f"{API}/openapi.json"
+
+SEED = 20240501
+
+# Допустимый рост p95 маршрута относительно базового прогона (доля)
+DEFAULT_THRESHOLD = 0.25
+
+# Время на запуск сервера (импорт приложения, прогрев воркеров), с
+STARTUP_TIMEOUT = 60.0
+
+PERCENTILES = (50, 95, 99)
+
+# Веса маршрутов в смеси
+MIX: Dict[str, int] = {
+    "GET /turbines/": 15,
+    "GET /turbines/{turbine_name}/valves/": 15,
+    "GET /valves/{valve_id}": 10,
+    "POST /calculate": 35,
+    "GET /valves/{valve_name}/results/": 15,
+    "POST /generate_scheme": 10,
+}
+
+# Шаблоны схем есть не для всех чисел участков
+SCHEME_PARTS = tuple(
+    n for n in CASES if os.path.exists(os.path.join(BACKEND_DIR, "app", "templates", f"template_{n}_parts.xml"))
+)
+
+GEOMETRY_FIELDS = ("name", "type", "diameter", "clearance", "count_parts", "len_part1", "len_part2",
+                   "len_part3", "len_part4", "len_part5", "round_radius")
+
+Request = Tuple[str, str, Optional[dict]]  # метод, путь, тело JSON
+
+
+# ------------------------------ Смесь запросов ------------------------------ #
+async def fetch_catalog(client: httpx.AsyncClient) -> List[Dict]:
+    """
+    Штоки, по которым строится смесь: геометрия и имя турбины. Берутся только штоки с
+    полной геометрией и числом участков, для которого есть типовой режим (benchmarks.CASES).
+    """
+    turbines = (await client.get(f"{API}/turbines/")).raise_for_status().json()
+    valves = {v["id"]: v for v in (await client.get(f"{API}/valves")).raise_for_status().json()}
+    catalog = []
+    for turbine in turbines:
+        for simple in turbine["valves"]:
+            valve = valves.get(simple["id"])
+            if valve is None or valve["count_parts"] not in CASES:
+                continue
+            required = ["diameter", "clearance", "round_radius"] + [
+                f"len_part{i}" for i in range(1, valve["count_parts"] + 1)]
+            if any(valve[field] is None for field in required):
+                continue
+            catalog.append(dict(valve, turbine_name=turbine["name"]))
+    if not catalog:
+        raise RuntimeError("В справочнике нет штоков для нагрузочной смеси")
+    return catalog
+
+
+def _calculation(valve: Dict) -> dict:
+    params, _ = CASES[valve["count_parts"]]
+    return params.model_copy(update={"turbine_name": valve["turbine_name"],
+                                     "valve_drawing": valve["name"]}).model_dump(exclude_none=True)
+
+
+def request_builders(catalog: List[Dict]) -> Dict[str, Callable[[random.Random], Request]]:
+    """Построители запросов по маршрутам смеси: случайный шток справочника -> запрос."""
+    turbines = sorted({v["turbine_name"] for v in catalog})
+    # Схемы — по штокам справочника и типовым штокам, если в справочнике нет подходящих
+    schemes = [v for v in catalog if v["count_parts"] in SCHEME_PARTS] or [
+        CASES[n][1].model_dump(exclude_none=True) for n in SCHEME_PARTS]
+
+    builders = {
+        "GET /turbines/": lambda rng: ("GET", f"{API}/turbines/", None),
+        "GET /turbines/{turbine_name}/valves/":
+            lambda rng: ("GET", f"{API}/turbines/{quote(rng.choice(turbines))}/valves/", None),
+        "GET /valves/{valve_id}": lambda rng: ("GET", f"{API}/valves/{rng.choice(catalog)['id']}", None),
+        "POST /calculate": lambda rng: ("POST", f"{API}/calculate", _calculation(rng.choice(catalog))),
+        "GET /valves/{valve_name}/results/":
+            lambda rng: ("GET", f"{API}/valves/{quote(rng.choice(catalog)['name'])}/results/", None),
+    }
+    if schemes:
+        builders["POST /generate_scheme"] = lambda rng: (
+            "POST", f"{API}/generate_scheme", {k: v for k, v in rng.choice(schemes).items() if k in GEOMETRY_FIELDS})
+    return builders
+
+
+# ------------------------------ Воспроизведение ------------------------------ #
+async def replay(client: httpx.AsyncClient, concurrency: int = 8, requests: Optional[int] = None,
+                 duration: Optional[float] = None, seed: int = SEED,
+                 mix: Optional[Dict[str, int]] = None) -> Dict:
+    """
+    Прогон смеси: concurrency параллельных клиентов, пока не выполнено requests запросов
+    или не истекло duration секунд.
+
+    Returns:
+        Отчёт (см. summarize).
+    """
+    if requests is None and duration is None:
+        raise ValueError("Нужно задать число запросов или длительность")
+    builders = request_builders(await fetch_catalog(client))
+    weights = {label: w for label, w in (mix or MIX).items() if label in builders and w > 0}
+    labels, cum_weights = list(weights), []
+    for w in weights.values():
+        cum_weights.append((cum_weights[-1] if cum_weights else 0) + w)
+
+    rng = random.Random(seed)
+    samples: Dict[str, List[Tuple[float, int]]] = {label: [] for label in labels}
+    issued = 0
+    started = time.perf_counter()
+    deadline = started + duration if duration is not None else None
+
+    async def worker():
+        nonlocal issued
+        while (requests is None or issued < requests) and (deadline is None or time.perf_counter() < deadline):
+            issued += 1
+            label = rng.choices(labels, cum_weights=cum_weights)[0]
+            method, path, body = builders[label](rng)
+            t0 = time.perf_counter()
+            try:
+                status = (await client.request(method, path, json=body)).status_code
+            except httpx.HTTPError as e:
+                logger.warning(f"{method} {path}: {e}")
+                status = 0
+            samples[label].append((time.perf_counter() - t0, status))
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(samples, time.perf_counter() - started, concurrency)
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """Перцентиль с линейной интерполяцией между соседними значениями."""
+    ordered = sorted(values)
+    if not ordered:
+        return float("nan")
+    k = (len(ordered) - 1) * q / 100
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def summarize(samples: Dict[str, List[Tuple[float, int]]], elapsed: float, concurrency: int) -> Dict:
+    """Отчёт прогона: по каждому маршруту — число запросов, ошибки, rps и задержки в мс."""
+    routes = {}
+    for label, points in samples.items():
+        if not points:
+            continue
+        latencies = [t * 1000 for t, _ in points]
+        statuses: Dict[str, int] = {}
+        for _, status in points:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        routes[label] = {
+            "count": len(points),
+            "errors": sum(1 for _, status in points if not 200 <= status < 400),
+            "statuses": statuses,
+            "rps": len(points) / elapsed,
+            **{f"p{q}_ms": percentile(latencies, q) for q in PERCENTILES},
+            "max_ms": max(latencies),
+        }
+    total = sum(r["count"] for r in routes.values())
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "concurrency": concurrency,
+        },
+        "elapsed_s": elapsed,
+        "requests": total,
+        "errors": sum(r["errors"] for r in routes.values()),
+        "rps": total / elapsed if elapsed else 0.0,
+        "routes": routes,
+    }
+
+
+def compare(current: Dict, baseline: Dict, threshold: float = DEFAULT_THRESHOLD) -> List[Dict]:
+    """
+    Сравнение p95 маршрутов с базовым прогоном.
+
+    Returns:
+        Регрессии: маршруты, p95 которых вырос больше чем на threshold.
+    """
+    regressions = []
+    for label, route in current["routes"].items():
+        base = baseline["routes"].get(label)
+        if base is None:
+            continue
+        ratio = route["p95_ms"] / base["p95_ms"]
+        if ratio > 1.0 + threshold:
+            regressions.append({"route": label, "baseline_ms": base["p95_ms"],
+                                "current_ms": route["p95_ms"], "ratio": ratio})
+    return regressions
+
+
+def format_comparison(current: Dict, baseline: Dict) -> str:
+    """Таблица сравнения двух прогонов: rps и перцентили по маршрутам."""
+    header = f"{'маршрут':<40} {'rps':>15} " + " ".join(f"{f'p{q}, мс':>19}" for q in PERCENTILES)
+    lines = [header]
+    for label in sorted(set(current["routes"]) | set(baseline["routes"])):
+        base, cur = baseline["routes"].get(label), current["routes"].get(label)
+        if base is None or cur is None:
+            lines.append(f"{label:<40} {'только в одном прогоне':>15}")
+            continue
+        cells = [f"{base['rps']:7.1f}->{cur['rps']:<7.1f}"]
+        cells += [f"{base[f'p{q}_ms']:8.1f}->{cur[f'p{q}_ms']:<9.1f}" for q in PERCENTILES]
+        lines.append(f"{label:<40} " + " ".join(cells))
+    lines.append(f"{'всего':<40} {baseline['rps']:7.1f}->{current['rps']:<7.1f}")
+    return "\n".join(lines)
+
+
+# ------------------------------ База и сервер ------------------------------ #
+def seed(database_url: str, dump: Optional[str] = None) -> Dict[str, int]:
+    """Заполняет базу данными db/init.dump (для SQLite — ещё и журнал WAL для параллельных воркеров)."""
+    from sqlalchemy import create_engine
+
+    from app.database import engine_options
+    from app.pgdump import DEFAULT_DUMP, seed_database
+
+    engine = create_engine(database_url, **engine_options(database_url))
+    try:
+        if engine.dialect.name == "sqlite":
+            with engine.connect() as conn:
+                conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+        return seed_database(engine, dump or DEFAULT_DUMP)
+    finally:
+        engine.dispose()
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextmanager
+def serve(backend_dir: str = BACKEND_DIR, database_url: Optional[str] = None, workers: int = 1,
+          env: Optional[Dict[str, str]] = None) -> Iterator[str]:
+    """
+    Запускает uvicorn из backend_dir на свободном порту; возвращает базовый URL.
+    Вывод сервера пишется в server.log во временном каталоге и показывается, если запуск не удался.
+    """
+    port = _free_port()
+    log_dir = tempfile.mkdtemp(prefix="loadtest-server-")
+    log_path = os.path.join(log_dir, "server.log")
+    log = open(log_path, "wb")
+    server_env = dict(os.environ, **(env or {}))
+    if database_url:
+        server_env["DATABASE_URL"] = database_url
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=backend_dir, env=server_env, stdout=log, stderr=subprocess.STDOUT)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while True:
+            if process.poll() is not None:
+                with open(log_path, encoding="utf-8", errors="replace") as f:
+                    tail = f.read()[-4000:]
+                raise RuntimeError(f"Сервер завершился при запуске с кодом {process.returncode}:\n{tail}")
+            try:
+                if httpx.get(base_url + READY_PROBE, timeout=5.0).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Сервер не ответил за {STARTUP_TIMEOUT:.0f} с")
+            time.sleep(0.2)
+        yield base_url
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        log.close()
+        shutil.rmtree(log_dir, ignore_errors=True)
+
+
+async def _run_against(base_url: str, args) -> Dict:
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        return await replay(client, args.concurrency, args.requests, args.duration, args.seed)
+
+
+def run(args, backend_dir: str = BACKEND_DIR) -> Dict:
+    """Прогон против --base-url или против сервера, запущенного из backend_dir."""
+    if args.base_url:
+        return asyncio.run(_run_against(args.base_url, args))
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = args.database_url
+        if database_url is None:
+            database_url = f"sqlite:///{os.path.join(tmp, 'loadtest.db')}"
+            seed(database_url, args.dump)
+        with serve(backend_dir, database_url, args.workers) as base_url:
+            report = asyncio.run(_run_against(base_url, args))
+    report["meta"].update(workers=args.workers, database=database_url.split(":", 1)[0])
+    return report
+
+
+@contextmanager
+def worktree(revision: str) -> Iterator[str]:
+    """Временный git worktree ревизии; возвращает путь к его backend."""
+    path = tempfile.mkdtemp(prefix="loadtest-")
+    subprocess.run(["git", "worktree", "add", "--detach", path, revision], cwd=BACKEND_DIR,
+                   check=True, capture_output=True)
+    try:
+        yield os.path.join(path, "backend")
+    finally:
+        subprocess.run(["git", "worktree", "remove", "--force", path], cwd=BACKEND_DIR, capture_output=True)
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def reads_database_url(revision: str) -> bool:
+    """Настройки ревизии читают DATABASE_URL (иначе сервер пойдёт в PostgreSQL по POSTGRES_*)."""
+    config = subprocess.run(["git", "show", f"{revision}:backend/app/core/config.py"], cwd=BACKEND_DIR,
+                            capture_output=True, text=True)
+    return config.returncode == 0 and re.search(r"^\s*DATABASE_URL\s*:", config.stdout, re.MULTILINE) is not None
+
+
+def run_revisions(base: str, head: str, args) -> Tuple[Dict, Dict]:
+    """
+    Одна и та же смесь против двух ревизий. База каждой — свежий SQLite из дампа (или
+    --database-url). Ревизию, которая не читает DATABASE_URL, стенд к базе подключить
+    не может: такая ревизия отклоняется до запуска прогонов.
+    """
+    for revision in (base, head):
+        if not reads_database_url(revision):
+            raise RuntimeError(
+                f"Ревизия {revision} не читает DATABASE_URL: стенд не может подставить ей базу. "
+                f"Запустите сервер этой ревизии на заполненной базе (seed) и используйте run --base-url")
+    reports = []
+    for revision in (base, head):
+        with worktree(revision) as backend_dir:
+            logger.info(f"Прогон ревизии {revision}")
+            report = run(args, backend_dir)
+        report["meta"]["revision"] = revision
+        reports.append(report)
+    return reports[0], reports[1]
+
+
+def _report_regressions(current: Dict, baseline: Dict, threshold: float) -> int:
+    print(format_comparison(current, baseline))
+    regressions = compare(current, baseline, threshold)
+    for r in regressions:
+        logger.error(f"Регрессия {r['route']}: p95 {r['baseline_ms']:.1f} -> {r['current_ms']:.1f} мс "
+                     f"(x{r['ratio']:.2f})")
+    return 1 if regressions else 0
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Нагрузочный стенд: смесь запросов против приложения")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    seed_cmd = commands.add_parser("seed", help="Заполнить базу данными db/init.dump")
+    seed_cmd.add_argument("--database-url", required=True)
+    seed_cmd.add_argument("--dump", help="Дамп pg_dump -Fc (по умолчанию db/init.dump)")
+
+    load = argparse.ArgumentParser(add_help=False)
+    load.add_argument("--concurrency", type=int, default=8, help="Параллельных клиентов")
+    load.add_argument("--requests", type=int, help="Число запросов")
+    load.add_argument("--duration", type=float, help="Длительность, с (по умолчанию 30, если не задано --requests)")
+    load.add_argument("--timeout", type=float, default=60.0, help="Таймаут запроса, с")
+    load.add_argument("--seed", type=int, default=SEED)
+    load.add_argument("--workers", type=int, default=1, help="Воркеров uvicorn")
+    load.add_argument("--database-url", help="База сервера (по умолчанию — временный SQLite из дампа)")
+    load.add_argument("--dump", help="Дамп для временной базы")
+    load.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                      help="Допустимый рост p95, доля (0.25 — на 25%%)")
+
+    run_cmd = commands.add_parser("run", parents=[load], help="Прогнать смесь запросов")
+    run_cmd.add_argument("-o", "--output", required=True, help="JSON с отчётом")
+    run_cmd.add_argument("--base-url", help="Уже запущенный сервер")
+    run_cmd.add_argument("--baseline", help="JSON базового прогона для сравнения")
+
+    compare_cmd = commands.add_parser("compare", help="Сравнить два отчёта")
+    compare_cmd.add_argument("baseline")
+    compare_cmd.add_argument("current")
+    compare_cmd.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+
+    revisions = commands.add_parser("revisions", parents=[load], help="Сравнить две ревизии git")
+    revisions.add_argument("base")
+    revisions.add_argument("head")
+    revisions.add_argument("-o", "--output", help="JSON с обоими отчётами")
+    args = parser.parse_args(argv)
+
+    if args.command == "seed":
+        for table, count in seed(args.database_url, args.dump).items():
+            logger.info(f"{table}: {count}")
+        return 0
+    if args.command == "compare":
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        with open(args.current, encoding="utf-8") as f:
+            current = json.load(f)
+        return _report_regressions(current, baseline, args.threshold)
+
+    if args.requests is None and args.duration is None:
+        args.duration = 30.0
+    args.base_url = getattr(args, "base_url", None)
+    if args.command == "revisions":
+        try:
+            baseline, current = run_revisions(args.base, args.head, args)
+        except RuntimeError as e:
+            logger.error(str(e))
+            return 2
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump({"base": baseline, "head": current}, f, ensure_ascii=False, indent=1)
+        return _report_regressions(current, baseline, args.threshold)
+
+    report = run(args)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+    if not args.baseline:
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    return _report_regressions(report, baseline, args.threshold)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    # Строка лога на каждый запрос смеси
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    sys.exit(main())
@@ -1,11 +1,16 @@
+import io
 import json
 import logging
+import zipfile
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, Depends, HTTPException, Response, status, APIRouter
+from fastapi import FastAPI, Depends, HTTPException, Response, status, APIRouter, BackgroundTasks, Query, Request
+from fastapi.concurrency import run_in_threadpool, iterate_in_threadpool
+from fastapi.responses import StreamingResponse
 from fastapi.routing import APIRoute
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session, selectinload
-from typing import List
+from typing import List, Optional
 from app.core.config import settings
 from app.models import Turbine, Valve, CalculationResultDB
 from app.schemas import (
@@ -14,13 +19,48 @@ from app.schemas import (
     ValveCreate,
     TurbineValves,
     CalculationParams,
+    CalculationResult,
     CalculationResultDB as CalculationResultDBSchema, TurbineWithValvesInfo,
+    TurbineCalculationParams,
+    TurbineCalculationResult,
+    OperatingMapInfo,
+    OperatingMapSpec,
+    OperatingPointAnswer,
+    MonteCarloParams,
+    MonteCarloResult,
+    DesignParams,
+    DesignResult,
+    SweepParams,
+    OptimizationParams,
+    JobInfo,
+    JobSubmit,
+    JobList,
+    JobResultPage,
+    RecalculateParams,
+    RecalculationInfo,
 )
 from app.dependencies import get_db
-from app.utils import ValveCalculator, CalculationError
+from app.utils import CalculationError
+from app.batch import calculate_turbine
+from app.network import make_calculator
+from app.operating_map import operating_maps, validate_spec
+from app.monte_carlo import GEOMETRY_KEYS, run_monte_carlo, monte_carlo_job, nominal_value
+from app.sensitivity import perturbed, sensitivity_report
+from app.design import solve_design
+from app.incremental import CalculationSession, calculation_sessions
+from app.streaming import DuplexStreamingResponse, ndjson_results, sweep_events, validate_sweep
+from app.catalog import valve_catalog
+from app.jobs import JobReporter, job_executor
+from app.optimizer import optimization_job
 from app.crud import create_calculation_result, get_results_by_valve_drawing, \
-    get_valves_by_turbine, get_calculation_result_by_id, get_turbine_by_id, get_valve_by_id
-from app.save_to_drowio import router as drawio_router
+    get_valves_by_turbine, get_calculation_result_by_id, get_turbine_by_id, get_valve_by_id, get_valve_for_params, \
+    find_recent_calculation_result
+from app.save_to_drowio import router as drawio_router, diagram_generator
+from app.api.main import api_router as service_router
+from app import metrics, tracing
+from app.coalescing import advisory_lock, fingerprint, single_flight
+from app.memory import start_tracing
+from app.profiling import ProfilingMiddleware, is_profiling
 
 # Настройка логирования
 logging.basicConfig(
@@ -34,8 +74,20 @@ def custom_generate_unique_id(route: APIRoute) -> str:
     return f"{route.tags[0]}-{route.name}"
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Диспетчер фоновых задач живёт вместе с приложением; при старте подхватывает
+    # задачи, оставшиеся в очереди или прерванные перезапуском
+    job_executor.start()
+    start_tracing()
+    yield
+    job_executor.stop()
+    tracing.close_exporters()
+
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
+    lifespan=lifespan,
     openapi_url="/api/v1/openapi.json", # Жестко прописали путь
     docs_url="/docs", # Жестко прописали путь к документации
     generate_unique_id_function=custom_generate_unique_id,
@@ -50,6 +102,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Профилирование отдельных запросов (X-Profile / ?profile=1 или выборка 1 из N)
+app.add_middleware(ProfilingMiddleware)
+
+# Метрики Prometheus: длительность запросов по маршрутам и время SQL-запросов
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.instrument_sqlalchemy()
+
+# Трассировка: дерево спанов запроса, выборка самых медленных и экспорт в файл
+tracing.configure(settings.TRACE_SLOW_KEEP, settings.TRACE_FILE, settings.TRACE_FILE_MIN_MS)
+if settings.TRACING_ENABLED:
+    app.add_middleware(tracing.TracingMiddleware)
+
 api_router = APIRouter()
 
 
@@ -132,6 +196,7 @@ async def delete_turbine(turbine_id: int, db: Session = Depends(get_db)):
             raise HTTPException(status_code=404, detail="Турбина не найдена")
         db.delete(db_turbine)
         db.commit()
+        valve_catalog.invalidate()
         return {"message": f"Турбина '{db_turbine.name}' успешно удалена"}
     except Exception as e:
         logger.error(f"Ошибка при удалении турбины: {e}")
@@ -186,6 +251,7 @@ async def create_valve(valve: ValveCreate, db: Session = Depends(get_db)):
         db.add(new_valve)
         db.commit()
         db.refresh(new_valve)
+        valve_catalog.invalidate()
         return new_valve
     except Exception as e:
         logger.error(f"Ошибка при создании клапана: {e}")
@@ -193,9 +259,12 @@ async def create_valve(valve: ValveCreate, db: Session = Depends(get_db)):
 
 
 @api_router.put("/valves/{valve_id}", response_model=ValveInfo, summary="Обновить клапан", tags=["valves"])
-async def update_valve(valve_id: int, valve: ValveInfo, db: Session = Depends(get_db)):
+async def update_valve(valve_id: int, valve: ValveInfo, background_tasks: BackgroundTasks,
+                       db: Session = Depends(get_db)):
     """
     Обновить данные о клапане.
+
+    Если у клапана есть карта режимов и изменилась геометрия, карта перестраивается в фоне.
     """
     try:
         db_valve = db.query(Valve).filter(Valve.id == valve_id).first()
@@ -217,6 +286,9 @@ async def update_valve(valve_id: int, valve: ValveInfo, db: Session = Depends(ge
 
         db.commit()
         db.refresh(db_valve)
+        valve_catalog.invalidate()
+        if operating_maps.exists(valve_id):
+            background_tasks.add_task(operating_maps.rebuild_if_stale, ValveInfo.model_validate(db_valve))
         return db_valve
     except Exception as e:
         logger.error(f"Ошибка при обновлении клапана {valve_id}: {e}")
@@ -236,6 +308,57 @@ async def read_valve_by_id(valve_id: int, db: Session = Depends(get_db)):
     return db_valve
 
 
+@api_router.post("/valves/{valve_id}/operating_map", response_model=OperatingMapInfo,
+                 status_code=status.HTTP_202_ACCEPTED, summary="Построить карту режимов клапана",
+                 tags=["valves"])
+async def build_operating_map_endpoint(valve_id: int, spec: OperatingMapSpec, background_tasks: BackgroundTasks,
+                                       db: Session = Depends(get_db)):
+    """
+    Запустить построение карты режимов: расчёт на сетке P_вх × T_вх × P_отсоса.
+
+    Карта строится в фоне; после готовности точки отвечаются интерполяцией
+    через /valves/{valve_id}/operating_map/point.
+    """
+    db_valve = get_valve_by_id(db, valve_id=valve_id)
+    if db_valve is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Клапан (шток) не найден")
+    valve_info = ValveInfo.model_validate(db_valve)
+    try:
+        validate_spec(valve_info, spec)
+    except CalculationError as ce:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=ce.message)
+
+    background_tasks.add_task(operating_maps.build, valve_info, spec)
+    info = operating_maps.info(valve_id)
+    info.status = "building" if info.status == "missing" else "rebuilding"
+    return info
+
+
+@api_router.get("/valves/{valve_id}/operating_map", response_model=OperatingMapInfo,
+                summary="Состояние карты режимов клапана", tags=["valves"])
+async def read_operating_map(valve_id: int):
+    """
+    Статус карты режимов, её спецификация и оценка погрешности интерполяции по выходам.
+    """
+    return operating_maps.info(valve_id)
+
+
+@api_router.get("/valves/{valve_id}/operating_map/point", response_model=OperatingPointAnswer,
+                summary="Режим клапана по карте", tags=["valves"])
+async def read_operating_point(valve_id: int, p_inlet: float, t_inlet: float, p_suction: float):
+    """
+    Мгновенный ответ по карте режимов (трилинейная интерполяция) с оценкой
+    относительной погрешности для ячейки точки и для всей карты.
+    """
+    try:
+        return operating_maps.query(valve_id, p_inlet, t_inlet, p_suction)
+    except KeyError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail="Карта режимов для клапана не построена")
+    except CalculationError as ce:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=ce.message)
+
+
 @api_router.delete("/valves/{valve_id}", response_model=dict, summary="Удалить клапан", tags=["valves"])
 async def delete_valve(valve_id: int, db: Session = Depends(get_db)):
     """
@@ -247,6 +370,7 @@ async def delete_valve(valve_id: int, db: Session = Depends(get_db)):
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Клапан не найден")
         db.delete(valve)
         db.commit()
+        valve_catalog.invalidate()
         return {"message": f"Клапан '{valve.name}' успешно удален"}
     except Exception as e:
         logger.error(f"Ошибка при удалении клапана {valve_id}: {e}")
@@ -277,23 +401,30 @@ async def get_turbine_by_valve_name(valve_name: str, db: Session = Depends(get_d
 
 # ------ Маршруты для вычислений ------
 
-@api_router.post("/calculate", response_model=CalculationResultDBSchema, summary="Выполнить расчет",
-                 tags=["calculations"])
-async def calculate(params: CalculationParams, db: Session = Depends(get_db)):
+def _resolve_valve(db: Session, params: CalculationParams) -> Valve:
     """
-    Выполнить расчет на основе параметров.
+    Находит шток для расчёта: по valve_id, если он передан, иначе по имени чертежа.
     """
-    try:
-        valve = db.query(Valve).filter(Valve.name == params.valve_drawing).first()
-        if not valve:
+    with tracing.span("valve.lookup", valve_id=params.valve_id, stock=params.valve_drawing) as span:
+        valve = get_valve_for_params(db, params)
+        if valve:
+            span.set(stock=valve.name, count_parts=valve.count_parts)
+            tracing.annotate_trace(stock=valve.name, count_parts=valve.count_parts)
+    if not valve:
+        if params.valve_id is not None:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
-                                detail=f"Клапан с именем '{params.valve_drawing}' не найден")
+                                detail=f"Клапан с ID {params.valve_id} не найден")
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f"Клапан с именем '{params.valve_drawing}' не найден")
+    return valve
 
-        valve_info = ValveInfo.model_validate(valve)
-
-        calculator = ValveCalculator(params, valve_info)
-        calculation_result = calculator.perform_calculations()
 
+def _save_result(db: Session, params: CalculationParams, valve: Valve,
+                 calculation_result: CalculationResult) -> CalculationResultDBSchema:
+    """
+    Сохраняет результат расчёта в БД.
+    """
+    with tracing.span("db.persist", stock=valve.name, count_parts=valve.count_parts):
         new_result = create_calculation_result(
             db=db,
             parameters=params,
@@ -301,15 +432,108 @@ async def calculate(params: CalculationParams, db: Session = Depends(get_db)):
             valve_id=valve.id
         )
 
-        return CalculationResultDBSchema(
-            id=new_result.id,
-            user_name=new_result.user_name,
-            stock_name=new_result.stock_name,
-            turbine_name=new_result.turbine_name,
-            calc_timestamp=new_result.calc_timestamp,
-            input_data=json.loads(new_result.input_data),
-            output_data=json.loads(new_result.output_data)
-        )
+    return _result_schema(new_result)
+
+
+def _result_schema(row: CalculationResultDB) -> CalculationResultDBSchema:
+    """Сохранённый результат (входные и выходные данные хранятся строкой JSON) как схема ответа."""
+    return CalculationResultDBSchema(
+        id=row.id,
+        user_name=row.user_name,
+        stock_name=row.stock_name,
+        turbine_name=row.turbine_name,
+        calc_timestamp=row.calc_timestamp,
+        input_data=json.loads(row.input_data),
+        output_data=json.loads(row.output_data)
+    )
+
+
+def _stored_params(params: CalculationParams, valve: Valve) -> CalculationParams:
+    """Параметры в том виде, в каком они сохраняются с результатом: с именем чертежа штока."""
+    if params.valve_drawing is None:
+        return params.model_copy(update={"valve_drawing": valve.name})
+    return params
+
+
+def _run_calculation(db: Session, params: CalculationParams, valve: Valve,
+                     diagnostics: bool = False) -> CalculationResultDBSchema:
+    """
+    Выполняет расчёт для найденного штока и сохраняет результат в БД.
+
+    Промежуточные величины сохраняются в сессии под ID результата для /results/{id}/recalculate.
+    С diagnostics=True в результат (metadata) попадает диагностика решателя по участкам.
+    """
+    valve_info = ValveInfo.model_validate(valve)
+    params = _stored_params(params, valve)
+
+    if params.network is not None:
+        calculator = make_calculator(params, valve_info)
+        calculator.include_metadata = diagnostics
+        return _save_result(db, params, valve, calculator.perform_calculations())
+
+    session = CalculationSession()
+    calculation_result, _ = session.calculate(params, valve_info, diagnostics)
+    saved = _save_result(db, params, valve, calculation_result)
+    calculation_sessions.put(saved.id, session)
+    return saved
+
+
+def _run_calculation_exclusive(db: Session, params: CalculationParams, valve: Valve,
+                               diagnostics: bool, key: str) -> CalculationResultDBSchema:
+    """
+    _run_calculation под advisory-блокировкой PostgreSQL на отпечаток (в транзакции сессии
+    запроса): если тот же расчёт шёл в другом воркере, берётся записанный им за время
+    ожидания результат.
+    """
+    with advisory_lock(db, key, settings.COALESCE_LOCK_TIMEOUT) as waited_since:
+        if waited_since is not None:
+            row = find_recent_calculation_result(db, valve.id, key, waited_since, diagnostics)
+            if row is not None:
+                metrics.calculations_coalesced.labels(scope="cluster").inc()
+                return _result_schema(row)
+        return _run_calculation(db, params, valve, diagnostics)
+
+
+async def _calculate_coalesced(db: Session, params: CalculationParams, valve: Valve,
+                               diagnostics: bool = False) -> CalculationResultDBSchema:
+    """
+    Расчёт с объединением одинаковых одновременных запросов (app.coalescing): расчёт идёт
+    в пуле потоков, а запросы с тем же отпечатком ждут его и получают тот же результат.
+    Профилируемый запрос считается в потоке цикла событий без объединения — иначе
+    расчёт не попадёт в профиль.
+    """
+    if not settings.COALESCE_CALCULATIONS or is_profiling():
+        return _run_calculation(db, params, valve, diagnostics)
+    key = fingerprint(params, valve.id, diagnostics)
+    return await single_flight.do(key, lambda: run_in_threadpool(
+        _run_calculation_exclusive, db, params, valve, diagnostics, key))
+
+
+@api_router.post("/calculate", response_model=CalculationResultDBSchema, summary="Выполнить расчет",
+                 tags=["calculations"])
+async def calculate(params: CalculationParams, sensitivity: bool = False, diagnostics: bool = False,
+                    db: Session = Depends(get_db)):
+    """
+    Выполнить расчет на основе параметров.
+
+    С sensitivity=true в ответ добавляется матрица d(Gi)/d(вход) по геометрии,
+    давлениям и температурам (центральные разности одним пакетным расчётом).
+    С diagnostics=true в output_data.metadata — как решён каждый участок: итерации,
+    ширина интервала, Re и λ, режим течения, невязка и сработавшие ограничители.
+
+    Одинаковые одновременные запросы (тот же шток и режим) считаются и сохраняются
+    один раз и получают один и тот же результат (с тем же id).
+    """
+    try:
+        valve = _resolve_valve(db, params)
+        result = await _calculate_coalesced(db, params, valve, diagnostics)
+        if sensitivity:
+            # Результат может быть общим с объединёнными запросами
+            result = result.model_copy()
+            result.sensitivity = sensitivity_report(params, ValveInfo.model_validate(valve))
+        # Сериализация в JSON здесь, а не в FastAPI — чтобы она попала в трассу
+        with tracing.span("response.serialize"):
+            return Response(content=result.model_dump_json(), media_type="application/json")
     except CalculationError as ce:
         logger.error(f"Ошибка при выполнении расчётов: {ce.message}")
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=ce.message)
@@ -319,6 +543,276 @@ async def calculate(params: CalculationParams, db: Session = Depends(get_db)):
                             detail=f"Не удалось выполнить расчёты: {e}")
 
 
+@api_router.post("/calculate/report", response_class=Response,
+                 summary="Выполнить расчет и сформировать схему (ZIP)", tags=["calculations"],
+                 responses={200: {"content": {"application/zip": {}}}})
+async def calculate_report(params: CalculationParams, db: Session = Depends(get_db)):
+    """
+    Выполнить расчет и сразу получить отчёт одним запросом.
+
+    Шток ищется в БД один раз; результат сохраняется как в /calculate.
+    В ответе — ZIP-архив с result.json и схемой draw.io, на которой
+    подписаны рассчитанные Gi/Ti/Hi и параметры отсосов.
+    """
+    if diagram_generator is None:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail="Генератор диаграмм не инициализирован")
+    try:
+        valve = _resolve_valve(db, params)
+        result = _run_calculation(db, params, valve)
+
+        valve_info = ValveInfo.model_validate(valve)
+        scheme = diagram_generator.render_diagram(
+            valve_info, CalculationResult.model_validate(result.output_data)
+        )
+
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("result.json", result.model_dump_json(indent=2))
+            archive.writestr(f"scheme_{valve_info.count_parts}_parts.drawio", scheme)
+
+        filename = f"report_{result.id}.zip"
+        return Response(
+            content=buffer.getvalue(),
+            media_type="application/zip",
+            headers={"Content-Disposition": f"attachment; filename={filename}"}
+        )
+    except CalculationError as ce:
+        logger.error(f"Ошибка при выполнении расчётов: {ce.message}")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=ce.message)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Ошибка при формировании отчёта: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail=f"Не удалось сформировать отчёт: {e}")
+
+
+@api_router.post("/calculate/monte_carlo", response_model=MonteCarloResult,
+                 summary="Монте-Карло по допускам геометрии и режима", tags=["calculations"])
+async def calculate_monte_carlo(request: MonteCarloParams, db: Session = Depends(get_db)):
+    """
+    Статистический анализ допусков: выборка зазора, диаметра, длин участков и параметров
+    режима из заданных распределений (воспроизводима по seed).
+
+    Возвращает среднее, СКО, перцентили и гистограммы Gi и нагрузок на деаэратор/эжектор.
+    Результаты в БД не сохраняются.
+    """
+    if request.samples > settings.MONTE_CARLO_MAX_SAMPLES:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"Объём выборки больше допустимого ({settings.MONTE_CARLO_MAX_SAMPLES})")
+    try:
+        valve = ValveInfo.model_validate(_resolve_valve(db, request.params))
+        return await run_in_threadpool(run_monte_carlo, request, valve)
+    except CalculationError as ce:
+        logger.error(f"Ошибка Монте-Карло: {ce.message}")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=ce.message)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Ошибка Монте-Карло: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail=f"Не удалось выполнить расчёт Монте-Карло: {e}")
+
+
+@api_router.post("/design", response_model=DesignResult,
+                 summary="Подбор зазора/длины/радиуса под целевую протечку", tags=["calculations"])
+async def design(request: DesignParams, db: Session = Depends(get_db)):
+    """
+    Обратная задача: найти зазор, длину участка или радиус скругления, при которых
+    расход через участок (G<i>), в деаэратор или в эжектор равен заданному.
+
+    Геометрия берётся из запроса или из БД; промежуточные расчёты не сохраняются.
+    """
+    try:
+        valve = request.valve if request.valve is not None \
+            else ValveInfo.model_validate(_resolve_valve(db, request.params))
+        return solve_design(request, valve)
+    except CalculationError as ce:
+        logger.error(f"Ошибка обратной задачи: {ce.message}")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=ce.message)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Ошибка обратной задачи: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail=f"Не удалось решить обратную задачу: {e}")
+
+
+@api_router.post("/calculate/sweep/stream", response_class=StreamingResponse,
+                 summary="Развёртка по параметрам (поток событий)", tags=["calculations"],
+                 responses={200: {"content": {"text/event-stream": {}}}})
+async def calculate_sweep_stream(request: SweepParams, db: Session = Depends(get_db)):
+    """
+    Расчёт по сетке значений одного или нескольких входов с выдачей результатов
+    по мере готовности (text/event-stream): события point, progress и done.
+
+    Точки считаются порциями по chunk_size; следующая порция считается, только когда
+    клиент принял предыдущую. Результаты в БД не сохраняются.
+    """
+    try:
+        valve = request.valve if request.valve is not None \
+            else ValveInfo.model_validate(_resolve_valve(db, request.params))
+        validate_sweep(request, valve)
+    except CalculationError as ce:
+        logger.error(f"Ошибка развёртки: {ce.message}")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=ce.message)
+    return StreamingResponse(
+        iterate_in_threadpool(sweep_events(request, valve)),
+        media_type="text/event-stream",
+        # Без кеширования и буферизации в nginx, иначе события приходят пачкой в конце
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@api_router.post("/calculate/batch/ndjson", response_class=StreamingResponse,
+                 summary="Пакетный расчёт потока записей (NDJSON)", tags=["calculations"],
+                 openapi_extra={"requestBody": {"required": True, "content": {
+                     "application/x-ndjson": {"schema": {"$ref": "#/components/schemas/CalculationParams"}}}}},
+                 responses={200: {"content": {"application/x-ndjson": {}}}})
+async def calculate_batch_ndjson(request: Request, chunk_size: int = Query(256, ge=1, le=4096),
+                                 db: Session = Depends(get_db)):
+    """
+    Расчёт произвольно длинного потока режимов: в теле — по одной записи CalculationParams
+    на строку, в ответе — по строке {"line", "result"} или {"line", "error"} на каждую запись.
+
+    Тело читается по мере поступления, записи считаются порциями по chunk_size, штоки
+    ищутся в кэшированном справочнике. Результаты в БД не сохраняются.
+    """
+    catalog = valve_catalog.snapshot(db)
+    return DuplexStreamingResponse(
+        ndjson_results(request.stream(), catalog, chunk_size),
+        media_type="application/x-ndjson",
+        headers={"X-Accel-Buffering": "no"},
+    )
+
+
+@api_router.post("/optimize", response_model=JobInfo, status_code=status.HTTP_202_ACCEPTED,
+                 summary="Оптимизация геометрии (фронт Парето)", tags=["calculations"])
+async def optimize(request: OptimizationParams, db: Session = Depends(get_db)):
+    """
+    Запустить фоновую оптимизацию зазора, радиуса скругления и длин участков
+    по двум целям: нагрузка на эжектор и протечка в деаэратор.
+
+    Возвращает задачу; прогресс — /jobs/{id}, фронт Парето — /jobs/{id}/result.
+    """
+    if request.valve is None:
+        request = request.model_copy(update={"valve": ValveInfo.model_validate(_resolve_valve(db, request.params))})
+    return job_executor.submit("optimization", request.model_dump(mode="json"))
+
+
+@api_router.post("/turbines/{turbine_name:path}/calculate", response_model=TurbineCalculationResult,
+                 summary="Расчёт всех штоков турбины", tags=["calculations"])
+async def calculate_turbine_endpoint(turbine_name: str, request: TurbineCalculationParams,
+                                     db: Session = Depends(get_db)):
+    """
+    Рассчитать все штоки турбины одним пакетом.
+
+    Возвращает результаты по штокам и суммарные нагрузки на деаэратор и эжектор
+    с разбивкой по уровням давления отсоса. Результаты в БД не сохраняются.
+    """
+    turbine_valves = get_valves_by_turbine(db, turbine_name=turbine_name)
+    if turbine_valves is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f"Турбина с именем '{turbine_name}' не найдена")
+    try:
+        return calculate_turbine(turbine_name, turbine_valves.valves, request)
+    except Exception as e:
+        logger.error(f"Ошибка при расчёте турбины {turbine_name}: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail=f"Не удалось выполнить расчёт турбины: {e}")
+
+
+# ------ Маршруты для фоновых задач ------
+
+@api_router.post("/jobs", response_model=JobInfo, status_code=status.HTTP_202_ACCEPTED,
+                 summary="Поставить задачу в очередь", tags=["jobs"])
+async def submit_job(request: JobSubmit, db: Session = Depends(get_db)):
+    """
+    Поставить фоновую задачу: calculate (CalculationParams), monte_carlo (MonteCarloParams)
+    или optimization (OptimizationParams). Задачи с большим priority берутся раньше.
+    """
+    schemas_by_kind = {"calculate": CalculationParams, "monte_carlo": MonteCarloParams,
+                       "optimization": OptimizationParams}
+    if request.kind not in schemas_by_kind:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"Неизвестный вид задачи: {request.kind}")
+    try:
+        payload = schemas_by_kind[request.kind].model_validate(request.payload)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Неверные параметры задачи: {e}")
+    # Шток проверяем сразу (404), а не при выполнении задачи
+    if request.kind == "calculate":
+        _resolve_valve(db, payload)
+    elif request.kind == "monte_carlo":
+        _resolve_valve(db, payload.params)
+    elif payload.valve is None:
+        payload = payload.model_copy(update={"valve": ValveInfo.model_validate(_resolve_valve(db, payload.params))})
+    return job_executor.submit(request.kind, payload.model_dump(mode="json"), priority=request.priority)
+
+
+@api_router.get("/jobs", response_model=JobList, summary="Список задач", tags=["jobs"])
+async def list_jobs(status_filter: Optional[str] = Query(None, alias="status"), kind: Optional[str] = None,
+                    offset: int = 0, limit: int = 50):
+    """
+    Список задач (новые первыми) с фильтром по статусу и виду.
+    """
+    return job_executor.list(status=status_filter, kind=kind, offset=offset, limit=min(limit, 500))
+
+
+@api_router.get("/jobs/{job_id}", response_model=JobInfo, summary="Состояние задачи", tags=["jobs"])
+async def read_job(job_id: str):
+    """
+    Статус и прогресс фоновой задачи.
+    """
+    job = job_executor.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Задача не найдена")
+    return job
+
+
+@api_router.post("/jobs/{job_id}/cancel", response_model=JobInfo, summary="Отменить задачу", tags=["jobs"])
+async def cancel_job(job_id: str):
+    """
+    Отменить задачу: из очереди — сразу, выполняющуюся — при ближайшей проверке обработчиком.
+    """
+    job = job_executor.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Задача не найдена")
+    return job
+
+
+@api_router.get("/jobs/{job_id}/result", response_model=JobResultPage, summary="Результат задачи", tags=["jobs"])
+async def read_job_result(job_id: str, offset: int = 0, limit: Optional[int] = None):
+    """
+    Результат завершённой задачи. Длинные списки (фронт Парето) отдаются постранично
+    через offset/limit; total — их полная длина.
+    """
+    found = job_executor.result(job_id, offset=offset, limit=limit)
+    if found is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Задача не найдена")
+    job, page = found
+    if job.status != "done":
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail=f"Задача не завершена (статус: {job.status})")
+    return page
+
+
+def calculate_job(payload: dict, reporter: JobReporter) -> dict:
+    """Обработчик задачи calculate: тот же расчёт, что и /calculate, с сохранением результата."""
+    params = CalculationParams.model_validate(payload)
+    with reporter.session() as db:
+        valve = get_valve_for_params(db, params)
+        if valve is None:
+            raise CalculationError(f"Клапан '{params.valve_id or params.valve_drawing}' не найден")
+        return _run_calculation(db, params, valve).model_dump(mode="json")
+
+
+job_executor.register("calculate", calculate_job)
+job_executor.register("monte_carlo", monte_carlo_job)
+job_executor.register("optimization", optimization_job, paginate="front")
+
+
 # ------ Маршруты для результатов ------
 
 @api_router.get("/valves/{valve_name:path}/results/", response_model=List[CalculationResultDBSchema],
@@ -379,6 +873,67 @@ async def read_calculation_result(result_id: int, db: Session = Depends(get_db))
     return db_result
 
 
+@api_router.post("/results/{result_id}/recalculate", response_model=CalculationResultDBSchema,
+                 summary="Пересчитать результат с изменёнными входами", tags=["results"])
+async def recalculate_result(result_id: int, request: RecalculateParams, db: Session = Depends(get_db)):
+    """
+    Повторить сохранённый расчёт, изменив часть входов режима (t_air, temperature_start,
+    p_values.<i>, p_ejector.<i>). Геометрия штока берётся из справочника: результат
+    сохраняется со ссылкой на шток, поэтому менять её при пересчёте нельзя (422).
+
+    Заново решаются только участки, входы которых изменились; остальные берутся из
+    сессии исходного расчёта. Новый результат сохраняется, в поле recalculation —
+    какие входы изменены и какие участки пересчитаны.
+    """
+    db_result = get_calculation_result_by_id(db, result_id=result_id)
+    if db_result is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Результат расчёта не найден")
+    geometry_changes = sorted(key for key in request.changes if key in GEOMETRY_KEYS)
+    if geometry_changes:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+                            detail=f"При пересчёте можно менять только входы режима: {', '.join(geometry_changes)}")
+    try:
+        base_params = CalculationParams.model_validate(db_result.input_data)
+        if base_params.network is not None:
+            raise CalculationError("Пересчёт не поддерживает сетевой режим.")
+        valve = db_result.valve
+        valve_info = ValveInfo.model_validate(valve)
+        for key in request.changes:
+            nominal_value(base_params, valve_info, key)
+
+        base_session = calculation_sessions.get(result_id)
+        if base_session is None:
+            # Сессия вытеснена или результат из другого процесса — восстанавливаем исходный расчёт
+            base_session = CalculationSession()
+            base_session.calculate(base_params, valve_info)
+            calculation_sessions.put(result_id, base_session)
+        # У нового результата своя сессия: сессия исходного остаётся его состоянием
+        session = base_session.copy()
+
+        params, new_valve_info = base_params, valve_info
+        for key, value in request.changes.items():
+            params, new_valve_info = perturbed(params, new_valve_info, key, value)
+        calculation_result, recomputed = session.calculate(params, new_valve_info)
+
+        saved = _save_result(db, params, valve, calculation_result)
+        calculation_sessions.put(saved.id, session)
+        count_parts = len(calculation_result.Gi)
+        saved.recalculation = RecalculationInfo(
+            base_result_id=result_id,
+            changed_inputs=sorted(request.changes),
+            recomputed_parts=recomputed,
+            reused_parts=[i for i in range(1, count_parts + 1) if i not in recomputed],
+        )
+        return saved
+    except CalculationError as ce:
+        logger.error(f"Ошибка при пересчёте результата {result_id}: {ce.message}")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=ce.message)
+    except Exception as e:
+        logger.error(f"Ошибка при пересчёте результата {result_id}: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail=f"Не удалось пересчитать результат: {e}")
+
+
 @api_router.delete("/results/{result_id}",
                    status_code=status.HTTP_204_NO_CONTENT,
                    summary="Удалить результат расчёта",
@@ -393,6 +948,7 @@ async def delete_calculation_result(result_id: int, db: Session = Depends(get_db
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Результат расчёта не найден")
         db.delete(result)
         db.commit()
+        calculation_sessions.discard(result_id)
         return Response(status_code=status.HTTP_204_NO_CONTENT)
     except Exception as e:
         logger.error(f"Ошибка при удалении результата расчёта {result_id}: {e}")
@@ -403,3 +959,10 @@ async def delete_calculation_result(result_id: int, db: Session = Depends(get_db
 # Подключаем маршруты к приложению
 app.include_router(api_router, prefix=settings.API_V1_STR)
 app.include_router(drawio_router, prefix=settings.API_V1_STR)
+app.include_router(service_router, prefix=settings.API_V1_STR)
+
+
+@app.get("/metrics", include_in_schema=False, tags=["utils"])
+async def read_metrics():
+    """Метрики процесса в текстовом формате Prometheus."""
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
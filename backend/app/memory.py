@@ -0,0 +1,226 @@
+"""
+Диагностика памяти процесса: RSS, счётчики объектов, размеры кэшей и tracemalloc.
+
+В контейнере работает несколько воркеров uvicorn, а запрос обслуживает один из них:
+счётчики объектов и tracemalloc относятся к ответившему воркеру (его pid — в ответе),
+RSS соседних воркеров читается из /proc.
+"""
+from __future__ import annotations
+
+import asyncio
+import gc
+import os
+import resource
+import sys
+import threading
+import tracemalloc
+from collections import Counter
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+from app.schemas import AllocationSite, MemoryDiff, MemoryStats, ObjectCount, WorkerMemory
+
+# Группировка мест выделения: строка, файл или цепочка вызовов
+GROUP_KEYS = ("lineno", "filename", "traceback")
+
+# Глубина стека при временном включении tracemalloc (для group=traceback — глубже)
+DIFF_FRAMES = 1
+DIFF_TRACEBACK_FRAMES = 16
+
+# Выделения самого tracemalloc и загрузчика модулей — не утечки приложения
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+# Одновременно выполняется одно сравнение снимков: второе выключило бы tracemalloc первому
+_diff_busy = threading.Lock()
+
+
+class MemoryDiagnosticsBusy(Exception):
+    """Сравнение снимков уже выполняется в этом процессе."""
+
+
+def start_tracing() -> None:
+    """Включает tracemalloc при старте, если задан TRACEMALLOC_FRAMES > 0."""
+    if settings.TRACEMALLOC_FRAMES > 0 and not tracemalloc.is_tracing():
+        tracemalloc.start(settings.TRACEMALLOC_FRAMES)
+
+
+# ------------------------------ RSS и воркеры ------------------------------ #
+def _rss_bytes(pid: int | str = "self") -> Optional[int]:
+    """Текущий RSS процесса по /proc/<pid>/statm (None вне Linux или если процесса нет)."""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдаёт КиБ, macOS — байты
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _cmdline(pid: int | str) -> bytes:
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            return f.read()
+    except OSError:
+        return b""
+
+
+def _is_manager(pid: int) -> bool:
+    """Процесс — менеджер воркеров uvicorn/gunicorn (а не оболочка или другая программа)."""
+    cmdline = _cmdline(pid)
+    return b"uvicorn" in cmdline or b"gunicorn" in cmdline
+
+
+def _ppid(pid: int | str) -> Optional[int]:
+    """PID родителя по /proc/<pid>/stat (имя процесса в скобках может содержать пробелы)."""
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            return int(f.read().rsplit(b")", 1)[1].split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def worker_pids() -> List[int]:
+    """
+    PID воркеров: процессы с тем же родителем, что и текущий (по полю ppid из
+    /proc/<pid>/stat), если родитель — менеджер uvicorn/gunicorn; кроме
+    multiprocessing.resource_tracker менеджера. Родитель не менеджер (запуск из
+    оболочки) или нет /proc — только текущий.
+    """
+    own = os.getpid()
+    parent = os.getppid()
+    if not _is_manager(parent):
+        return [own]
+    try:
+        pids = {int(name) for name in os.listdir("/proc") if name.isdigit()}
+    except OSError:
+        return [own]
+    workers = {pid for pid in pids
+               if _ppid(pid) == parent and b"multiprocessing.resource_tracker" not in _cmdline(pid)}
+    workers.add(own)
+    return sorted(workers)
+
+
+def workers_memory() -> List[WorkerMemory]:
+    own = os.getpid()
+    return [WorkerMemory(pid=pid, rss_bytes=_rss_bytes(pid), current=pid == own) for pid in worker_pids()]
+
+
+# ------------------------------ Объекты и кэши ------------------------------ #
+def _orm_classes() -> set:
+    from app.database import Base
+
+    return {mapper.class_ for mapper in Base.registry.mappers}
+
+
+def cache_sizes() -> Dict[str, int]:
+    """Размеры кэшей процесса: схемы (штук и байт), сессии пересчёта, справочник, свойства воды."""
+    from app import calc_core
+    from app.catalog import valve_catalog
+    from app.incremental import calculation_sessions
+    from app.save_to_drowio import diagram_cache
+
+    sizes = {
+        "diagram_cache_entries": len(diagram_cache),
+        "diagram_cache_bytes": diagram_cache.memory_bytes(),
+        "calculation_sessions": len(calculation_sessions),
+        "valve_catalog": len(valve_catalog),
+    }
+    for func in (calc_core.pt2h, calc_core.ph, calc_core.ph2v, calc_core.ph2t, calc_core.air_calc):
+        sizes[f"property_cache_{func.__name__}"] = func.cache_info().currsize
+    return sizes
+
+
+def process_memory(top_types: int = 20) -> MemoryStats:
+    """Снимок памяти текущего воркера; обходит все объекты gc, поэтому не для частого опроса."""
+    orm_classes = _orm_classes()
+    objects = gc.get_objects()
+    by_type = Counter(type(o).__name__ for o in objects)
+    orm_objects = sum(1 for o in objects if type(o) in orm_classes)
+    total = len(objects)
+    del objects
+
+    traced, traced_peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (None, None)
+    return MemoryStats(
+        pid=os.getpid(),
+        rss_bytes=_rss_bytes(),
+        peak_rss_bytes=_peak_rss_bytes(),
+        gc_objects=total,
+        gc_counts=list(gc.get_count()),
+        orm_objects=orm_objects,
+        top_types=[ObjectCount(type=name, count=count) for name, count in by_type.most_common(top_types)],
+        caches=cache_sizes(),
+        tracemalloc=tracemalloc.is_tracing(),
+        traced_bytes=traced,
+        traced_peak_bytes=traced_peak,
+        workers=workers_memory(),
+    )
+
+
+# ------------------------------ tracemalloc ------------------------------ #
+def _site(stat) -> AllocationSite:
+    frames = [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback]
+    return AllocationSite(
+        location=frames[0] if frames else "<unknown>",
+        size_bytes=stat.size,
+        size_diff_bytes=getattr(stat, "size_diff", stat.size),
+        count=stat.count,
+        count_diff=getattr(stat, "count_diff", stat.count),
+        traceback=frames if len(frames) > 1 else None,
+    )
+
+
+def _snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+
+
+def top_allocations(limit: int = 25, group: str = "lineno") -> List[AllocationSite]:
+    """Крупнейшие места выделения живой памяти; требует включённого tracemalloc."""
+    if not tracemalloc.is_tracing():
+        raise RuntimeError("tracemalloc не включён")
+    return [_site(stat) for stat in _snapshot().statistics(group)[:limit]]
+
+
+async def tracemalloc_diff(seconds: float, limit: int = 25, group: str = "lineno") -> MemoryDiff:
+    """
+    Рост памяти за интервал: снимок tracemalloc, ожидание seconds (воркер тем временем
+    обслуживает запросы), второй снимок и сравнение по местам выделения.
+
+    Если tracemalloc не был включён, он включается на время замера; пока он работает,
+    выделения памяти в процессе заметно медленнее.
+    """
+    if not _diff_busy.acquire(blocking=False):
+        raise MemoryDiagnosticsBusy()
+    started_here = not tracemalloc.is_tracing()
+    try:
+        if started_here:
+            tracemalloc.start(DIFF_TRACEBACK_FRAMES if group == "traceback" else DIFF_FRAMES)
+        rss_before = _rss_bytes()
+        objects_before = len(gc.get_objects())
+        before = _snapshot()
+        await asyncio.sleep(seconds)
+        after = _snapshot()
+        stats = after.compare_to(before, group)
+        return MemoryDiff(
+            pid=os.getpid(),
+            seconds=seconds,
+            group=group,
+            size_diff_bytes=sum(stat.size_diff for stat in stats),
+            rss_before_bytes=rss_before,
+            rss_after_bytes=_rss_bytes(),
+            objects_before=objects_before,
+            objects_after=len(gc.get_objects()),
+            sites=[_site(stat) for stat in stats[:limit]],
+        )
+    finally:
+        if started_here:
+            tracemalloc.stop()
+        _diff_busy.release()
@@ -0,0 +1,225 @@
+"""
+Метрики сервиса в текстовом формате Prometheus (эндпоинт /metrics), на prometheus_client.
+
+Метрики живут в памяти процесса: каждый воркер uvicorn отдаёт свои, поэтому
+при нескольких воркерах их нужно собирать с каждого процесса (или суммировать
+в Prometheus по instance). Веб-стек модуль не импортирует: его подключает
+адаптер app.utils, который загружают процессы пула расчётов.
+"""
+from __future__ import annotations
+
+import time
+
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram,
+                               disable_created_metrics, generate_latest)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import Collector
+
+from app import calc_core
+
+# Ряды *_created удваивают выдачу и не нужны для rate()
+disable_created_metrics()
+
+# Границы корзин по умолчанию, с: от единиц миллисекунд до десятков секунд
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Свой реестр, а не глобальный REGISTRY: в выдаче только метрики сервиса
+registry = CollectorRegistry()
+
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+
+def render() -> bytes:
+    return generate_latest(registry)
+
+
+# ------------------------------ Метрики сервиса ------------------------------ #
+http_request_duration = Histogram(
+    "autocalc_http_request_duration_seconds", "Длительность HTTP-запроса по маршруту",
+    ("method", "route", "status"), buckets=DEFAULT_BUCKETS, registry=registry)
+http_requests_in_progress = Gauge(
+    "autocalc_http_requests_in_progress", "HTTP-запросы в работе", registry=registry)
+calculation_duration = Histogram(
+    "autocalc_calculation_duration_seconds", "Время расчёта протечек по числу участков",
+    ("count_parts",), buckets=DEFAULT_BUCKETS, registry=registry)
+calculation_errors = Counter(
+    "autocalc_calculation_errors", "Ошибки расчёта по видам CalculationError", ("kind",), registry=registry)
+solver_iterations = Histogram(
+    "autocalc_solver_iterations", "Итерации бинарного поиска скорости на участок",
+    buckets=(5, 10, 15, 20, 25, 30, 40, 50, 100, 250, 1000), registry=registry)
+db_query_duration = Histogram(
+    "autocalc_db_query_duration_seconds", "Время SQL-запроса по виду оператора", ("operation",),
+    buckets=DEFAULT_BUCKETS, registry=registry)
+solver_residual = Histogram(
+    "autocalc_solver_residual_mps", "Невязка скорости в решении участка по модулю, м/с",
+    buckets=(1e-6, 1e-5, 1e-4, 5e-4, 1e-3, 1e-2, 0.1, 1.0), registry=registry)
+solver_regimes = Counter(
+    "autocalc_solver_regime", "Решённые участки по режиму течения", ("regime",), registry=registry)
+solver_guards = Counter(
+    "autocalc_solver_guards", "Срабатывания ограничителей решателя участка", ("guard",), registry=registry)
+calculations_coalesced = Counter(
+    "autocalc_calculations_coalesced", "Запросы /calculate с результатом чужого расчёта (в воркере или кластере)",
+    ("scope",), registry=registry)
+diagram_generation_duration = Histogram(
+    "autocalc_diagram_generation_seconds", "Время генерации схемы Draw.io (промах кэша)",
+    buckets=DEFAULT_BUCKETS, registry=registry)
+
+
+def _observe_solver(diagnostics: calc_core.SolverDiagnostics) -> None:
+    solver_iterations.observe(diagnostics.iterations)
+    solver_residual.observe(abs(diagnostics.residual))
+    solver_regimes.labels(regime=diagnostics.regime).inc()
+    for guard in diagnostics.guards:
+        solver_guards.labels(guard=guard).inc()
+
+
+# Ядро расчёта не знает о метриках: диагностика решателя приходит через наблюдатель
+calc_core.solver_observer = _observe_solver
+
+
+class _CacheCollector(Collector):
+    """Попадания и промахи кэшей: счётчики хранятся в самих кэшах и читаются при выдаче."""
+
+    def collect(self):
+        from app.save_to_drowio import diagram_cache
+
+        hits = CounterMetricFamily("autocalc_cache_hits", "Попадания в кэш", labels=("cache",))
+        misses = CounterMetricFamily("autocalc_cache_misses", "Промахи кэша", labels=("cache",))
+        entries = GaugeMetricFamily("autocalc_cache_entries", "Записей в кэше", labels=("cache",))
+        hits.add_metric(("diagram",), diagram_cache.hits)
+        misses.add_metric(("diagram",), diagram_cache.misses)
+        entries.add_metric(("diagram",), len(diagram_cache))
+        for func in (calc_core.pt2h, calc_core.ph, calc_core.ph2v, calc_core.ph2t, calc_core.air_calc):
+            info = func.cache_info()
+            cache = f"property_{func.__name__}"
+            hits.add_metric((cache,), info.hits)
+            misses.add_metric((cache,), info.misses)
+            entries.add_metric((cache,), info.currsize)
+        yield from (hits, misses, entries)
+
+
+class _PoolCollector(Collector):
+    """Заполнение пулов: соединения БД, потоки обработчиков и фоновых задач, процессы расчётов."""
+
+    def collect(self):
+        from anyio import to_thread
+
+        from app.database import engine
+        from app.jobs import job_executor
+        from app.process_pool import process_pool
+
+        db = GaugeMetricFamily("autocalc_db_pool_connections", "Соединения пула SQLAlchemy", labels=("state",))
+        pool = engine.pool
+        if hasattr(pool, "checkedout"):
+            db.add_metric(("checked_out",), pool.checkedout())
+            db.add_metric(("size",), pool.size())
+            db.add_metric(("overflow",), max(0, pool.overflow()))
+        yield db
+
+        # Пул потоков для синхронных обработчиков и run_in_threadpool; вне цикла событий недоступен
+        threads = GaugeMetricFamily("autocalc_threadpool_threads", "Потоки пула обработчиков", labels=("state",))
+        try:
+            limiter = to_thread.current_default_thread_limiter()
+            threads.add_metric(("busy",), limiter.borrowed_tokens)
+            threads.add_metric(("total",), limiter.total_tokens)
+        except RuntimeError:
+            pass
+        yield threads
+
+        jobs = GaugeMetricFamily("autocalc_job_workers", "Потоки фоновых задач", labels=("state",))
+        jobs.add_metric(("busy",), job_executor.running)
+        jobs.add_metric(("total",), job_executor.workers)
+        yield jobs
+        yield GaugeMetricFamily("autocalc_process_pool_workers", "Процессы пула расчётов",
+                                value=process_pool.workers)
+
+
+registry.register(_CacheCollector())
+registry.register(_PoolCollector())
+
+
+# ------------------------------ Источники событий ------------------------------ #
+_sqlalchemy_instrumented = False
+
+
+def instrument_sqlalchemy() -> None:
+    """Время каждого SQL-запроса всех движков процесса (события Engine)."""
+    global _sqlalchemy_instrumented
+    if _sqlalchemy_instrumented:
+        return
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    # Время начала храним в контексте выполнения: after_cursor_execute не вызывается для
+    # упавшего запроса, и стек в conn.info рос бы с каждой ошибкой
+    @event.listens_for(Engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, *args):  # noqa: ARG001
+        context._query_started = time.perf_counter()
+
+    @event.listens_for(Engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, *args):  # noqa: ARG001
+        started = getattr(context, "_query_started", None)
+        if started is None:
+            return
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        if operation not in ("SELECT", "INSERT", "UPDATE", "DELETE"):
+            operation = "OTHER"
+        db_query_duration.labels(operation=operation).observe(time.perf_counter() - started)
+
+    _sqlalchemy_instrumented = True
+
+
+def route_template(scope) -> str:
+    """
+    Шаблон пути найденного маршрута (/api/v1/results/5 -> /api/v1/results/{result_id});
+    без маршрута — "<unmatched>".
+
+    Шаблон берётся из scope["route"].path. У маршрутов подключённого роутера путь без
+    префикса (/results/{result_id}): префикс — часть пути запроса перед хвостом, который
+    совпал с регулярным выражением маршрута.
+    """
+    route = scope.get("route")
+    template = getattr(route, "path", None)
+    if template is None:
+        return "<unmatched>"
+    path = scope["path"]
+    regex = getattr(route, "path_regex", None)
+    if regex is None or regex.match(path):
+        return template
+    start = path.find("/", 1)
+    while start != -1:
+        if regex.match(path[start:]):
+            return path[:start] + template
+        start = path.find("/", start + 1)
+    return template
+
+
+class MetricsMiddleware:
+    """
+    Длительность HTTP-запросов по шаблону маршрута (/api/v1/results/{result_id}, а не
+    по конкретному пути): иначе число рядов метрики растёт с каждым ID.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        http_requests_in_progress.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_requests_in_progress.dec()
+            http_request_duration.labels(method=scope["method"], route=route_template(scope),
+                                         status=str(status_code)).observe(time.perf_counter() - started)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, JSON
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, JSON, Boolean
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
 from app.database import Base
@@ -68,3 +68,29 @@ class CalculationResultDB(Base):
 
     def __repr__(self):
         return f"<CalculationResultDB(stock_name='{self.stock_name}', turbine_name='{self.turbine_name}')>"
+
+
+class JobDB(Base):
+    __tablename__ = 'jobs'
+    __table_args__ = {'schema': 'autocalc'}
+
+    id = Column(String(32), primary_key=True)
+    kind = Column(String, nullable=False, index=True)
+    status = Column(String, nullable=False, index=True, default="queued")
+    priority = Column(Integer, nullable=False, default=0)
+    progress = Column(Float, nullable=False, default=0.0)
+    message = Column(String, nullable=True)
+    error = Column(String, nullable=True)
+    payload = Column(JSON, nullable=False)
+    result = Column(JSON, nullable=True)
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    # Исполнитель: host:pid — кто сейчас выполняет задачу
+    worker = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
+
+    def __repr__(self):
+        return f"<JobDB(id='{self.id}', kind='{self.kind}', status='{self.status}')>"
@@ -0,0 +1,321 @@
+from __future__ import annotations
+
+import logging
+from concurrent.futures import as_completed
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.batch import calculate_batch
+from app.calc_core import metric_names, metric_values
+from app.core.config import settings
+from app.process_pool import process_pool, worker_slot
+from app.schemas import (
+    CalculationParams,
+    Distribution,
+    MetricStatistics,
+    MonteCarloParams,
+    MonteCarloResult,
+    ValveInfo,
+)
+from app.utils import CalculationError
+
+if TYPE_CHECKING:
+    # Процессы пула импортируют модуль без БД и фоновых задач
+    from app.jobs import JobReporter
+
+logger = logging.getLogger(__name__)
+
+# Размер порции выборки: одна порция — один вызов пакетного движка
+CHUNK_SIZE = 2000
+
+# Разрешение внутренней гистограммы (по ней же считаются перцентили)
+FINE_BINS = 2048
+
+GEOMETRY_KEYS = ("clearance", "diameter", "round_radius",
+                 "len_part1", "len_part2", "len_part3", "len_part4", "len_part5")
+MODE_KEYS = ("temperature_start", "t_air")
+LIST_KEYS = ("p_values", "p_ejector")
+
+# Хвост строки аккумулятора: [n, Σ(x-c), Σ(x-c)², min, max]
+_TAIL = 5
+
+
+def nominal_value(params: CalculationParams, valve: ValveInfo, key: str) -> float:
+    """
+    Номинальное значение варьируемого входа расчёта.
+
+    Ключи: GEOMETRY_KEYS, MODE_KEYS и <список>.<индекс> для p_values/p_ejector.
+    """
+    if key in GEOMETRY_KEYS:
+        nominal = getattr(valve, key)
+    elif key in MODE_KEYS:
+        nominal = getattr(params, key)
+    elif "." in key and key.split(".", 1)[0] in LIST_KEYS:
+        name, index = key.split(".", 1)
+        values = getattr(params, name)
+        nominal = values[int(index)] if index.isdigit() and int(index) < len(values) else None
+    else:
+        raise CalculationError(f"Неизвестный варьируемый параметр: {key}")
+    if nominal is None:
+        raise CalculationError(f"Для параметра {key} не задано номинальное значение")
+    return float(nominal)
+
+
+def validate_distributions(params: CalculationParams, valve: ValveInfo,
+                           distributions: Dict[str, Distribution]) -> None:
+    """Проверяет, что все ключи распределений относятся к существующим входам расчёта."""
+    for key, dist in distributions.items():
+        nominal_value(params, valve, key)
+        if dist.kind == "normal" and (dist.std < 0 or dist.truncate <= 0):
+            raise CalculationError(f"Для {key}: std должно быть >= 0, truncate > 0")
+        if dist.kind == "uniform" and dist.lower > dist.upper:
+            raise CalculationError(f"Для {key}: lower должно быть <= upper")
+
+
+def _draw(rng: np.random.Generator, dist: Distribution, size: int) -> np.ndarray:
+    """Отклонения от номинала."""
+    if dist.kind == "uniform":
+        return rng.uniform(dist.lower, dist.upper, size)
+    z = rng.standard_normal(size)
+    # Усечённое нормальное: перевыбор значений за ±truncate·σ
+    outside = np.abs(z) > dist.truncate
+    while outside.any():
+        z[outside] = rng.standard_normal(int(outside.sum()))
+        outside = np.abs(z) > dist.truncate
+    return z * dist.std
+
+
+def sample_chunk(request: MonteCarloParams, chunk_index: int, size: int) -> Dict[str, np.ndarray]:
+    """
+    Отклонения параметров для порции выборки.
+
+    Генератор порции зависит только от seed и номера порции, поэтому
+    результат не зависит от числа процессов и порядка их выполнения.
+    """
+    rng = np.random.default_rng(np.random.SeedSequence(request.seed, spawn_key=(chunk_index,)))
+    return {key: _draw(rng, request.distributions[key], size) for key in sorted(request.distributions)}
+
+
+def evaluate_chunk(request: MonteCarloParams, valve: ValveInfo, chunk_index: int,
+                   size: int) -> Tuple[np.ndarray, int]:
+    """
+    Расчёт порции выборки пакетным движком.
+
+    Returns:
+        (значения показателей (m, n_metrics) для успешных выборок, число неудачных).
+    """
+    deviations = sample_chunk(request, chunk_index, size)
+    params = request.params
+    cases = []
+    for i in range(size):
+        valve_update: Dict[str, float] = {}
+        params_update: Dict[str, object] = {}
+        lists = dict.fromkeys(LIST_KEYS)
+        for key, column in deviations.items():
+            if key in GEOMETRY_KEYS:
+                valve_update[key] = getattr(valve, key) + float(column[i])
+            elif key in MODE_KEYS:
+                params_update[key] = getattr(params, key) + float(column[i])
+            else:
+                name, index = key.split(".", 1)
+                if lists[name] is None:
+                    lists[name] = list(getattr(params, name))
+                lists[name][int(index)] += float(column[i])
+        params_update.update({name: values for name, values in lists.items() if values is not None})
+        cases.append((params.model_copy(update=params_update), valve.model_copy(update=valve_update)))
+
+    count_parts = valve.count_parts or len([x for x in valve.section_lengths if x is not None])
+    rows = [metric_values(outcome) for outcome in calculate_batch(cases)
+            if not isinstance(outcome, CalculationError)]
+    values = np.array(rows, dtype=float).reshape(-1, len(metric_names(count_parts)))
+    return values, size - len(rows)
+
+
+def _new_accumulator(n_metrics: int, slots: int = 1, buffer=None) -> np.ndarray:
+    """Аккумулятор (slots, n_metrics, [underflow, bins..., overflow, n, s1, s2, min, max])."""
+    shape = (slots, n_metrics, FINE_BINS + 2 + _TAIL)
+    acc = np.ndarray(shape, dtype=np.float64, buffer=buffer) if buffer is not None else np.empty(shape)
+    acc[...] = 0.0
+    acc[..., -2] = np.inf
+    acc[..., -1] = -np.inf
+    return acc
+
+
+def accumulate(acc: np.ndarray, values: np.ndarray, lo: np.ndarray, hi: np.ndarray, shift: np.ndarray) -> None:
+    """Добавляет значения (m, n_metrics) в строку аккумулятора acc (n_metrics, ...)."""
+    if values.size == 0:
+        return
+    width = (hi - lo) / FINE_BINS
+    # Индекс 0 — underflow, FINE_BINS + 1 — overflow
+    index = np.clip(np.floor((values - lo) / width).astype(np.int64) + 1, 0, FINE_BINS + 1)
+    for j in range(values.shape[1]):
+        acc[j, : FINE_BINS + 2] += np.bincount(index[:, j], minlength=FINE_BINS + 2)
+    centered = values - shift
+    acc[:, -5] += len(values)
+    acc[:, -4] += centered.sum(axis=0)
+    acc[:, -3] += (centered ** 2).sum(axis=0)
+    acc[:, -2] = np.minimum(acc[:, -2], values.min(axis=0))
+    acc[:, -1] = np.maximum(acc[:, -1], values.max(axis=0))
+
+
+def _percentile(counts: np.ndarray, edges: np.ndarray, vmin: float, vmax: float, q: float) -> float:
+    """Перцентиль по гистограмме [underflow, bins..., overflow] с линейной интерполяцией в бине."""
+    total = counts.sum()
+    target = q / 100.0 * total
+    cumulative = np.cumsum(counts)
+    k = int(np.searchsorted(cumulative, target, side="left"))
+    k = min(k, len(counts) - 1)
+    below = cumulative[k - 1] if k > 0 else 0.0
+    fraction = (target - below) / counts[k] if counts[k] > 0 else 0.0
+    left = vmin if k == 0 else edges[k - 1]
+    right = vmax if k == len(counts) - 1 else edges[k]
+    left, right = max(left, vmin), min(right, vmax)
+    return float(left + fraction * (right - left))
+
+
+def summarize(acc: np.ndarray, names: List[str], lo: np.ndarray, hi: np.ndarray, shift: np.ndarray,
+              bins: int, percentiles: List[float]) -> Dict[str, MetricStatistics]:
+    """Статистика по показателям из слитого аккумулятора (n_metrics, ...)."""
+    group = max(1, FINE_BINS // bins)
+    metrics = {}
+    for j, name in enumerate(names):
+        row = acc[j]
+        counts = row[: FINE_BINS + 2]
+        n, s1, s2, vmin, vmax = row[-5:]
+        if n == 0:
+            continue
+        mean = shift[j] + s1 / n
+        var = max(s2 / n - (s1 / n) ** 2, 0.0) * (n / (n - 1) if n > 1 else 0.0)
+        edges = np.linspace(lo[j], hi[j], FINE_BINS + 1)
+        inner = counts[1:-1]
+        used = (FINE_BINS // group) * group
+        coarse = inner[:used].reshape(-1, group).sum(axis=1)
+        coarse[-1] += inner[used:].sum()
+        metrics[name] = MetricStatistics(
+            mean=float(mean),
+            std=float(np.sqrt(var)),
+            min=float(vmin),
+            max=float(vmax),
+            percentiles={f"p{q:g}": _percentile(counts, edges, vmin, vmax, q) for q in percentiles},
+            histogram_edges=[float(e) for e in np.append(edges[:used:group], edges[-1])],
+            histogram_counts=[int(c) for c in coarse],
+            outside_histogram=int(counts[0] + counts[-1]),
+        )
+    return metrics
+
+
+# ------------------------------ Пул процессов ------------------------------ #
+def _run_chunk(job: Dict) -> int:
+    """Задача процесса пула: расчёт порции и накопление в своей строке общей памяти."""
+    shm = shared_memory.SharedMemory(name=job["shm_name"])
+    try:
+        acc = np.ndarray(job["shape"], dtype=np.float64, buffer=shm.buf)
+        values, failed = evaluate_chunk(job["request"], job["valve"], job["chunk_index"], job["size"])
+        accumulate(acc[worker_slot()], values, job["lo"], job["hi"], job["shift"])
+        del acc
+        return failed
+    finally:
+        shm.close()
+
+
+def run_monte_carlo(request: MonteCarloParams, valve: ValveInfo,
+                    workers: Optional[int] = None,
+                    reporter: Optional[JobReporter] = None) -> MonteCarloResult:
+    """
+    Монте-Карло по допускам геометрии и режима.
+
+    Первая порция считается в текущем процессе и задаёт диапазоны гистограмм,
+    остальные распределяются по пулу процессов. Каждый процесс копит гистограммы
+    и моменты в своей строке массива в общей памяти, поэтому память не зависит
+    от объёма выборки. В фоновой задаче прогресс и отмена проверяются после каждой порции.
+    """
+    validate_distributions(request.params, valve, request.distributions)
+    workers = settings.MONTE_CARLO_WORKERS if workers is None else workers
+    count_parts = valve.count_parts or len([x for x in valve.section_lengths if x is not None])
+    names = metric_names(count_parts)
+    sizes = [min(CHUNK_SIZE, request.samples - start) for start in range(0, request.samples, CHUNK_SIZE)]
+
+    pilot, failed = evaluate_chunk(request, valve, 0, sizes[0])
+    if len(pilot) == 0:
+        raise CalculationError("Расчёт не имеет решения ни для одной выборки первой порции")
+    vmin, vmax = pilot.min(axis=0), pilot.max(axis=0)
+    span = np.maximum(vmax - vmin, np.maximum(np.abs(vmax) * 1e-6, 1e-12))
+    lo, hi, shift = vmin - 0.5 * span, vmax + 0.5 * span, pilot.mean(axis=0)
+
+    total = _new_accumulator(len(names))
+    accumulate(total[0], pilot, lo, hi, shift)
+    rest = list(enumerate(sizes))[1:]
+
+    def chunk_done(done: int) -> None:
+        if reporter is not None:
+            reporter.update(done / len(sizes), f"порций {done}/{len(sizes)}")
+            reporter.check_cancelled()
+
+    chunk_done(1)
+
+    if rest and workers > 0:
+        executor, slots = process_pool.get(workers)
+        probe = _new_accumulator(len(names), slots)
+        shm = shared_memory.SharedMemory(create=True, size=probe.nbytes)
+        try:
+            shared = _new_accumulator(len(names), slots, buffer=shm.buf)
+            jobs = [{"shm_name": shm.name, "shape": shared.shape, "request": request, "valve": valve,
+                     "chunk_index": index, "size": size, "lo": lo, "hi": hi, "shift": shift}
+                    for index, size in rest]
+            futures = [executor.submit(_run_chunk, job) for job in jobs]
+            try:
+                for done, future in enumerate(as_completed(futures), start=2):
+                    failed += future.result()
+                    chunk_done(done)
+            except BrokenProcessPool:
+                process_pool.reset()
+                raise
+            finally:
+                # Отмена задачи: оставшиеся порции не запускаем, начатые дожидаемся (общая память)
+                for future in futures:
+                    future.cancel()
+                for future in futures:
+                    if not future.cancelled():
+                        future.exception()
+            merged = shared.sum(axis=0)
+            merged[:, -2] = shared[..., -2].min(axis=0)
+            merged[:, -1] = shared[..., -1].max(axis=0)
+            del shared
+        finally:
+            shm.close()
+            shm.unlink()
+        total[0, :, :-2] += merged[:, :-2]
+        total[0, :, -2] = np.minimum(total[0, :, -2], merged[:, -2])
+        total[0, :, -1] = np.maximum(total[0, :, -1], merged[:, -1])
+    else:
+        for index, size in rest:
+            values, chunk_failed = evaluate_chunk(request, valve, index, size)
+            accumulate(total[0], values, lo, hi, shift)
+            failed += chunk_failed
+            chunk_done(index + 1)
+
+    logger.info(f"Монте-Карло: {request.samples} выборок, неудачных {failed}, порций {len(sizes)}")
+    return MonteCarloResult(
+        samples=request.samples,
+        failed=int(failed),
+        seed=request.seed,
+        metrics=summarize(total[0], names, lo, hi, shift, request.bins, request.percentiles),
+    )
+
+
+def monte_carlo_job(payload: Dict, reporter: JobReporter) -> Dict:
+    """Обработчик фоновой задачи Монте-Карло (payload — MonteCarloParams)."""
+    request = MonteCarloParams.model_validate(payload)
+    if request.samples > settings.MONTE_CARLO_MAX_SAMPLES:
+        raise CalculationError(f"Объём выборки больше допустимого ({settings.MONTE_CARLO_MAX_SAMPLES})")
+    from app import crud
+
+    with reporter.session() as db:
+        valve = crud.get_valve_for_params(db, request.params)
+        if valve is None:
+            raise CalculationError(f"Клапан '{request.params.valve_id or request.params.valve_drawing}' не найден")
+        valve = ValveInfo.model_validate(valve)
+    return run_monte_carlo(request, valve, reporter=reporter).model_dump(mode="json")
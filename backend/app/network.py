@@ -0,0 +1,245 @@
+from __future__ import annotations
+
+import logging
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from app import tracing
+from app.batch import check_part_rows, part_props_detection_batch
+from app.schemas import CalculationParams, ValveInfo
+from app.calc_core import air_calc, ph
+from app.utils import CalculationError, ValveCalculator, convert_pressure_to_mpa, expected_suctions
+
+logger = logging.getLogger(__name__)
+
+# Атмосферное давление на входе воздушного участка, МПа (как в ValveCalculator)
+P_ATM_MPA = 0.1013
+
+
+class NetworkValveCalculator(ValveCalculator):
+    """
+    Сетевой режим: давления в промежуточных камерах P2..Pn-1 — неизвестные.
+
+    Модель уплотнения — цепочка камер: участок k течёт из камеры k в камеру k+1,
+    давление последней камеры равно последнему давлению отсоса эжектора, воздух
+    подсасывается из атмосферы в последнюю камеру. Из камеры 2 пар уходит по
+    линии в деаэратор, из камер 3..n-1 — по линиям в отсосы эжектора
+    (p_ejector[0], p_ejector[1], ...). Линия — отверстие с эффективной площадью
+    line_areas[i] (обратного тока нет).
+
+    Балансы камер G_in - G_out - G_line = 0 решаются демпфированным методом Ньютона
+    с якобианом по конечным разностям; начальное приближение — заданные p_values.
+    Все расходы по участкам для базового состояния, возмущений якобиана и пробных
+    шагов считаются одним вызовом пакетной бисекции.
+    """
+
+    def __init__(self, params: CalculationParams, valve_info: ValveInfo):
+        super().__init__(params, valve_info)
+        options = params.network
+        if options is None:
+            raise CalculationError("Не заданы параметры сетевого режима (network).")
+
+        n = self.count_parts
+        self.n_unknowns = max(n - 2, 0)
+        if len(options.line_areas) != self.n_unknowns:
+            raise CalculationError(
+                f"Ожидалось {self.n_unknowns} площадей линий отсоса (камеры 2..{n - 1}), "
+                f"получено {len(options.line_areas)}."
+            )
+        if any(a < 0 for a in options.line_areas):
+            raise CalculationError("Площади линий отсоса должны быть >= 0.")
+
+        pressure_unit_input = getattr(params, "pressure_unit", 3)
+        self.line_areas = np.array(options.line_areas, dtype=float) * 1e-6  # мм² -> м²
+        p_deaerator = options.p_deaerator if options.p_deaerator is not None else params.p_values[1]
+        self.p_deaerator = convert_pressure_to_mpa(p_deaerator, unit=pressure_unit_input)
+        # Давления стока для линий камер 2..n-1: деаэратор, затем отсосы эжектора
+        self.sink_pressures = np.array(([self.p_deaerator] + self.p_suctions)[: self.n_unknowns], dtype=float)
+        self.p_last = self.p_suctions[expected_suctions(n) - 1]
+
+        self.max_iterations = int(options.max_iterations)
+        self.tolerance = float(options.tolerance)
+        self.iterations = 0
+        self.residual = float("nan")
+        self.line_flows = np.zeros(self.n_unknowns)
+        self._steam_cache: Dict[float, Tuple[float, float]] = {}
+
+    # ------------------------------ Свойства пара ------------------------------ #
+    def _steam_props(self, p_mpa: float) -> Tuple[float, float]:
+        """(v, μ) пара при давлении p и энтальпии на входе (дросселирование — h = const)."""
+        props = self._steam_cache.get(p_mpa)
+        if props is None:
+            props = (ph(p_mpa, self.enthalpy_steam, 3), ph(p_mpa, self.enthalpy_steam, 24))
+            self._steam_cache[p_mpa] = props
+        return props
+
+    def _chains(self, states: np.ndarray) -> np.ndarray:
+        """Полные цепочки давлений [P1, x..., p_last] для набора состояний (m, n_unknowns)."""
+        m = states.shape[0]
+        return np.hstack([
+            np.full((m, 1), self.P_values[0]), states, np.full((m, 1), self.p_last),
+        ])
+
+    def _is_monotone(self, state: np.ndarray) -> bool:
+        chain = np.concatenate([[self.P_values[0]], state, [self.p_last]])
+        return bool(np.all(np.diff(chain) < 0))
+
+    # ------------------------------ Балансы камер ------------------------------ #
+    def _evaluate(self, states: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Расходы паровых участков, линий отсоса и невязки балансов для набора состояний.
+
+        Returns:
+            (G участков (m, n-1), G линий (m, n_unknowns), невязки (m, n_unknowns)), т/ч.
+        """
+        chains = self._chains(states)
+        m, n_nodes = chains.shape
+        n_steam = n_nodes - 1
+
+        p1 = chains[:, :-1].ravel()
+        p2 = chains[:, 1:].ravel()
+        props = np.array([self._steam_props(float(p)) for p in p1])
+        v, mu = props[:, 0], props[:, 1]
+        lengths = np.tile(self.len_parts[:n_steam], m)
+        ones = np.ones_like(p1)
+
+        p1, errors = check_part_rows(p1, p2, v, mu, lengths, self.delta_clearance * ones, self.S * ones)
+        first_error = next((e for e in errors if e is not None), None)
+        if first_error is not None:
+            raise CalculationError(first_error)
+        g = part_props_detection_batch(
+            p1, p2, v, mu, lengths, self.delta_clearance * ones, self.S * ones,
+            float(self.KSI) * ones, np.zeros_like(p1, dtype=bool),
+        ).reshape(m, n_steam)
+
+        chambers = states
+        v_chambers = props[:, 0].reshape(m, n_steam)[:, 1:]
+        with np.errstate(invalid="ignore"):
+            drive = np.maximum(chambers ** 2 - self.sink_pressures ** 2, 0.0) * 1e12 / (chambers * 1e6 * v_chambers)
+        lines = self.line_areas * np.sqrt(drive) * 3.6
+
+        residual = g[:, :-1] - g[:, 1:] - lines
+        return g, lines, residual
+
+    def _solve_network(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Демпфированный Ньютон по давлениям камер. Возвращает (давления, G участков, G линий)."""
+        x = np.array(self.P_values[1: 1 + self.n_unknowns], dtype=float)
+        if not self._is_monotone(x):
+            # Начальное приближение вне допустимой области — равномерно по цепочке
+            x = np.linspace(self.P_values[0], self.p_last, self.n_unknowns + 2)[1:-1]
+
+        if self.n_unknowns == 0:
+            g, lines, _ = self._evaluate(np.zeros((1, 0)))
+            self.residual = 0.0
+            return x, g[0], lines[0]
+
+        dampings = 0.5 ** np.arange(7)  # 1, 1/2, ..., 1/64
+        for iteration in range(1, self.max_iterations + 1):
+            steps = np.maximum(np.abs(x) * 1e-6, 1e-9)
+            states = np.vstack([x, x + np.diag(steps)])
+            g, lines, residual = self._evaluate(states)
+
+            f = residual[0]
+            scale = max(g[0, 0], 1e-9)
+            norm = float(np.linalg.norm(f)) / scale
+            self.iterations, self.residual = iteration, norm
+            if norm < self.tolerance:
+                return x, g[0], lines[0]
+
+            jacobian = (residual[1:] - f).T / steps
+            dx = np.linalg.lstsq(jacobian, -f, rcond=None)[0]
+
+            # Пробные шаги всех длин — одним пакетом
+            trials = [x + lam * dx for lam in dampings]
+            feasible = [t for t in trials if self._is_monotone(t)]
+            if not feasible:
+                break
+            _, _, trial_residuals = self._evaluate(np.vstack(feasible))
+            trial_norms = np.linalg.norm(trial_residuals, axis=1) / scale
+            accepted = next((i for i, tn in enumerate(trial_norms) if tn < norm), None)
+            if accepted is None:
+                break
+            x = feasible[accepted]
+
+            logger.debug("NETWORK iter=%d, residual=%.3e, P(MPa)=%s", iteration, norm, np.round(x, 6).tolist())
+
+        raise CalculationError(
+            f"Сетевой расчёт не сошёлся за {self.iterations} итераций (невязка {self.residual:.3e})."
+        )
+
+    # ------------------------------ Сценарий ------------------------------ #
+    def calculate_areas(self) -> None:
+        with tracing.span("calculator.network", **self.trace_attributes()):
+            pressures, g_steam, lines = self._solve_network()
+        n = self.count_parts
+        chain = [self.P_values[0], *pressures.tolist(), self.p_last]
+
+        for k in range(n - 1):
+            p_in = chain[k]
+            self.h_parts[k] = self.enthalpy_steam
+            self.v_parts[k], self.din_vis_parts[k] = self._steam_props(p_in)
+            self.t_parts[k] = ph(p_in, self.h_parts[k], 1)
+            self.g_parts[k] = float(g_steam[k])
+        self.P_values[1: n - 1] = pressures.tolist()
+        self.line_flows = lines
+
+        # Воздух: из атмосферы в последнюю камеру
+        last = n - 1
+        self.h_parts[last] = self.h_air
+        self.t_parts[last] = self.t_air
+        self.v_parts[last] = air_calc(self.t_air, 1)
+        self.din_vis_parts[last] = air_calc(self.t_air, 2)
+        self.g_parts[last] = self._solve_part(
+            last, P_ATM_MPA, self.p_last,
+            self.v_parts[last], self.din_vis_parts[last],
+            self.len_parts[last], self.delta_clearance, self.S, self.KSI,
+            last_part=True,
+        )
+
+        logger.info(
+            "NETWORK: iterations=%d, residual=%.3e, P(MPa)=%s, G lines=%s",
+            self.iterations, self.residual, [round(p, 6) for p in chain], np.round(lines, 6).tolist()
+        )
+
+    def deaerator_options(self) -> Tuple[float, float, float, float]:
+        """
+        Отсос в деаэратор — расход по линии из камеры 2. Возвращает (g, t, h, p).
+        """
+        if self.count_parts < 3:
+            return 0.0, 0.0, self.h_parts[1], self.P_values[1] / 0.0980665
+        p_chamber = self.P_values[1]
+        g = float(self.line_flows[0]) * self.count_valves
+        h = self.enthalpy_steam
+        return g, ph(p_chamber, h, 1), h, p_chamber / 0.0980665
+
+    def ejector_options(self) -> Tuple[Tuple[float, ...], Tuple[float, ...], Tuple[float, ...], Tuple[float, ...]]:
+        """
+        Отсосы в эжектор: линии из камер 3..n-1 и последняя камера (пар + воздух).
+        """
+        n = self.count_parts
+        g_list: List[float] = []
+        h_list: List[float] = []
+        p_list: List[float] = []
+
+        for line_index in range(1, self.n_unknowns):
+            g_list.append(float(self.line_flows[line_index]) * self.count_valves)
+            h_list.append(self.enthalpy_steam)
+            p_list.append(float(self.sink_pressures[line_index]))
+
+        g_steam, g_air = self.g_parts[n - 2], self.g_parts[n - 1]
+        den = max(g_steam + g_air, 1e-9)
+        g_list.append((g_steam + g_air) * self.count_valves)
+        h_list.append((self.enthalpy_steam * g_steam + self.h_air * g_air) / den)
+        p_list.append(self.p_last)
+
+        t_list = [ph(p, h, 1) for p, h in zip(p_list, h_list)]
+        p_list = [p / 0.0980665 for p in p_list]
+        return tuple(g_list), tuple(t_list), tuple(h_list), tuple(p_list)
+
+
+def make_calculator(params: CalculationParams, valve_info: ValveInfo) -> ValveCalculator:
+    """Калькулятор для параметров: сетевой, если задан params.network, иначе обычный."""
+    if params.network is not None:
+        return NetworkValveCalculator(params, valve_info)
+    return ValveCalculator(params, valve_info)
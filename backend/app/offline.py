@@ -0,0 +1,286 @@
+"""
+Офлайн-расчёт набора режимов без веб-сервиса и БД.
+
+Пример:
+    python -m app.offline export-catalog -o catalog.json
+    python -m app.offline run points.csv --catalog catalog.json -o results.csv --workers 8
+
+Вход — CSV или Parquet, строка — режим: valve_id или valve_drawing, turbine_name,
+temperature_start, t_air, count_valves, p_values.<i>, p_ejector.<i> (списки — до первой
+пустой ячейки). Штоки берутся из снимка справочника autocalc.stocks (JSON, export-catalog).
+Parquet требует pyarrow (pip install app[parquet]).
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from app.batch import calculate_batch
+from app.calc_core import metric_values
+from app.catalog import CatalogSnapshot
+from app.schemas import CalculationParams, ValveInfo
+from app.utils import CalculationError, expected_suctions
+
+logger = logging.getLogger(__name__)
+
+# Строк в одной задаче процесса (один вызов пакетного движка)
+CHUNK_SIZE = 500
+
+# Колонки результата — по максимальному штоку (5 участков, 3 отсоса); лишние пустые
+OUTPUT_COLUMNS = (["row", "valve", "status", "error"] + [f"G{i}" for i in range(1, 6)]
+                  + ["deaerator_g"] + [f"ejector{i}_g" for i in range(1, 4)] + ["ejector_total_g"])
+
+# Период сообщений о ходе расчёта, с
+REPORT_INTERVAL = 10.0
+
+Row = Dict[str, Any]
+
+
+# ------------------------------ Чтение и запись ------------------------------ #
+def read_rows(path: str) -> Iterator[Row]:
+    """Строки входа по одной (CSV или Parquet — по расширению)."""
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches():
+            yield from batch.to_pylist()
+        return
+    with open(path, newline="", encoding="utf-8") as f:
+        yield from csv.DictReader(f)
+
+
+def _numbered_chunks(path: str, size: int) -> Iterator[List[Tuple[int, Row]]]:
+    """Порции строк входа с номерами строк (с 1)."""
+    rows = enumerate(read_rows(path), start=1)
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class ResultWriter:
+    """Потоковая запись результатов: CSV или Parquet (по расширению), порциями."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._parquet = path.endswith(".parquet")
+        self._writer = None
+        if not self._parquet:
+            self._file = open(path, "w", newline="", encoding="utf-8")
+            self._writer = csv.DictWriter(self._file, fieldnames=OUTPUT_COLUMNS)
+            self._writer.writeheader()
+
+    def write(self, records: List[Row]) -> None:
+        if not self._parquet:
+            self._writer.writerows(records)
+            return
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = pa.schema([("row", pa.int64()), ("valve", pa.string()), ("status", pa.string()),
+                            ("error", pa.string())] + [(name, pa.float64()) for name in OUTPUT_COLUMNS[4:]])
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.path, schema)
+        self._writer.write_table(pa.Table.from_pylist(records, schema=schema))
+
+    def close(self) -> None:
+        if self._parquet:
+            if self._writer is not None:
+                self._writer.close()
+        else:
+            self._file.close()
+
+
+def load_catalog(path: str) -> List[Dict[str, Any]]:
+    """Снимок справочника: JSON-список штоков (или {"valves": [...]})."""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return data["valves"] if isinstance(data, dict) else data
+
+
+# ------------------------------ Расчёт ------------------------------ #
+def _number_list(row: Row, name: str) -> List[float]:
+    values = []
+    for i in itertools.count():
+        value = row.get(f"{name}.{i}")
+        if value is None or value == "":
+            return values
+        values.append(float(value))
+
+
+def parse_row(row: Row) -> CalculationParams:
+    """Строка входа -> CalculationParams."""
+    def optional(key: str) -> Optional[str]:
+        value = row.get(key)
+        return None if value is None or value == "" else str(value)
+
+    valve_id = optional("valve_id")
+    return CalculationParams(
+        turbine_name=optional("turbine_name"),
+        valve_drawing=optional("valve_drawing"),
+        valve_id=int(float(valve_id)) if valve_id is not None else None,
+        temperature_start=float(row["temperature_start"]),
+        t_air=float(row["t_air"]),
+        count_valves=int(float(row["count_valves"])),
+        p_values=_number_list(row, "p_values"),
+        p_ejector=_number_list(row, "p_ejector"),
+    )
+
+
+def calculate_rows(rows: List[Tuple[int, Row]], catalog: CatalogSnapshot) -> List[Row]:
+    """Расчёт порции строк одним пакетом; ошибки — в колонках status/error строки."""
+    records: List[Row] = []
+    cases = []
+    for number, row in rows:
+        record: Row = {"row": number, "valve": None, "status": "error", "error": None}
+        records.append(record)
+        try:
+            params = parse_row(row)
+        except (KeyError, ValueError) as e:
+            record["error"] = f"Неверная строка: {e}"
+            continue
+        valve = catalog.find(params)
+        if valve is None:
+            record["error"] = f"Клапан '{params.valve_id or params.valve_drawing}' не найден"
+            continue
+        record["valve"] = valve.name
+        cases.append((record, params, valve))
+
+    outcomes = calculate_batch([(params, valve) for _, params, valve in cases]) if cases else []
+    for (record, _, _), outcome in zip(cases, outcomes):
+        if isinstance(outcome, CalculationError):
+            record["error"] = outcome.message
+            continue
+        values = metric_values(outcome)
+        count_parts = len(outcome.Gi)
+        n_suctions = expected_suctions(count_parts)
+        record.update({f"G{i + 1}": values[i] for i in range(count_parts)})
+        record["deaerator_g"] = values[count_parts]
+        record.update({f"ejector{i + 1}_g": values[count_parts + 1 + i] for i in range(n_suctions)})
+        record["ejector_total_g"] = values[-1]
+        record["status"] = "ok"
+    return records
+
+
+_catalog: Optional[CatalogSnapshot] = None
+
+
+def _init_worker(valves: List[Dict[str, Any]]) -> None:
+    """Снимок справочника передаётся в процесс один раз, а не с каждой порцией."""
+    global _catalog
+    logging.getLogger("app").setLevel(logging.WARNING)
+    _catalog = _snapshot(valves)
+
+
+def _run_chunk(rows: List[Tuple[int, Row]]) -> List[Row]:
+    return calculate_rows(rows, _catalog)
+
+
+def _snapshot(valves: List[Dict[str, Any]]) -> CatalogSnapshot:
+    infos = [ValveInfo.model_validate(v) for v in valves]
+    return CatalogSnapshot({v.id if v.id is not None else -(i + 1): v for i, v in enumerate(infos)})
+
+
+def run_batch(input_path: str, catalog_path: str, output_path: str, workers: Optional[int] = None,
+              chunk_size: int = CHUNK_SIZE) -> Dict[str, float]:
+    """
+    Расчёт всех строк входа порциями в пуле процессов с записью по мере готовности.
+
+    В работе не больше 2·workers порций, поэтому память не зависит от размера входа;
+    порядок строк результата совпадает с порядком входа.
+
+    Returns:
+        Итоги: строк, успешных, ошибок, секунд, строк в секунду.
+    """
+    valves = load_catalog(catalog_path)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    chunks = _numbered_chunks(input_path, chunk_size)
+    writer = ResultWriter(output_path)
+    started = last_report = time.monotonic()
+    done = failed = 0
+
+    def consume(records: List[Row]) -> None:
+        nonlocal done, failed, last_report
+        writer.write(records)
+        done += len(records)
+        failed += sum(1 for r in records if r["status"] != "ok")
+        if time.monotonic() - last_report >= REPORT_INTERVAL:
+            last_report = time.monotonic()
+            logger.info(f"Рассчитано {done} строк ({done / (last_report - started):.0f} строк/с), ошибок {failed}")
+
+    try:
+        if workers == 0:
+            catalog = _snapshot(valves)
+            for chunk in chunks:
+                consume(calculate_rows(chunk, catalog))
+        else:
+            ctx = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                                     initializer=_init_worker, initargs=(valves,)) as executor:
+                pending: "deque[Future]" = deque()
+                for chunk in chunks:
+                    pending.append(executor.submit(_run_chunk, chunk))
+                    if len(pending) >= 2 * workers:
+                        consume(pending.popleft().result())
+                while pending:
+                    consume(pending.popleft().result())
+    finally:
+        writer.close()
+
+    elapsed = time.monotonic() - started
+    summary = {"rows": done, "ok": done - failed, "failed": failed, "seconds": round(elapsed, 3),
+               "rows_per_second": round(done / elapsed, 1) if elapsed > 0 else 0.0}
+    logger.info(f"Готово: {summary}")
+    return summary
+
+
+def export_catalog(output_path: str) -> int:
+    """Снимок autocalc.stocks в JSON (единственная операция, которой нужна БД)."""
+    from app.database import SessionLocal
+    from app.models import Valve
+
+    with SessionLocal() as db:
+        valves = [ValveInfo.model_validate(v).model_dump(exclude={"section_lengths"})
+                  for v in db.query(Valve).order_by(Valve.id).all()]
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(valves, f, ensure_ascii=False, indent=1)
+    logger.info(f"Справочник выгружен: {len(valves)} штоков -> {output_path}")
+    return len(valves)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Офлайн-расчёт режимов без веб-сервиса и БД")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export-catalog", help="Выгрузить справочник штоков из БД в JSON")
+    export.add_argument("-o", "--output", required=True)
+
+    run = commands.add_parser("run", help="Рассчитать режимы из CSV/Parquet")
+    run.add_argument("input", help="CSV или Parquet с режимами")
+    run.add_argument("--catalog", required=True, help="JSON-снимок справочника штоков")
+    run.add_argument("-o", "--output", required=True, help="Результат: .csv или .parquet")
+    run.add_argument("--workers", type=int, default=None, help="Число процессов (0 — в текущем процессе)")
+    run.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    if args.command == "export-catalog":
+        export_catalog(args.output)
+    else:
+        summary = run_batch(args.input, args.catalog, args.output, args.workers, args.chunk_size)
+        print(json.dumps(summary, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,314 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.batch import calculate_batch
+from app.core.config import settings
+from app.fingerprint import geometry_fingerprint
+from app.schemas import (
+    CalculationParams,
+    CalculationResult,
+    OperatingMapInfo,
+    OperatingMapSpec,
+    OperatingPointAnswer,
+    ValveInfo,
+)
+from app.utils import CalculationError, expected_suctions
+
+logger = logging.getLogger(__name__)
+
+# Порядок осей карты
+AXES = ("p_inlet", "t_inlet", "p_suction")
+
+# Сколько случаев отправлять в пакетный движок за раз
+BUILD_CHUNK = 2000
+
+# Как часто проверять, не перестроил ли карту другой воркер (mtime файла), с
+STAT_INTERVAL = 1.0
+
+
+def output_names(count_parts: int, n_suctions: int) -> List[str]:
+    """Имена выходов карты в порядке хранения."""
+    names = [f"G{i}" for i in range(1, count_parts + 1)]
+    names += ["deaerator_g", "deaerator_t", "deaerator_h"]
+    for i in range(1, n_suctions + 1):
+        names += [f"ejector{i}_g", f"ejector{i}_t", f"ejector{i}_h"]
+    return names
+
+
+def _flatten(result: CalculationResult) -> List[float]:
+    values = list(result.Gi) + list(result.deaerator_props[:3])
+    for props in result.ejector_props:
+        values += [props["g"], props["t"], props["h"]]
+    return values
+
+
+def _case(spec: OperatingMapSpec, p_inlet: float, t_inlet: float, p_suction: float,
+          n_suctions: int) -> CalculationParams:
+    return CalculationParams(
+        temperature_start=t_inlet,
+        t_air=spec.t_air,
+        count_valves=spec.count_valves,
+        p_ejector=[p_suction] * n_suctions,
+        p_values=[p_inlet, *spec.p_chambers],
+    )
+
+
+def _evaluate(valve_info: ValveInfo, spec: OperatingMapSpec, points: np.ndarray,
+              n_suctions: int, n_outputs: int) -> np.ndarray:
+    """Точный расчёт (пакетный движок) в точках (m, 3); некорректные точки — NaN."""
+    values = np.full((len(points), n_outputs), np.nan)
+    for start in range(0, len(points), BUILD_CHUNK):
+        chunk = points[start: start + BUILD_CHUNK]
+        cases = [(_case(spec, *map(float, point), n_suctions), valve_info) for point in chunk]
+        for offset, outcome in enumerate(calculate_batch(cases)):
+            if not isinstance(outcome, CalculationError):
+                values[start + offset] = _flatten(outcome)
+    return values
+
+
+class OperatingMap:
+    """
+    Карта режимов штока: выходы расчёта на сетке P_вх × T_вх × P_отсоса
+    и оценка погрешности интерполяции по ячейкам.
+    """
+
+    def __init__(self, axes: Sequence[np.ndarray], values: np.ndarray, cell_errors: np.ndarray,
+                 names: Sequence[str], meta: Dict):
+        self.axes = [np.asarray(a, dtype=float) for a in axes]
+        self.values = values            # (n_p, n_t, n_s, n_outputs)
+        self.cell_errors = cell_errors  # (n_p-1, n_t-1, n_s-1, n_outputs), относительная погрешность
+        self.names = list(names)
+        self.meta = meta
+        # Максимальная относительная погрешность по всей карте для каждого выхода
+        with np.errstate(all="ignore"):
+            worst = np.nanmax(self.cell_errors.reshape(-1, len(self.names)), axis=0)
+        self.error_bound: Dict[str, float] = {name: float(v) for name, v in zip(self.names, worst)}
+
+    def interpolate(self, point: Sequence[float]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Трилинейная интерполяция в точке.
+
+        Returns:
+            (значения выходов, оценка относительной погрешности ячейки).
+
+        Raises:
+            CalculationError: Точка вне карты или в области без решения.
+        """
+        index = []
+        weights = []
+        for name, axis, q in zip(AXES, self.axes, point):
+            if not axis[0] <= q <= axis[-1]:
+                raise CalculationError(f"{name}={q} вне диапазона карты [{axis[0]}, {axis[-1]}]")
+            i = min(max(int(np.searchsorted(axis, q, side="right")) - 1, 0), len(axis) - 2)
+            t = (q - axis[i]) / (axis[i + 1] - axis[i])
+            index.append(i)
+            weights.append((1.0 - t, t))
+
+        i, j, k = index
+        corners = self.values[i:i + 2, j:j + 2, k:k + 2]
+        w = np.einsum("a,b,c->abc", *map(np.asarray, weights))
+        result = np.einsum("abc,abco->o", w, corners)
+        if np.isnan(result).any():
+            raise CalculationError("Точка попадает в область карты, где расчёт не имеет решения")
+        return result, self.cell_errors[i, j, k]
+
+    # ------------------------------ Хранение ------------------------------ #
+    def save(self, path: str) -> None:
+        """Атомарно сохраняет карту в сжатый .npz."""
+        directory = os.path.dirname(path)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp.npz")
+        os.close(fd)
+        np.savez_compressed(
+            tmp_path,
+            p_inlet=self.axes[0], t_inlet=self.axes[1], p_suction=self.axes[2],
+            values=self.values, cell_errors=self.cell_errors.astype(np.float32),
+            names=np.array(self.names), meta=np.array(json.dumps(self.meta, ensure_ascii=False)),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "OperatingMap":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                axes=[data["p_inlet"], data["t_inlet"], data["p_suction"]],
+                values=data["values"],
+                cell_errors=data["cell_errors"].astype(float),
+                names=[str(n) for n in data["names"]],
+                meta=json.loads(str(data["meta"])),
+            )
+
+
+def validate_spec(valve_info: ValveInfo, spec: OperatingMapSpec) -> Tuple[int, int]:
+    """
+    Проверяет спецификацию карты для штока.
+
+    Returns:
+        (число участков, число отсосов эжектора).
+    """
+    count_parts = valve_info.count_parts or len([x for x in valve_info.section_lengths if x is not None])
+    if len(spec.p_chambers) != count_parts - 1:
+        raise CalculationError(
+            f"Ожидалось {count_parts - 1} давлений камер P2..P{count_parts}, получено {len(spec.p_chambers)}."
+        )
+    for name in AXES:
+        axis = getattr(spec, name)
+        if axis.max <= axis.min:
+            raise CalculationError(f"Диапазон {name} задан неверно: max должен быть больше min.")
+    return count_parts, expected_suctions(count_parts)
+
+
+def build_operating_map(valve_info: ValveInfo, spec: OperatingMapSpec) -> OperatingMap:
+    """
+    Строит карту режимов: точный расчёт в узлах сетки и в центрах ячеек
+    (там погрешность линейной интерполяции максимальна) — для оценки погрешности.
+    """
+    count_parts, n_suctions = validate_spec(valve_info, spec)
+    names = output_names(count_parts, n_suctions)
+    axes = [np.linspace(a.min, a.max, a.points) for a in (spec.p_inlet, spec.t_inlet, spec.p_suction)]
+
+    grid = np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1)
+    values = _evaluate(valve_info, spec, grid.reshape(-1, 3), n_suctions, len(names))
+    values = values.reshape(*grid.shape[:3], len(names))
+
+    centers_axes = [0.5 * (a[:-1] + a[1:]) for a in axes]
+    centers = np.stack(np.meshgrid(*centers_axes, indexing="ij"), axis=-1)
+    exact = _evaluate(valve_info, spec, centers.reshape(-1, 3), n_suctions, len(names))
+    interpolated = 0.125 * sum(
+        values[di: di + values.shape[0] - 1, dj: dj + values.shape[1] - 1, dk: dk + values.shape[2] - 1]
+        for di in (0, 1) for dj in (0, 1) for dk in (0, 1)
+    ).reshape(-1, len(names))
+    with np.errstate(all="ignore"):
+        scale = np.nanmax(np.abs(values.reshape(-1, len(names))), axis=0)
+        denominator = np.maximum(np.abs(exact), 1e-3 * scale)
+        cell_errors = (np.abs(interpolated - exact) / denominator).reshape(*centers.shape[:3], len(names))
+
+    meta = {
+        "valve_id": valve_info.id,
+        "fingerprint": geometry_fingerprint(valve_info),
+        "spec": spec.model_dump(),
+        "built_at": datetime.now(timezone.utc).isoformat(),
+        "invalid_nodes": int(np.isnan(values[..., 0]).sum()),
+    }
+    return OperatingMap(axes, values, cell_errors, names, meta)
+
+
+class OperatingMapStore:
+    """
+    Карты режимов на диске (по файлу на шток) с кэшем загруженных карт в памяти.
+    Файлы общие для всех воркеров; перестроение помечается файлом-маркером.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        # ID штока -> (mtime файла, момент проверки mtime, карта)
+        self._cache: Dict[int, Tuple[int, float, OperatingMap]] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, valve_id: int) -> str:
+        return os.path.join(self.directory, f"{valve_id}.npz")
+
+    def _marker(self, valve_id: int) -> str:
+        return os.path.join(self.directory, f"{valve_id}.building")
+
+    def exists(self, valve_id: int) -> bool:
+        return os.path.exists(self._path(valve_id))
+
+    def is_building(self, valve_id: int) -> bool:
+        return os.path.exists(self._marker(valve_id))
+
+    def get(self, valve_id: int) -> Optional[OperatingMap]:
+        """
+        Карта штока. Файл перечитывается, если его обновили; mtime проверяется не чаще
+        раза в STAT_INTERVAL (перестроение в этом процессе сбрасывает кэш сразу).
+        """
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(valve_id)
+        if cached is not None and now - cached[1] < STAT_INTERVAL:
+            return cached[2]
+        try:
+            mtime = os.stat(self._path(valve_id)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        if cached is not None and cached[0] == mtime:
+            operating_map = cached[2]
+        else:
+            operating_map = OperatingMap.load(self._path(valve_id))
+        with self._lock:
+            self._cache[valve_id] = (mtime, now, operating_map)
+        return operating_map
+
+    def build(self, valve_info: ValveInfo, spec: OperatingMapSpec) -> None:
+        """Строит и сохраняет карту (вызывается в фоне)."""
+        marker = self._marker(valve_info.id)
+        with open(marker, "w") as f:
+            f.write(datetime.now(timezone.utc).isoformat())
+        try:
+            operating_map = build_operating_map(valve_info, spec)
+            operating_map.save(self._path(valve_info.id))
+            with self._lock:
+                self._cache.pop(valve_info.id, None)
+            logger.info(f"Карта режимов штока {valve_info.id} построена: {operating_map.error_bound}")
+        except Exception as e:
+            logger.error(f"Не удалось построить карту режимов штока {valve_info.id}: {e}")
+        finally:
+            try:
+                os.remove(marker)
+            except FileNotFoundError:
+                pass
+
+    def rebuild_if_stale(self, valve_info: ValveInfo) -> bool:
+        """
+        Перестраивает карту с прежней спецификацией, если изменилась геометрия штока.
+
+        Returns:
+            True, если перестроение выполнялось.
+        """
+        operating_map = self.get(valve_info.id)
+        if operating_map is None or operating_map.meta.get("fingerprint") == geometry_fingerprint(valve_info):
+            return False
+        self.build(valve_info, OperatingMapSpec.model_validate(operating_map.meta["spec"]))
+        return True
+
+    def info(self, valve_id: int) -> OperatingMapInfo:
+        operating_map = self.get(valve_id)
+        if operating_map is None:
+            return OperatingMapInfo(valve_id=valve_id, status="building" if self.is_building(valve_id) else "missing")
+        return OperatingMapInfo(
+            valve_id=valve_id,
+            status="rebuilding" if self.is_building(valve_id) else "ready",
+            spec=OperatingMapSpec.model_validate(operating_map.meta["spec"]),
+            built_at=operating_map.meta["built_at"],
+            fingerprint=operating_map.meta["fingerprint"],
+            outputs=operating_map.names,
+            invalid_nodes=operating_map.meta["invalid_nodes"],
+            error_bound=operating_map.error_bound,
+        )
+
+    def query(self, valve_id: int, p_inlet: float, t_inlet: float, p_suction: float) -> OperatingPointAnswer:
+        operating_map = self.get(valve_id)
+        if operating_map is None:
+            raise KeyError(valve_id)
+        values, errors = operating_map.interpolate((p_inlet, t_inlet, p_suction))
+        return OperatingPointAnswer(
+            valve_id=valve_id,
+            values={name: float(v) for name, v in zip(operating_map.names, values)},
+            error_bound={name: float(e) for name, e in zip(operating_map.names, errors)},
+            global_error_bound=operating_map.error_bound,
+        )
+
+
+operating_maps = OperatingMapStore(
+    settings.OPERATING_MAP_DIR or os.path.join(os.path.dirname(os.path.abspath(__file__)), "operating_maps")
+)
@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+import logging
+from concurrent.futures.process import BrokenProcessPool
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy.optimize import differential_evolution
+
+from app.core.config import settings
+from app.design import FREE_VARIABLE_RE, FrozenGeometry
+from app.process_pool import process_pool
+from app.schemas import OptimizationParams, OptimizationResult, ParetoPoint, ValveInfo
+from app.utils import CalculationError
+
+if TYPE_CHECKING:
+    # Процессы пула импортируют модуль без БД и фоновых задач
+    from app.jobs import JobReporter
+
+logger = logging.getLogger(__name__)
+
+# Популяции меньше этого размера считаются в текущем процессе (пересылка дороже расчёта)
+POOL_MIN_BATCH = 512
+
+# Штраф за недопустимую геометрию в скаляризованной цели
+PENALTY = 1e6
+
+
+def _objectives(geometry: FrozenGeometry, variables: Sequence[str], x: np.ndarray,
+                total_length: Optional[Tuple[float, float]]) -> np.ndarray:
+    """
+    Цели (нагрузка на эжектор, протечка в деаэратор), т/ч, для популяции x (S, d).
+    Недопустимые кандидаты — NaN.
+    """
+    flows = geometry.part_flows({name: x[:, j] for j, name in enumerate(variables)})
+    deaerator, ejector = geometry.suction_loads(flows)
+    objectives = np.column_stack([ejector, deaerator])
+    # Отрицательная протечка в деаэратор — обратный ток, такую геометрию не рассматриваем
+    infeasible = np.isnan(objectives).any(axis=1) | (deaerator < 0)
+    if total_length is not None:
+        lengths = sum(
+            x[:, variables.index(f"len_part{i}")] if f"len_part{i}" in variables
+            else geometry.nominal[f"len_part{i}"]
+            for i in range(1, geometry.count_parts + 1)
+        )
+        infeasible |= (lengths < total_length[0]) | (lengths > total_length[1])
+    objectives[infeasible] = np.nan
+    return objectives
+
+
+def _objectives_task(args) -> np.ndarray:
+    return _objectives(*args)
+
+
+def pareto_front(points: np.ndarray) -> np.ndarray:
+    """Индексы недоминируемых точек (минимизация обеих целей)."""
+    order = np.lexsort((points[:, 1], points[:, 0]))
+    front = []
+    best_second = np.inf
+    for i in order:
+        if points[i, 1] < best_second:
+            front.append(i)
+            best_second = points[i, 1]
+    return np.array(front, dtype=int)
+
+
+class _Evaluator:
+    """Оценка популяций (в пуле процессов для больших) с архивом всех допустимых кандидатов."""
+
+    def __init__(self, geometry: FrozenGeometry, variables: List[str],
+                 total_length: Optional[Tuple[float, float]], workers: int):
+        self.geometry = geometry
+        self.variables = variables
+        self.total_length = total_length
+        self.workers = workers
+        self.evaluations = 0
+        self._x: List[np.ndarray] = []
+        self._f: List[np.ndarray] = []
+
+    def __call__(self, x: np.ndarray) -> np.ndarray:
+        self.evaluations += len(x)
+        if self.workers > 0 and len(x) >= POOL_MIN_BATCH:
+            executor, workers = process_pool.get(self.workers)
+            chunks = np.array_split(x, workers)
+            try:
+                f = np.vstack(list(executor.map(
+                    _objectives_task,
+                    [(self.geometry, self.variables, chunk, self.total_length) for chunk in chunks],
+                )))
+            except BrokenProcessPool:
+                process_pool.reset()
+                raise
+        else:
+            f = _objectives(self.geometry, self.variables, x, self.total_length)
+        feasible = ~np.isnan(f).any(axis=1)
+        self._x.append(x[feasible])
+        self._f.append(f[feasible])
+        return f
+
+    def archive(self) -> Tuple[np.ndarray, np.ndarray]:
+        if not self._x:
+            return np.empty((0, len(self.variables))), np.empty((0, 2))
+        return np.vstack(self._x), np.vstack(self._f)
+
+
+def run_optimization(request: OptimizationParams, valve: ValveInfo,
+                     reporter: Optional[JobReporter] = None,
+                     workers: Optional[int] = None) -> OptimizationResult:
+    """
+    Многокритериальная оптимизация геометрии: минимум нагрузки на эжектор и протечки в деаэратор.
+
+    Фронт Парето строится по архиву всех допустимых кандидатов из серии запусков
+    дифференциальной эволюции (scipy, vectorized) на взвешенных суммах целей с весами от 0 до 1.
+    Каждое поколение оценивается одним пакетным расчётом на замороженных термопараметрах.
+    """
+    variables = sorted(request.bounds)
+    if not variables:
+        raise CalculationError("Не задано ни одной варьируемой величины.")
+    geometry = FrozenGeometry(request.params, valve)
+    for name in variables:
+        if not FREE_VARIABLE_RE.match(name) or name not in geometry.nominal:
+            raise CalculationError(f"Неподдерживаемая варьируемая величина: {name}")
+        if not 0 < request.bounds[name].min < request.bounds[name].max:
+            raise CalculationError(f"Диапазон {name} должен удовлетворять 0 < min < max.")
+    bounds = [(request.bounds[name].min, request.bounds[name].max) for name in variables]
+    total_length = (request.total_length.min, request.total_length.max) if request.total_length else None
+
+    evaluator = _Evaluator(geometry, variables, total_length,
+                           settings.MONTE_CARLO_WORKERS if workers is None else workers)
+
+    # Масштабы целей — по номинальной геометрии (или центру диапазона). Считаются мимо
+    # архива: номинал может лежать вне границ и не должен попасть во фронт
+    nominal = np.array([[geometry.nominal[name] for name in variables]])
+    scale = _objectives(geometry, variables, nominal, total_length)[0]
+    if np.isnan(scale).any():
+        centre = np.array([[0.5 * (lo + hi) for lo, hi in bounds]])
+        scale = _objectives(geometry, variables, centre, total_length)[0]
+    scale = np.where(np.isnan(scale) | (np.abs(scale) < 1e-9), 1.0, np.abs(scale))
+
+    weights = np.linspace(0.0, 1.0, request.weights)
+    for k, w in enumerate(weights):
+        def scalarized(xt: np.ndarray, w=w) -> np.ndarray:
+            f = evaluator(np.atleast_2d(xt.T))
+            value = w * f[:, 0] / scale[0] + (1.0 - w) * f[:, 1] / scale[1]
+            return np.where(np.isnan(value), PENALTY, value)
+
+        def make_callback(k: int):
+            # scipy выбирает новый протокол, только если единственный параметр — intermediate_result,
+            # поэтому k и счётчик поколений связываем замыканием, а не аргументами по умолчанию
+            generation = [0]
+
+            def callback(intermediate_result) -> bool:  # noqa: ARG001
+                generation[0] += 1
+                if reporter is not None:
+                    reporter.update((k + generation[0] / request.max_generations) / len(weights),
+                                    f"вес {k + 1}/{len(weights)}, поколение {generation[0]}")
+                    return reporter.cancelled
+                return False
+
+            return callback
+
+        differential_evolution(
+            scalarized, bounds, vectorized=True, updating="deferred",
+            popsize=request.population, maxiter=request.max_generations,
+            seed=request.seed + k, polish=False, callback=make_callback(k), tol=1e-8,
+        )
+        if reporter is not None:
+            reporter.check_cancelled()
+
+    x, f = evaluator.archive()
+    if len(x) == 0:
+        raise CalculationError("Не найдено ни одной допустимой геометрии в заданных границах.")
+    front = pareto_front(f)
+    if len(front) > request.front_size:
+        front = front[np.round(np.linspace(0, len(front) - 1, request.front_size)).astype(int)]
+
+    logger.info(f"Оптимизация: {evaluator.evaluations} кандидатов, во фронте {len(front)} точек")
+    return OptimizationResult(
+        variables=variables,
+        front=[
+            ParetoPoint(
+                geometry={name: float(x[i, j]) for j, name in enumerate(variables)},
+                ejector_g=float(f[i, 0]),
+                deaerator_g=float(f[i, 1]),
+            )
+            for i in front
+        ],
+        evaluations=evaluator.evaluations,
+    )
+
+
+def optimization_job(payload: Dict, reporter: JobReporter) -> Dict:
+    """Обработчик фоновой задачи оптимизации (payload — OptimizationParams)."""
+    request = OptimizationParams.model_validate(payload)
+    valve = request.valve
+    if valve is None:
+        from app import crud
+
+        with reporter.session() as db:
+            found = crud.get_valve_for_params(db, request.params)
+            if found is None:
+                raise CalculationError(f"Клапан '{request.params.valve_id or request.params.valve_drawing}' не найден")
+            valve = ValveInfo.model_validate(found)
+    return run_optimization(request, valve, reporter).model_dump(mode="json")
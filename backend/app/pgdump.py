@@ -0,0 +1,224 @@
+"""
+Чтение дампа PostgreSQL в custom-формате (pg_dump -Fc, db/init.dump) без pg_restore.
+
+Нужно нагрузочному стенду и тестам: из дампа берутся только данные таблиц (блоки
+COPY), схема создаётся из моделей. Поддерживаются версии формата 1.14–1.16
+(PostgreSQL 12–17; db/init.dump — 1.16) с 4-байтными целыми и 8-байтными
+смещениями, данные без сжатия или со сжатием gzip.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import zlib
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy import DateTime, Engine, Float, Integer, JSON
+
+from app.database import Base
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DUMP = os.path.join(os.path.dirname(__file__), "..", "..", "db", "init.dump")
+
+# Таблицы в порядке загрузки (внешние ключи)
+SEED_TABLES = ("unique_turbine", "stocks", "resultcalcs")
+
+_MAGIC = b"PGDMP"
+_BLOCK_DATA = 1
+# Алгоритм сжатия в заголовке с версии 1.15 (до неё — уровень zlib, 0 — без сжатия)
+_COMPRESSION_NONE, _COMPRESSION_GZIP = 0, 1
+_COPY_ESCAPES = {"b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t", "v": "\v", "\\": "\\"}
+
+
+class DumpFormatError(Exception):
+    """Файл не является дампом поддерживаемой версии custom-формата."""
+
+
+class _Reader:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+
+    def byte(self) -> int:
+        value = self.data[self.pos]
+        self.pos += 1
+        return value
+
+    def int(self) -> int:
+        sign = self.byte()
+        value = int.from_bytes(self.data[self.pos:self.pos + 4], "little")
+        self.pos += 4
+        return -value if sign else value
+
+    def str(self) -> Optional[str]:
+        length = self.int()
+        if length < 0:
+            return None
+        value = self.data[self.pos:self.pos + length].decode("utf-8")
+        self.pos += length
+        return value
+
+    def offset(self) -> Optional[int]:
+        flag = self.byte()
+        value = int.from_bytes(self.data[self.pos:self.pos + 8], "little")
+        self.pos += 8
+        # 2 — смещение известно; иначе данных нет или дамп писался в поток
+        return value if flag == 2 else None
+
+
+def _unescape(field: str) -> Optional[str]:
+    if field == r"\N":
+        return None
+    if "\\" not in field:
+        return field
+    out, i = [], 0
+    while i < len(field):
+        ch = field[i]
+        if ch == "\\" and i + 1 < len(field):
+            out.append(_COPY_ESCAPES.get(field[i + 1], field[i + 1]))
+            i += 2
+        else:
+            out.append(ch)
+            i += 1
+    return "".join(out)
+
+
+def _copy_rows(text: str) -> Iterator[List[Optional[str]]]:
+    for line in text.split("\n"):
+        if line == r"\." or not line:
+            break
+        yield [_unescape(field) for field in line.split("\t")]
+
+
+def _columns(copy_stmt: str) -> List[str]:
+    # COPY autocalc.stocks (id, name, ...) FROM stdin;
+    inner = copy_stmt[copy_stmt.index("(") + 1:copy_stmt.index(")")]
+    return [name.strip().strip('"') for name in inner.split(",")]
+
+
+def read_table_data(path: str = DEFAULT_DUMP) -> Dict[str, List[Dict[str, Optional[str]]]]:
+    """
+    Данные таблиц из дампа: имя таблицы -> строки (столбец -> текстовое значение COPY или None).
+    """
+    with open(path, "rb") as f:
+        r = _Reader(f.read())
+    if r.data[:5] != _MAGIC:
+        raise DumpFormatError(f"{path}: не дамп pg_dump в custom-формате")
+    major, minor = r.data[5], r.data[6]
+    int_size, off_size = r.data[8], r.data[9]
+    version = (major, minor)
+    if not (1, 14) <= version <= (1, 16) or int_size != 4 or off_size != 8:
+        raise DumpFormatError(f"{path}: неподдерживаемая версия формата {major}.{minor}")
+    r.pos = 11
+    if version >= (1, 15):
+        compression = r.byte()
+        if compression not in (_COMPRESSION_NONE, _COMPRESSION_GZIP):
+            raise DumpFormatError(f"{path}: неподдерживаемое сжатие (код {compression}), нужен gzip или без сжатия")
+        compressed = compression == _COMPRESSION_GZIP
+    else:
+        compressed = r.int() != 0
+    for _ in range(7):  # время создания дампа
+        r.int()
+    r.str(), r.str(), r.str()  # имя базы, версии сервера и pg_dump
+
+    entries = []
+    for _ in range(r.int()):
+        r.int(), r.int()  # dumpId, hadDumper
+        r.str(), r.str()  # tableoid, oid
+        tag, desc = r.str(), r.str()
+        r.int()  # section
+        r.str(), r.str()  # defn, drop
+        copy_stmt = r.str()
+        r.str(), r.str(), r.str()  # namespace, tablespace, tableam
+        if version >= (1, 16):
+            r.int()  # relkind
+        r.str(), r.str()  # owner, withoids
+        while r.str() is not None:  # зависимости
+            pass
+        offset = r.offset()
+        if desc == "TABLE DATA" and offset is not None:
+            entries.append((tag, copy_stmt, offset))
+
+    tables = {}
+    for tag, copy_stmt, offset in entries:
+        r.pos = offset
+        if r.byte() != _BLOCK_DATA:
+            raise DumpFormatError(f"{path}: ожидался блок данных таблицы {tag}")
+        r.int()  # dumpId
+        chunks = []
+        while True:
+            length = r.int()
+            if length == 0:
+                break
+            chunks.append(r.data[r.pos:r.pos + length])
+            r.pos += length
+        data = b"".join(chunks)
+        text = (zlib.decompress(data) if compressed else data).decode("utf-8")
+        columns = _columns(copy_stmt)
+        tables[tag] = [dict(zip(columns, row)) for row in _copy_rows(text)]
+    return tables
+
+
+def _convert(column, value: Optional[str]):
+    if value is None:
+        return None
+    if isinstance(column.type, JSON):
+        return json.loads(value)
+    if isinstance(column.type, DateTime):
+        return datetime.fromisoformat(value)
+    if isinstance(column.type, Integer):
+        return int(value)
+    if isinstance(column.type, Float):
+        return float(value)
+    return value
+
+
+def seed_database(engine: Engine, path: str = DEFAULT_DUMP) -> Dict[str, int]:
+    """
+    Создаёт таблицы моделей и загружает в них турбины, штоки и результаты из дампа.
+
+    Строки, нарушающие ограничения моделей (шток без турбины или с повторяющимся
+    именем, результат по пропущенному штоку), пропускаются: в PostgreSQL-дампе они
+    есть, а модели их не допускают.
+
+    Returns:
+        Число загруженных строк по таблицам.
+    """
+    from app import models  # noqa: F401 — регистрирует таблицы в Base.metadata
+
+    tables = read_table_data(path)
+    Base.metadata.create_all(engine)
+    loaded = {}
+    known = {}
+    with engine.begin() as conn:
+        for name in SEED_TABLES:
+            table = Base.metadata.tables[f"autocalc.{name}"]
+            rows = []
+            unique = {c.name: set() for c in table.columns if c.unique}
+            for raw in tables.get(name, []):
+                row = {c.name: _convert(c, raw.get(c.name)) for c in table.columns if c.name in raw}
+                missing = [c.name for c in table.columns
+                           if not c.nullable and not c.primary_key and row.get(c.name) is None]
+                fks = [fk for fk in table.foreign_keys
+                       if row.get(fk.parent.name) not in known.get(fk.column.table.name, ())]
+                duplicates = [c for c, seen in unique.items() if row.get(c) in seen]
+                if missing or fks or duplicates:
+                    continue
+                for c, seen in unique.items():
+                    seen.add(row.get(c))
+                rows.append(row)
+            if rows:
+                conn.execute(table.insert(), rows)
+            known[name] = {row["id"] for row in rows}
+            loaded[name] = len(rows)
+            skipped = len(tables.get(name, [])) - len(rows)
+            if skipped:
+                logger.warning(f"{name}: пропущено строк, нарушающих ограничения моделей: {skipped}")
+            if rows and engine.dialect.name == "postgresql":
+                # Идентификаторы заданы явно: последовательность продолжается после них
+                conn.exec_driver_sql(f"SELECT setval(pg_get_serial_sequence('autocalc.{name}', 'id'), "
+                                     f"(SELECT max(id) FROM autocalc.{name}))")
+    return loaded
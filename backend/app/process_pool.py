@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_worker_slot: Optional[int] = None
+
+
+def _init_worker(counter) -> None:
+    """Каждый процесс пула получает свой номер (строку в общих массивах задач)."""
+    global _worker_slot
+    logging.getLogger("app").setLevel(logging.WARNING)
+    with counter.get_lock():
+        _worker_slot = counter.value
+        counter.value += 1
+
+
+def worker_slot() -> int:
+    """Номер текущего процесса пула (0..workers-1)."""
+    if _worker_slot is None:
+        raise RuntimeError("Функция вызвана вне процесса пула")
+    return _worker_slot
+
+
+class ProcessPool:
+    """
+    Ленивый общий пул процессов для тяжёлых расчётов (Монте-Карло, оптимизация).
+    Контекст spawn — безопасно для многопоточного веб-процесса.
+    """
+
+    def __init__(self):
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._workers = 0
+        self._lock = threading.Lock()
+
+    def get(self, workers: int) -> Tuple[ProcessPoolExecutor, int]:
+        """Пул на workers процессов (пересоздаётся, если число процессов изменилось)."""
+        with self._lock:
+            if self._executor is None or self._workers != workers:
+                if self._executor is not None:
+                    self._executor.shutdown(wait=False)
+                ctx = multiprocessing.get_context("spawn")
+                self._executor = ProcessPoolExecutor(
+                    max_workers=workers, mp_context=ctx,
+                    initializer=_init_worker, initargs=(ctx.Value("i", 0),),
+                )
+                self._workers = workers
+                logger.info(f"Запущен пул процессов на {workers} процессов")
+            return self._executor, self._workers
+
+    @property
+    def workers(self) -> int:
+        """Число процессов запущенного пула (0 — пул не запущен)."""
+        return self._workers if self._executor is not None else 0
+
+    def reset(self) -> None:
+        """Сбрасывает пул (после BrokenProcessPool)."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+process_pool = ProcessPool()
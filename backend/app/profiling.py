@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import cProfile
+import itertools
+import json
+import logging
+import os
+import pstats
+import re
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import List, Optional
+from urllib.parse import parse_qs
+
+import anyio
+
+from app.core.config import settings
+from app.schemas import ProfileFunction, ProfileInfo, ProfileReport
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-profile"
+REQUEST_ID_HEADER = b"x-request-id"
+
+# ID запроса становится именем файла
+_REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+
+# Поля pstats, по которым можно сортировать отчёт
+SORT_KEYS = ("cumulative", "tottime", "ncalls")
+
+
+class ProfileStore:
+    """
+    Профили запросов на диске: <id>.prof (формат pstats, открывается snakeviz)
+    и <id>.json с описанием запроса. Хранятся последние keep профилей.
+    """
+
+    def __init__(self, directory: str, keep: int):
+        self.directory = directory
+        self.keep = keep
+        self._lock = threading.Lock()
+
+    def _path(self, request_id: str, suffix: str) -> str:
+        if not _REQUEST_ID_RE.match(request_id):
+            raise KeyError(request_id)
+        return os.path.join(self.directory, f"{request_id}{suffix}")
+
+    def save(self, profile: cProfile.Profile, info: ProfileInfo) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        profile.dump_stats(self._path(info.request_id, ".prof"))
+        with open(self._path(info.request_id, ".json"), "w", encoding="utf-8") as f:
+            f.write(info.model_dump_json())
+        self._prune()
+
+    def _prune(self) -> None:
+        with self._lock:
+            infos = self.list()
+            for info in infos[self.keep:]:
+                for suffix in (".prof", ".json"):
+                    try:
+                        os.remove(self._path(info.request_id, suffix))
+                    except FileNotFoundError:
+                        pass
+
+    def list(self) -> List[ProfileInfo]:
+        """Профили, новые первыми."""
+        try:
+            names = [name for name in os.listdir(self.directory) if name.endswith(".json")]
+        except FileNotFoundError:
+            return []
+        infos = []
+        for name in names:
+            try:
+                with open(os.path.join(self.directory, name), encoding="utf-8") as f:
+                    infos.append(ProfileInfo.model_validate(json.load(f)))
+            except (OSError, ValueError):
+                continue
+        return sorted(infos, key=lambda info: info.created, reverse=True)
+
+    def get(self, request_id: str) -> ProfileInfo:
+        try:
+            with open(self._path(request_id, ".json"), encoding="utf-8") as f:
+                return ProfileInfo.model_validate(json.load(f))
+        except FileNotFoundError:
+            raise KeyError(request_id)
+
+    def stats_path(self, request_id: str) -> str:
+        path = self._path(request_id, ".prof")
+        if not os.path.exists(path):
+            raise KeyError(request_id)
+        return path
+
+    def report(self, request_id: str, limit: int = 30, sort: str = "cumulative") -> ProfileReport:
+        """Первые limit функций по sort (cumulative — с учётом вложенных вызовов)."""
+        info = self.get(request_id)
+        stats = pstats.Stats(self.stats_path(request_id))
+        column = {"cumulative": 3, "tottime": 2, "ncalls": 1}[sort]
+        rows = sorted(stats.stats.items(), key=lambda item: item[1][column], reverse=True)[:limit]
+        functions = [
+            ProfileFunction(function=f"{filename}:{line}({name})", ncalls=nc, primitive_calls=cc,
+                            tottime=tt, cumtime=ct)
+            for (filename, line, name), (cc, nc, tt, ct, _) in rows
+        ]
+        return ProfileReport(info=info, total_time=stats.total_tt, functions=functions)
+
+
+profile_store = ProfileStore(
+    settings.PROFILE_DIR or os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles"),
+    settings.PROFILE_KEEP,
+)
+
+
+# Запрос профилируется: его синхронную часть нельзя уводить из потока цикла событий
+_profiling: ContextVar[bool] = ContextVar("profiling", default=False)
+
+
+def is_profiling() -> bool:
+    """Текущий запрос профилируется (cProfile видит только поток цикла событий)."""
+    return _profiling.get()
+
+
+class ProfilingMiddleware:
+    """
+    Профилирование отдельных запросов cProfile.
+
+    Запрос профилируется по заголовку X-Profile: 1 или параметру ?profile=1 (кроме
+    ENVIRONMENT=production) либо по выборке: каждый PROFILE_SAMPLE_RATE-й запрос.
+    Одновременно профилируется один запрос: cProfile видит поток цикла событий, и
+    синхронная часть обработчика (расчёт, IF97, pydantic, SQLAlchemy) попадает в профиль
+    целиком; работа других запросов, вклинившаяся между await, — тоже, это учитывается
+    при чтении. ID профиля — X-Request-ID запроса или новый; он возвращается в X-Profile-Id.
+    """
+
+    def __init__(self, app, store: Optional[ProfileStore] = None):
+        self.app = app
+        self.store = store  # по умолчанию — profile_store модуля
+        self._counter = itertools.count(1)
+        self._busy = threading.Lock()
+
+    def _wanted(self, scope) -> Optional[bool]:
+        """True — по запросу клиента, False — по выборке, None — не профилировать."""
+        if settings.ENVIRONMENT != "production":
+            headers = dict(scope.get("headers") or [])
+            query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+            if headers.get(PROFILE_HEADER) in (b"1", b"true") or query.get("profile", [""])[0] in ("1", "true"):
+                return True
+        rate = settings.PROFILE_SAMPLE_RATE
+        if rate > 0 and next(self._counter) % rate == 0:
+            return False
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(f"{settings.API_V1_STR}/admin"):
+            await self.app(scope, receive, send)
+            return
+        requested = self._wanted(scope)
+        if requested is None or not self._busy.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        request_id = headers.get(REQUEST_ID_HEADER, b"").decode("latin-1")
+        if not _REQUEST_ID_RE.match(request_id):
+            request_id = uuid.uuid4().hex
+        status_code = 500
+
+        async def send_with_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message = {**message, "headers": [*message.get("headers", []),
+                                                   (b"x-profile-id", request_id.encode())]}
+            await send(message)
+
+        profile = cProfile.Profile()
+        started = time.perf_counter()
+        token = _profiling.set(True)
+        try:
+            profile.enable()
+            try:
+                await self.app(scope, receive, send_with_id)
+            finally:
+                profile.disable()
+        finally:
+            _profiling.reset(token)
+            self._busy.release()
+            info = ProfileInfo(
+                request_id=request_id, method=scope["method"], path=scope["path"], status_code=status_code,
+                duration_ms=(time.perf_counter() - started) * 1000.0, sampled=not requested,
+                created=datetime.now(timezone.utc),
+            )
+            try:
+                # Запись .prof (marshal всей статистики) — в потоке, не в цикле событий
+                await anyio.to_thread.run_sync((self.store or profile_store).save, profile, info)
+            except OSError as e:
+                logger.error(f"Не удалось сохранить профиль запроса {request_id}: {e}")
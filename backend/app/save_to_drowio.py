@@ -1,11 +1,17 @@
+import hashlib
 import logging
 import os
+import threading
 import xml.etree.ElementTree as ET
 from datetime import datetime
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
 from fastapi import HTTPException, APIRouter
-from fastapi.responses import FileResponse
-from .schemas import ValveInfo
+from fastapi.responses import Response
+from .core.config import settings
+from . import metrics
+from .diagram_cache import DiagramCache
+from .fingerprint import geometry_fingerprint
+from .schemas import CalculationResult, ValveInfo
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -62,6 +68,40 @@ class DiagramModifier:
         cell.set("value", new_value)
         logger.info(f"Обновлён параметр в элементе с id={cell_id}: {new_value}")
 
+    def upsert_text_cell(self, cell_id: str, new_value: str, x: float, y: float,
+                         width: float = 260, height: float = 30) -> None:
+        """
+        Обновляет текстовый элемент или добавляет его, если в шаблоне такого нет.
+
+        Args:
+            cell_id (str): Идентификатор элемента <mxCell>.
+            new_value (str): Значение (HTML).
+            x, y (float): Положение нового элемента на листе.
+            width, height (float): Размер нового элемента.
+        """
+        if not self.root:
+            raise ValueError("XML-шаблон не загружен")
+
+        cell = self.root.find(f".//mxCell[@id='{cell_id}']")
+        if cell is not None:
+            cell.set("value", new_value)
+            return
+
+        graph_root = self.root.find(".//mxGraphModel/root")
+        if graph_root is None:
+            raise ValueError("В шаблоне нет элемента mxGraphModel/root")
+
+        cell = ET.SubElement(graph_root, "mxCell", {
+            "id": cell_id,
+            "value": new_value,
+            "style": "text;html=1;align=left;verticalAlign=middle;whiteSpace=wrap;",
+            "vertex": "1",
+            "parent": "1",
+        })
+        ET.SubElement(cell, "mxGeometry", {
+            "x": f"{x:g}", "y": f"{y:g}", "width": f"{width:g}", "height": f"{height:g}", "as": "geometry",
+        })
+
     def save_modified_diagram(self, output_path: str) -> None:
         """
         Сохраняет изменённый XML-файл.
@@ -79,6 +119,18 @@ class DiagramModifier:
             logger.error(f"Ошибка сохранения XML-файла: {e}")
             raise HTTPException(status_code=500, detail=f"Ошибка сохранения XML-файла: {e}")
 
+    def to_bytes(self) -> bytes:
+        """
+        Сериализует изменённый XML в память (как save_modified_diagram, но без файла).
+
+        Returns:
+            bytes: Содержимое XML-файла в кодировке UTF-8.
+        """
+        if not self.tree:
+            raise ValueError("XML-шаблон не загружен")
+
+        return ET.tostring(self.tree.getroot(), encoding="utf-8", xml_declaration=True)
+
 
 # Класс для сопоставления параметров ValveInfo с элементами XML
 class ParameterMapper:
@@ -157,6 +209,48 @@ class ParameterMapper:
         return updates
 
 
+# Класс для сопоставления результатов расчёта с дополнительными элементами XML
+class ResultMapper(ParameterMapper):
+    """Формирует подписи с результатами расчёта (Gi/Ti/Hi, отсосы) для схемы."""
+
+    # Положение колонки с результатами (справа от чертежа)
+    column_x = 850
+    column_y = 40
+    row_height = 30
+
+    def map_results(self, result: CalculationResult) -> List[Tuple[str, str]]:
+        """
+        Сопоставляет результаты расчёта с элементами XML.
+
+        Args:
+            result (CalculationResult): Результат расчёта.
+
+        Returns:
+            List[Tuple[str, str]]: Пары (id элемента <mxCell>, HTML-строка) в порядке вывода.
+        """
+        suffix = f"{self.count_parts}_parts"
+        rows: List[Tuple[str, str]] = []
+        for i, (g, t, h) in enumerate(zip(result.Gi, result.Ti, result.Hi), start=1):
+            rows.append((f"result_G{i}_{suffix}", self.get_html_value(f"G{i}", f"{g:.4f} т/ч")))
+            rows.append((f"result_T{i}_{suffix}", self.get_html_value(f"T{i}", f"{t:.1f} °C")))
+            rows.append((f"result_H{i}_{suffix}", self.get_html_value(f"H{i}", f"{h:.1f} кДж/кг")))
+
+        if result.deaerator_props and result.deaerator_props[0]:
+            g, t, _, p = result.deaerator_props
+            rows.append((f"result_deaerator_{suffix}",
+                         self.get_html_value("Gд", f"{g:.4f} т/ч, {t:.1f} °C, {p:.3f} кгс/см²")))
+
+        for i, props in enumerate(result.ejector_props, start=1):
+            rows.append((f"result_ejector{i}_{suffix}",
+                         self.get_html_value(f"Gэ{i}", f"{props['g']:.4f} т/ч, {props['t']:.1f} °C, "
+                                                      f"{props['p']:.3f} кгс/см²")))
+        return rows
+
+    def positions(self, count: int) -> List[Tuple[float, float]]:
+        """Координаты для новых элементов, если их нет в шаблоне."""
+        return [(self.column_x, self.column_y + i * self.row_height) for i in range(count)]
+
+
 # Класс для генерации итогового файла
 class DiagramGenerator:
     """Класс для генерации итогового XML-файла на основе шаблона и параметров."""
@@ -179,6 +273,9 @@ class DiagramGenerator:
             4: os.path.join(templates_dir, "template_4_parts.xml"),
             5: os.path.join(templates_dir, "template_5_parts.xml")
         }
+        # Версии шаблонов: путь -> ((mtime_ns, size), sha256)
+        self._template_versions: Dict[str, Tuple[Tuple[int, int], str]] = {}
+        self._versions_lock = threading.Lock()
 
     def _validate_count_parts(self, count_parts: Optional[int]) -> int:
         """
@@ -226,6 +323,71 @@ class DiagramGenerator:
             )
         return template_path
 
+    def template_version(self, count_parts: int) -> str:
+        """
+        Возвращает версию шаблона — SHA-256 его содержимого.
+
+        Хэш пересчитывается только при изменении mtime/размера файла,
+        поэтому вызов не читает и не разбирает XML при каждом запросе.
+
+        Args:
+            count_parts (int): Количество частей клапана.
+
+        Returns:
+            str: Версия шаблона.
+        """
+        template_path = self._get_template_path(count_parts)
+        stat = os.stat(template_path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+
+        with self._versions_lock:
+            cached = self._template_versions.get(template_path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+
+        with open(template_path, "rb") as f:
+            version = hashlib.sha256(f.read()).hexdigest()
+        with self._versions_lock:
+            self._template_versions[template_path] = (stamp, version)
+        return version
+
+    def cache_key(self, valve_info: ValveInfo) -> str:
+        """
+        Ключ кэша схемы: отпечаток геометрии штока и версии шаблона.
+
+        Args:
+            valve_info (ValveInfo): Объект с параметрами клапана.
+
+        Returns:
+            str: Ключ для DiagramCache.
+        """
+        count_parts = self._validate_count_parts(valve_info.count_parts)
+        return geometry_fingerprint(valve_info, template_version=self.template_version(count_parts))
+
+    def render_diagram(self, valve_info: ValveInfo, result: Optional[CalculationResult] = None) -> bytes:
+        """
+        Формирует XML-схему с обновлёнными параметрами в памяти.
+
+        Args:
+            valve_info (ValveInfo): Объект с параметрами клапана.
+            result (Optional[CalculationResult]): Результат расчёта для подписей на схеме.
+
+        Returns:
+            bytes: Содержимое сгенерированного файла.
+        """
+        count_parts = self._validate_count_parts(valve_info.count_parts)
+        modifier = DiagramModifier(self._get_template_path(count_parts))
+        updates = ParameterMapper(count_parts).map_parameters(valve_info)
+        for cell_id, html_value in updates.items():
+            modifier.update_parameter(cell_id, html_value)
+
+        if result is not None:
+            mapper = ResultMapper(count_parts)
+            rows = mapper.map_results(result)
+            for (cell_id, html_value), (x, y) in zip(rows, mapper.positions(len(rows))):
+                modifier.upsert_text_cell(cell_id, html_value, x, y)
+        return modifier.to_bytes()
+
     def generate_diagram(self, valve_info: ValveInfo) -> str:
         """
         Генерирует XML-файл с обновлёнными параметрами.
@@ -283,8 +445,34 @@ except Exception as e:
     logger.error(f"Не удалось инициализировать DiagramGenerator: {e}")
     diagram_generator = None
 
+# Кэш готовых схем: одинаковая геометрия -> одинаковый файл
+diagram_cache = DiagramCache(settings.DIAGRAM_CACHE_SIZE, settings.DIAGRAM_CACHE_DIR)
+
 
-@router.post("/generate_scheme", response_class=FileResponse,
+def get_scheme_content(valve_info: ValveInfo) -> bytes:
+    """
+    Возвращает схему для штока, используя кэш.
+
+    При попадании в кэш XML-шаблон не читается и не разбирается.
+
+    Args:
+        valve_info (ValveInfo): Объект с параметрами клапана.
+
+    Returns:
+        bytes: Содержимое файла схемы.
+    """
+    key = diagram_generator.cache_key(valve_info)
+    content = diagram_cache.get(key)
+    if content is None:
+        with metrics.diagram_generation_duration.time():
+            content = diagram_generator.render_diagram(valve_info)
+        diagram_cache.put(key, content)
+    else:
+        logger.info(f"Схема для ключа {key[:12]}… взята из кэша")
+    return content
+
+
+@router.post("/generate_scheme", response_class=Response,
              summary="Сгенерировать схему Draw.io", tags=["diagrams"])
 async def generate_scheme(valve_info: ValveInfo):
     """
@@ -294,7 +482,7 @@ async def generate_scheme(valve_info: ValveInfo):
         valve_info (ValveInfo): Объект с параметрами клапана.
 
     Returns:
-        FileResponse: Сгенерированный XML-файл для скачивания.
+        Response: Сгенерированный XML-файл для скачивания.
 
     Raises:
         HTTPException: Если произошла ошибка при генерации файла.
@@ -303,20 +491,17 @@ async def generate_scheme(valve_info: ValveInfo):
         raise HTTPException(status_code=500, detail="Генератор диаграмм не инициализирован")
 
     try:
-        # Генерируем XML-файл с обновлёнными параметрами
-        output_path = diagram_generator.generate_diagram(valve_info)
+        # Схема из кэша или свежесгенерированная
+        content = get_scheme_content(valve_info)
 
-        # Проверяем, что файл был создан
-        if not os.path.exists(output_path):
-            logger.error(f"Файл {output_path} не был создан")
-            raise HTTPException(status_code=500, detail="Ошибка: сгенерированный файл не найден")
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"scheme_{valve_info.count_parts}_parts_{timestamp}.drawio"
 
         # Возвращаем файл для скачивания
-        return FileResponse(
-            path=output_path,
+        return Response(
+            content=content,
             media_type="application/xml",
-            filename=os.path.basename(output_path),
-            headers={"Content-Disposition": f"attachment; filename={os.path.basename(output_path)}"}
+            headers={"Content-Disposition": f"attachment; filename={filename}"}
         )
     except HTTPException as e:
         raise e
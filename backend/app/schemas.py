@@ -1,6 +1,6 @@
 from datetime import datetime
-from typing import List, Optional, Dict, Any
-from pydantic import BaseModel, computed_field
+from typing import List, Literal, Optional, Dict, Any
+from pydantic import BaseModel, Field, computed_field
 
 
 class TurbineInfo(BaseModel):
@@ -73,6 +73,15 @@ class ValveCreate(BaseModel):
     turbine_id: Optional[int]
 
 
+class NetworkOptions(BaseModel):
+    # Эффективные площади линий отсоса из промежуточных камер 2..n-1, мм² (0 — глухая камера)
+    line_areas: List[float]
+    # Давление в деаэраторе (в единицах p_values); по умолчанию — заданное P2
+    p_deaerator: Optional[float] = None
+    max_iterations: int = 50
+    tolerance: float = 1e-6  # допустимая относительная невязка балансов
+
+
 class CalculationParams(BaseModel):
     turbine_name: Optional[str] = None
     valve_drawing: Optional[str] = None
@@ -82,6 +91,25 @@ class CalculationParams(BaseModel):
     count_valves: int
     p_ejector: List[float]
     p_values: List[float]
+    # Сетевой режим: промежуточные давления P2..Pn-1 — неизвестные (p_values — начальное приближение)
+    network: Optional[NetworkOptions] = None
+
+
+class SolverDiagnostics(BaseModel):
+    part: int  # номер участка с 1
+    iterations: int
+    bracket_width: float  # итоговая ширина интервала скорости, м/с
+    velocity: float  # м/с
+    reynolds: float
+    friction_factor: float  # λ
+    regime: Literal["laminar", "transitional", "turbulent"]
+    residual: float  # w - w(G(w)) в итоговой точке, м/с
+    guards: List[str]  # сработавшие ограничители: pressure_nudge, max_iterations, velocity_bound
+
+
+class CalculationMetadata(BaseModel):
+    # Только решённые в этом расчёте участки (при пересчёте — изменившиеся)
+    solver: List[SolverDiagnostics] = []
 
 
 class CalculationResult(BaseModel):
@@ -91,6 +119,210 @@ class CalculationResult(BaseModel):
     Hi: List[float]
     deaerator_props: List[float]
     ejector_props: List[Dict[str, float]]
+    metadata: Optional[CalculationMetadata] = None
+
+
+class SuctionLoad(BaseModel):
+    p: float  # давление уровня, кгс/см²
+    g: float  # суммарный расход, т/ч
+    t: float  # температура смеси, °C
+    h: float  # энтальпия смеси, кДж/кг
+    sources: int  # сколько отсосов сведено в уровень
+
+
+class TurbineCalculationParams(BaseModel):
+    # Условия работы по штокам (valve_id или valve_drawing обязателен)
+    stocks: List[CalculationParams] = []
+    # Условия для штоков турбины, не перечисленных в stocks
+    default: Optional[CalculationParams] = None
+
+
+class StockCalculationOutcome(BaseModel):
+    valve_id: Optional[int] = None
+    valve_drawing: Optional[str] = None
+    result: Optional[CalculationResult] = None
+    error: Optional[str] = None
+
+
+class TurbineCalculationResult(BaseModel):
+    turbine_name: str
+    stocks: List[StockCalculationOutcome]
+    deaerator_loads: List[SuctionLoad]
+    ejector_loads: List[SuctionLoad]
+    total_deaerator_g: float
+    total_ejector_g: float
+
+
+class MapAxis(BaseModel):
+    min: float
+    max: float
+    points: int = Field(default=11, ge=2, le=101)
+
+
+class OperatingMapSpec(BaseModel):
+    p_inlet: MapAxis  # давление на входе, кгс/см²
+    t_inlet: MapAxis  # температура на входе, °C
+    p_suction: MapAxis  # давление отсосов эжектора (одно на все отсосы), кгс/см²
+    p_chambers: List[float]  # фиксированные давления P2..Pn, кгс/см²
+    t_air: float = 40.0
+    count_valves: int = 1
+
+
+class OperatingMapInfo(BaseModel):
+    valve_id: int
+    status: str  # missing / building / ready / rebuilding
+    spec: Optional[OperatingMapSpec] = None
+    built_at: Optional[str] = None
+    fingerprint: Optional[str] = None
+    outputs: List[str] = []
+    invalid_nodes: int = 0
+    error_bound: Dict[str, float] = {}
+
+
+class OperatingPointAnswer(BaseModel):
+    valve_id: int
+    values: Dict[str, float]
+    # Оценка относительной погрешности интерполяции: по ячейке точки и по всей карте
+    error_bound: Dict[str, float]
+    global_error_bound: Dict[str, float]
+
+
+class Distribution(BaseModel):
+    kind: Literal["normal", "uniform"] = "normal"
+    std: float = 0.0  # normal: СКО, в единицах параметра
+    truncate: float = 3.0  # normal: усечение, в σ
+    lower: float = 0.0  # uniform: нижнее отклонение от номинала
+    upper: float = 0.0  # uniform: верхнее отклонение от номинала
+
+
+class MonteCarloParams(BaseModel):
+    params: CalculationParams  # номинальный режим и шток (valve_id / valve_drawing)
+    # Ключи: clearance, diameter, round_radius, len_part1..5, temperature_start, t_air,
+    # p_values.<i>, p_ejector.<i>
+    distributions: Dict[str, Distribution]
+    samples: int = Field(default=10000, ge=1)
+    seed: int = 0
+    bins: int = Field(default=50, ge=1, le=1000)
+    percentiles: List[float] = [1, 5, 50, 95, 99]
+
+
+class MetricStatistics(BaseModel):
+    mean: float
+    std: float
+    min: float
+    max: float
+    percentiles: Dict[str, float]
+    histogram_edges: List[float]
+    histogram_counts: List[int]
+    outside_histogram: int = 0  # значения за пределами диапазона гистограммы
+
+
+class MonteCarloResult(BaseModel):
+    samples: int
+    failed: int  # выборки, для которых расчёт не имеет решения
+    seed: int
+    metrics: Dict[str, MetricStatistics]
+
+
+class SweepAxis(BaseModel):
+    name: str  # ключи как в MonteCarloParams.distributions
+    values: Optional[List[float]] = None  # абсолютные значения; иначе равномерная сетка start..stop
+    start: Optional[float] = None
+    stop: Optional[float] = None
+    points: int = Field(default=11, ge=1)
+
+
+class SweepParams(BaseModel):
+    params: CalculationParams  # базовый режим и шток (valve_id / valve_drawing)
+    valve: Optional[ValveInfo] = None  # геометрия штока; если не задана — из БД
+    axes: List[SweepAxis] = Field(min_length=1)  # точки — декартово произведение осей (последняя — быстрее)
+    chunk_size: int = Field(default=64, ge=1, le=4096)  # точек в одном пакетном расчёте
+    progress_interval: float = Field(default=1.0, gt=0)  # период событий progress, с
+
+
+class DesignParams(BaseModel):
+    params: CalculationParams  # режим и шток (valve_id / valve_drawing)
+    valve: Optional[ValveInfo] = None  # геометрия штока; если не задана — из БД
+    free_variable: str  # clearance, round_radius или len_part<i>
+    target: str  # G<i>, deaerator, ejector<i> или ejector_total
+    target_value: float  # т/ч
+    bounds: Optional[List[float]] = Field(default=None, min_length=2, max_length=2)  # [min, max], мм
+
+
+class DesignResult(BaseModel):
+    free_variable: str
+    value: float
+    target: str
+    target_value: float
+    achieved: float  # значение цели при найденной величине
+    evaluations: int  # сколько значений свободной величины рассчитано
+    valve: ValveInfo  # геометрия с найденным значением
+    result: CalculationResult  # полный расчёт найденной геометрии
+
+
+class Bounds(BaseModel):
+    min: float
+    max: float
+
+
+class OptimizationParams(BaseModel):
+    params: CalculationParams  # режим и шток (valve_id / valve_drawing)
+    valve: Optional[ValveInfo] = None  # геометрия штока; если не задана — из БД
+    bounds: Dict[str, Bounds]  # clearance, round_radius, len_part<i>, мм
+    total_length: Optional[Bounds] = None  # ограничение на сумму длин участков, мм
+    weights: int = Field(default=7, ge=2, le=33)  # число весов скаляризации
+    population: int = Field(default=15, ge=5, le=100)  # множитель размера популяции (на переменную)
+    max_generations: int = Field(default=60, ge=1, le=1000)
+    front_size: int = Field(default=50, ge=2, le=500)
+    seed: int = 0
+
+
+class ParetoPoint(BaseModel):
+    geometry: Dict[str, float]
+    ejector_g: float  # суммарная нагрузка на эжектор, т/ч
+    deaerator_g: float  # протечка в деаэратор, т/ч
+
+
+class OptimizationResult(BaseModel):
+    variables: List[str]
+    front: List[ParetoPoint]  # по возрастанию ejector_g
+    evaluations: int
+
+
+class JobInfo(BaseModel):
+    id: str
+    kind: str
+    status: str  # queued / running / done / failed / cancelled
+    priority: int = 0
+    progress: float = 0.0  # 0..1
+    message: Optional[str] = None
+    error: Optional[str] = None
+    attempts: int = 0
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class JobSubmit(BaseModel):
+    kind: str  # calculate, monte_carlo, optimization
+    payload: Dict[str, Any]  # параметры, как в соответствующем синхронном эндпоинте
+    priority: int = 0  # больше — раньше
+
+
+class JobList(BaseModel):
+    total: int
+    items: List[JobInfo]
+
+
+class JobResultPage(BaseModel):
+    job_id: str
+    total: Optional[int] = None  # число элементов в постраничном поле результата
+    offset: int = 0
+    limit: Optional[int] = None
+    result: Dict[str, Any]
 
 
 class TurbineValves(BaseModel):
@@ -107,6 +339,26 @@ class ErrorResponse(BaseModel):
     detail: Optional[str] = None
 
 
+class SensitivityReport(BaseModel):
+    outputs: List[str]  # G1..Gn
+    inputs: List[str]  # clearance, diameter, ..., p_values.<i>, p_ejector.<i>, temperature_start, t_air
+    steps: Dict[str, float]  # шаг разности по каждому входу, в единицах входа
+    # d(G, т/ч)/d(вход): jacobian[выход][вход]; None — обе стороны вне области решения
+    jacobian: Dict[str, Dict[str, Optional[float]]]
+
+
+class RecalculateParams(BaseModel):
+    # Входы режима: t_air, temperature_start, p_values.<i>, p_ejector.<i> (геометрия штока — из справочника)
+    changes: Dict[str, float] = Field(min_length=1)
+
+
+class RecalculationInfo(BaseModel):
+    base_result_id: int
+    changed_inputs: List[str]
+    recomputed_parts: List[int]  # номера участков с 1, для которых заново решалась задача расхода
+    reused_parts: List[int]
+
+
 class CalculationResultDB(BaseModel):
     id: int
     user_name: Optional[str] = None
@@ -115,6 +367,105 @@ class CalculationResultDB(BaseModel):
     calc_timestamp: datetime
     input_data: dict[str, Any]
     output_data: dict[str, Any]
+    sensitivity: Optional[SensitivityReport] = None  # только по запросу, в БД не сохраняется
+    recalculation: Optional[RecalculationInfo] = None  # только для /results/{id}/recalculate
 
     class Config:
         from_attributes = True
+
+
+class ProfileInfo(BaseModel):
+    request_id: str
+    method: str
+    path: str
+    status_code: int
+    duration_ms: float
+    sampled: bool  # True — по выборке, False — по запросу клиента
+    created: datetime
+
+
+class ProfileFunction(BaseModel):
+    function: str  # файл:строка(функция)
+    ncalls: int
+    primitive_calls: int
+    tottime: float  # с, без вложенных вызовов
+    cumtime: float  # с, с вложенными вызовами
+
+
+class ProfileReport(BaseModel):
+    info: ProfileInfo
+    total_time: float
+    functions: List[ProfileFunction]
+
+
+class ObjectCount(BaseModel):
+    type: str
+    count: int
+
+
+class WorkerMemory(BaseModel):
+    pid: int
+    rss_bytes: Optional[int] = None
+    current: bool  # воркер, ответивший на запрос
+
+
+class MemoryStats(BaseModel):
+    pid: int
+    rss_bytes: Optional[int] = None  # None вне Linux
+    peak_rss_bytes: int
+    gc_objects: int
+    gc_counts: List[int]  # объекты по поколениям gc с последней сборки
+    orm_objects: int  # живые экземпляры моделей SQLAlchemy
+    top_types: List[ObjectCount]
+    caches: Dict[str, int]
+    tracemalloc: bool
+    traced_bytes: Optional[int] = None
+    traced_peak_bytes: Optional[int] = None
+    workers: List[WorkerMemory]
+
+
+class AllocationSite(BaseModel):
+    location: str  # файл:строка
+    size_bytes: int
+    size_diff_bytes: int  # рост за интервал (для текущих выделений — равен size_bytes)
+    count: int
+    count_diff: int
+    traceback: Optional[List[str]] = None  # при group=traceback
+
+
+class MemoryDiff(BaseModel):
+    pid: int
+    seconds: float
+    group: str
+    size_diff_bytes: int
+    rss_before_bytes: Optional[int] = None
+    rss_after_bytes: Optional[int] = None
+    objects_before: int
+    objects_after: int
+    sites: List[AllocationSite]
+
+
+class TraceSpan(BaseModel):
+    name: str
+    span_id: str
+    parent_id: Optional[str] = None
+    start_offset_ms: float  # от начала запроса
+    duration_ms: Optional[float] = None  # None — спан не закрыт
+    attributes: Dict[str, Any] = {}
+    error: Optional[str] = None
+    children: List["TraceSpan"] = []
+
+
+class TraceSummary(BaseModel):
+    trace_id: str
+    pid: int
+    name: str  # метод и шаблон маршрута
+    started: datetime
+    duration_ms: float
+    span_count: int
+    dropped_spans: int  # не записаны сверх предела спанов трассы
+    attributes: Dict[str, Any]  # корневого спана: статус, шток, число участков
+
+
+class TraceInfo(TraceSummary):
+    root: TraceSpan
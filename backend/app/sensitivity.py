@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from app.batch import calculate_batch
+from app.schemas import CalculationParams, SensitivityReport, ValveInfo
+from app.utils import CalculationError, expected_suctions
+
+logger = logging.getLogger(__name__)
+
+# Точность бисекции по скорости для производных: при штатной (1e-3 м/с) G(x)
+# ступенчатая на масштабе ~1e-4 относительных, и разности дают шум
+SOLVER_TOLERANCE = 1e-9
+
+# Относительный шаг центральной разности (G гладкая при SOLVER_TOLERANCE)
+RELATIVE_STEP = 1e-5
+
+
+def sensitivity_inputs(params: CalculationParams, valve: ValveInfo) -> List[Tuple[str, float]]:
+    """Варьируемые входы расчёта и их номинальные значения."""
+    count_parts = valve.count_parts or len([x for x in valve.section_lengths if x is not None])
+    inputs = [(key, getattr(valve, key)) for key in ("clearance", "diameter", "round_radius")]
+    inputs += [(f"len_part{i}", getattr(valve, f"len_part{i}")) for i in range(1, count_parts + 1)]
+    inputs += [(f"p_values.{i}", p) for i, p in enumerate(params.p_values[:count_parts])]
+    inputs += [(f"p_ejector.{i}", p) for i, p in enumerate(params.p_ejector[:expected_suctions(count_parts)])]
+    inputs += [("temperature_start", params.temperature_start), ("t_air", params.t_air)]
+    return [(key, float(value)) for key, value in inputs if value is not None]
+
+
+def perturbed(params: CalculationParams, valve: ValveInfo, key: str,
+              value: float) -> Tuple[CalculationParams, ValveInfo]:
+    """
+    Копии режима и штока с одним изменённым входом (ключи как в развёртке: t_air,
+    temperature_start, p_values.<i>, p_ejector.<i>, геометрия штока); исходные не меняются.
+    """
+    if "." in key:
+        name, index = key.split(".", 1)
+        values = list(getattr(params, name))
+        values[int(index)] = value
+        return params.model_copy(update={name: values}), valve
+    if key in ("temperature_start", "t_air"):
+        return params.model_copy(update={key: value}), valve
+    return params, valve.model_copy(update={key: value})
+
+
+def sensitivity_report(params: CalculationParams, valve: ValveInfo) -> SensitivityReport:
+    """
+    Локальная чувствительность d(Gi)/d(вход) центральными разностями.
+
+    Базовая точка и все 2N возмущений считаются одним вызовом пакетного движка.
+    Если возмущение в одну сторону выводит расчёт из области решения
+    (например, P1 <= P2), используется односторонняя разность.
+    """
+    inputs = sensitivity_inputs(params, valve)
+    steps = {key: RELATIVE_STEP * max(abs(value), 1.0) for key, value in inputs}
+
+    cases = [(params, valve)]
+    for key, value in inputs:
+        cases.append(perturbed(params, valve, key, value + steps[key]))
+        cases.append(perturbed(params, valve, key, value - steps[key]))
+    outcomes = calculate_batch(cases, tolerance=SOLVER_TOLERANCE)
+
+    base = outcomes[0]
+    if isinstance(base, CalculationError):
+        raise base
+    outputs = [f"G{i}" for i in range(1, len(base.Gi) + 1)]
+    jacobian: Dict[str, Dict[str, Optional[float]]] = {name: {} for name in outputs}
+
+    for n, (key, _) in enumerate(inputs):
+        plus, minus = outcomes[1 + 2 * n], outcomes[2 + 2 * n]
+        h = steps[key]
+        for i, name in enumerate(outputs):
+            if not isinstance(plus, CalculationError) and not isinstance(minus, CalculationError):
+                derivative = (plus.Gi[i] - minus.Gi[i]) / (2 * h)
+            elif not isinstance(plus, CalculationError):
+                derivative = (plus.Gi[i] - base.Gi[i]) / h
+            elif not isinstance(minus, CalculationError):
+                derivative = (base.Gi[i] - minus.Gi[i]) / h
+            else:
+                derivative = None
+            jacobian[name][key] = derivative
+
+    return SensitivityReport(
+        outputs=outputs,
+        inputs=[key for key, _ in inputs],
+        steps=steps,
+        jacobian=jacobian,
+    )
@@ -0,0 +1,246 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import json
+import logging
+import time
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Tuple, TypeVar
+
+import numpy as np
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from app.batch import calculate_batch
+from app.catalog import CatalogSnapshot
+from app.core.config import settings
+from app.monte_carlo import nominal_value
+from app.schemas import CalculationParams, CalculationResult, SweepAxis, SweepParams, ValveInfo
+from app.sensitivity import perturbed
+from app.utils import CalculationError
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Конвейер потоковых расчётов — цепочка ленивых генераторов:
+#   источник случаев -> порции по chunk_size -> calculate_batch -> события.
+# Следующая порция считается только когда потребитель забрал все события
+# предыдущей, поэтому медленный клиент тормозит расчёт, а не раздувает буфер:
+# в памяти не больше одной порции.
+
+
+def chunked(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    """Разбивает поток на списки по size элементов."""
+    iterator = iter(items)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def calculate_stream(cases: Iterable[Tuple[Any, CalculationParams, ValveInfo]],
+                     chunk_size: int) -> Iterator[Tuple[Any, CalculationResult | CalculationError]]:
+    """
+    Пакетный расчёт потока случаев (ключ, параметры, шток) порциями.
+
+    Yields:
+        (ключ, CalculationResult или CalculationError) в порядке поступления.
+    """
+    for chunk in chunked(cases, chunk_size):
+        outcomes = calculate_batch([(params, valve) for _, params, valve in chunk])
+        for (key, _, _), outcome in zip(chunk, outcomes):
+            yield key, outcome
+
+
+# ------------------------------ Развёртка ------------------------------ #
+def axis_values(axis: SweepAxis) -> List[float]:
+    if axis.values is not None:
+        return [float(v) for v in axis.values]
+    if axis.start is None or axis.stop is None:
+        raise CalculationError(f"Для оси {axis.name} нужно задать values или start/stop")
+    return [float(v) for v in np.linspace(axis.start, axis.stop, axis.points)]
+
+
+def validate_sweep(request: SweepParams, valve: ValveInfo) -> int:
+    """Проверяет оси развёртки; возвращает число точек."""
+    names = [axis.name for axis in request.axes]
+    if len(set(names)) != len(names):
+        raise CalculationError("Оси развёртки повторяются")
+    total = 1
+    for axis in request.axes:
+        nominal_value(request.params, valve, axis.name)
+        values = axis_values(axis)
+        if not values:
+            raise CalculationError(f"Ось {axis.name} не содержит значений")
+        total *= len(values)
+    if total > settings.SWEEP_MAX_POINTS:
+        raise CalculationError(f"Число точек развёртки больше допустимого ({settings.SWEEP_MAX_POINTS})")
+    return total
+
+
+def sweep_cases(request: SweepParams, valve: ValveInfo) -> Iterator[Tuple[Dict[str, float], CalculationParams, ValveInfo]]:
+    """Точки развёртки (значения осей, параметры, шток) — лениво, по одной."""
+    names = [axis.name for axis in request.axes]
+    for point in itertools.product(*(axis_values(axis) for axis in request.axes)):
+        params, point_valve = request.params, valve
+        for name, value in zip(names, point):
+            params, point_valve = perturbed(params, point_valve, name, value)
+        yield dict(zip(names, point)), params, point_valve
+
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def sweep_events(request: SweepParams, valve: ValveInfo) -> Iterator[str]:
+    """
+    События text/event-stream для развёртки.
+
+    point — результат (или ошибка) каждой точки сразу после расчёта её порции;
+    progress — не чаще progress_interval: сделано/всего, неудачных, точек в секунду;
+    done — итог.
+    """
+    total = validate_sweep(request, valve)
+    started = last_progress = time.monotonic()
+    done = failed = 0
+
+    def stats() -> Dict[str, Any]:
+        elapsed = time.monotonic() - started
+        return {"done": done, "total": total, "failed": failed, "elapsed": round(elapsed, 3),
+                "points_per_second": round(done / elapsed, 2) if elapsed > 0 else None}
+
+    yield format_sse("progress", stats())
+    cases = (((index, inputs), params, point_valve)
+             for index, (inputs, params, point_valve) in enumerate(sweep_cases(request, valve)))
+    for (index, inputs), outcome in calculate_stream(cases, request.chunk_size):
+        done += 1
+        if isinstance(outcome, CalculationError):
+            failed += 1
+            yield format_sse("point", {"index": index, "inputs": inputs, "error": outcome.message})
+        else:
+            yield format_sse("point", {"index": index, "inputs": inputs, "result": outcome.model_dump(mode="json")})
+        if time.monotonic() - last_progress >= request.progress_interval:
+            last_progress = time.monotonic()
+            yield format_sse("progress", stats())
+
+    logger.info(f"Развёртка: {done} точек, неудачных {failed}")
+    yield format_sse("done", stats())
+
+
+# ------------------------------ NDJSON ------------------------------ #
+# Предел длины одной строки входа: защищает от файла без переводов строк
+MAX_LINE_BYTES = 1 << 20
+
+# Сколько порций входа может ждать расчёта, пока считается текущая
+NDJSON_QUEUE_CHUNKS = 2
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    Потоковый ответ, который читает тело запроса во время выдачи.
+
+    Обычный StreamingResponse параллельно ждёт http.disconnect и забирает из receive
+    сообщения с телом запроса, поэтому чтение request.stream() из генератора зависает.
+    Здесь receive остаётся генератору: отключение клиента видно по ошибке чтения тела
+    или отправки.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+async def ndjson_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, bytes]]:
+    """Строки тела запроса (номер с 1, содержимое) по мере поступления; пустые пропускаются."""
+    buffer = b""
+    line_no = 0
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_no += 1
+            if line.strip():
+                yield line_no, line
+        if len(buffer) > MAX_LINE_BYTES:
+            raise CalculationError(f"Строка {line_no + 1} длиннее {MAX_LINE_BYTES} байт")
+    if buffer.strip():
+        yield line_no + 1, buffer
+
+
+def ndjson_chunk(lines: List[Tuple[int, bytes]], catalog: CatalogSnapshot) -> bytes:
+    """
+    Расчёт порции строк одним пакетом.
+
+    Returns:
+        Строки ответа {"line", "result"} или {"line", "error"} в порядке входа.
+    """
+    out: List[Dict[str, Any] | None] = [None] * len(lines)
+    cases = []
+    for pos, (line_no, raw) in enumerate(lines):
+        try:
+            params = CalculationParams.model_validate_json(raw)
+        except ValidationError as e:
+            out[pos] = {"line": line_no, "error": f"Неверная запись: {e.errors()[0]['msg']}"}
+            continue
+        valve = catalog.find(params)
+        if valve is None:
+            out[pos] = {"line": line_no, "error": f"Клапан '{params.valve_id or params.valve_drawing}' не найден"}
+            continue
+        cases.append((pos, params, valve))
+
+    for pos, outcome in calculate_stream(cases, max(len(cases), 1)):
+        line_no = lines[pos][0]
+        if isinstance(outcome, CalculationError):
+            out[pos] = {"line": line_no, "error": outcome.message}
+        else:
+            out[pos] = {"line": line_no, "result": outcome.model_dump(mode="json")}
+    return "".join(json.dumps(item, ensure_ascii=False) + "\n" for item in out).encode()
+
+
+async def ndjson_results(chunks: AsyncIterator[bytes], catalog: CatalogSnapshot,
+                         chunk_size: int) -> AsyncIterator[bytes]:
+    """
+    Конвейер NDJSON: чтение -> расчёт -> выдача.
+
+    Чтение тела идёт отдельной задачей в очередь на NDJSON_QUEUE_CHUNKS порций,
+    пока текущая порция считается в пуле потоков; следующая порция берётся
+    в расчёт, только когда ответ по предыдущей отправлен клиенту. Память
+    ограничена несколькими порциями независимо от длины входа.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=NDJSON_QUEUE_CHUNKS)
+
+    async def read() -> None:
+        try:
+            batch: List[Tuple[int, bytes]] = []
+            async for item in ndjson_lines(chunks):
+                batch.append(item)
+                if len(batch) == chunk_size:
+                    await queue.put(batch)
+                    batch = []
+            if batch:
+                await queue.put(batch)
+            await queue.put(None)
+        except Exception as e:
+            await queue.put(e)
+
+    reader = asyncio.create_task(read())
+    processed = 0
+    try:
+        while True:
+            batch = await queue.get()
+            if batch is None:
+                break
+            if isinstance(batch, Exception):
+                message = batch.message if isinstance(batch, CalculationError) else f"Ошибка чтения запроса: {batch}"
+                yield (json.dumps({"error": message}, ensure_ascii=False) + "\n").encode()
+                break
+            yield await run_in_threadpool(ndjson_chunk, batch, catalog)
+            processed += len(batch)
+    finally:
+        reader.cancel()
+    logger.info(f"NDJSON: обработано {processed} записей")
@@ -0,0 +1,77 @@
+import os
+import tempfile
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.database import Base
+from app import models
+
+# SQLite во временном файле (фоновые задачи работают из своих потоков со своими
+# соединениями); схема autocalc отображается на схему по умолчанию
+engine = create_engine(
+    f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}",
+    connect_args={"check_same_thread": False},
+    execution_options={"schema_translate_map": {"autocalc": None}},
+)
+
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture(scope="function")
+def db_session():
+    Base.metadata.create_all(bind=engine)
+    session = TestingSessionLocal()
+
+    yield session
+
+    session.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+# Клиент FastAPI с тестовой сессией вместо get_db
+@pytest.fixture(scope="function")
+def client(db_session):
+    from fastapi.testclient import TestClient
+    from app.catalog import valve_catalog
+    from app.dependencies import get_db
+    from app.main import app
+
+    # Кэш справочника штоков общий для процесса, а БД у каждого теста своя
+    valve_catalog.invalidate()
+
+    def _get_db():
+        yield db_session
+
+    app.dependency_overrides[get_db] = _get_db
+    yield TestClient(app)
+    app.dependency_overrides.pop(get_db, None)
+
+
+# Диспетчер фоновых задач на тестовой БД
+@pytest.fixture(scope="function")
+def jobs(db_session):
+    from app.jobs import job_executor
+
+    job_executor.configure(TestingSessionLocal)
+    job_executor.poll_interval = 0.05
+    job_executor.start()
+    yield job_executor
+    job_executor.stop()
+
+
+# Турбина с двухучастковым и трёхучастковым штоками
+@pytest.fixture(scope="function")
+def turbine(db_session):
+    turbine = models.Turbine(name="T-110")
+    db_session.add(turbine)
+    db_session.commit()
+    db_session.add_all([
+        models.Valve(name="BT-2", type="Стопорный", count_parts=2, diameter=50.0, clearance=0.23,
+                     round_radius=2.0, len_part1=190.0, len_part2=110.0, turbine_id=turbine.id),
+        models.Valve(name="BT-3", type="Регулирующий", count_parts=3, diameter=40.0, clearance=0.215,
+                     round_radius=2.0, len_part1=313.5, len_part2=50.0, len_part3=97.5, turbine_id=turbine.id),
+    ])
+    db_session.commit()
+    db_session.refresh(turbine)
+    return turbine
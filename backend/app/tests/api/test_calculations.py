@@ -0,0 +1,263 @@
+import io
+import json
+import zipfile
+
+import pytest
+
+from app import models
+
+
+def two_part_params(**overrides):
+    params = dict(
+        turbine_name="T-110",
+        valve_drawing="BT-2",
+        temperature_start=555,
+        t_air=40,
+        count_valves=2,
+        p_ejector=[0.97],
+        p_values=[130, 1.03],
+    )
+    params.update(overrides)
+    return params
+
+
+def test_calculate_report_returns_result_and_scheme(client, turbine):
+    response = client.post("/api/v1/calculate/report", json=two_part_params())
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip"
+
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    names = archive.namelist()
+    assert names == ["result.json", "scheme_2_parts.drawio"]
+
+    result = json.loads(archive.read("result.json"))
+    assert result["stock_name"] == "BT-2"
+    assert len(result["output_data"]["Gi"]) == 2
+
+    scheme = archive.read("scheme_2_parts.drawio").decode("utf-8")
+    assert 'id="result_G1_2_parts"' in scheme
+    assert 'id="result_ejector1_2_parts"' in scheme
+
+
+def test_calculate_report_resolves_by_valve_id(client, turbine):
+    valve_id = next(v.id for v in turbine.valves if v.name == "BT-2")
+    response = client.post("/api/v1/calculate/report", json=two_part_params(valve_drawing=None, valve_id=valve_id))
+
+    assert response.status_code == 200
+    result = json.loads(zipfile.ZipFile(io.BytesIO(response.content)).read("result.json"))
+    assert result["stock_name"] == "BT-2"
+
+
+def test_calculate_turbine_aggregates_stocks(client, turbine):
+    three_parts = dict(valve_drawing="BT-3", temperature_start=555, t_air=40, count_valves=2,
+                       p_ejector=[0.97, 0.97], p_values=[130, 10, 1.03])
+    response = client.post(f"/api/v1/turbines/{turbine.name}/calculate",
+                           json={"stocks": [three_parts], "default": two_part_params(valve_drawing=None)})
+
+    assert response.status_code == 200
+    data = response.json()
+    assert {s["valve_drawing"] for s in data["stocks"]} == {"BT-2", "BT-3"}
+    assert all(s["error"] is None for s in data["stocks"])
+
+    ejector_total = sum(ej["g"] for s in data["stocks"] for ej in s["result"]["ejector_props"])
+    assert data["total_ejector_g"] == pytest.approx(ejector_total)
+    assert [level["p"] for level in data["ejector_loads"]] == [0.97]
+    assert data["total_deaerator_g"] == pytest.approx(
+        next(s for s in data["stocks"] if s["valve_drawing"] == "BT-3")["result"]["deaerator_props"][0]
+    )
+
+
+def test_calculate_turbine_unknown_turbine(client, turbine):
+    response = client.post("/api/v1/turbines/missing/calculate", json={"stocks": []})
+    assert response.status_code == 404
+
+
+def test_operating_map_build_and_query(client, turbine, tmp_path, monkeypatch):
+    from app.operating_map import OperatingMapStore
+    monkeypatch.setattr("app.main.operating_maps", OperatingMapStore(str(tmp_path)))
+    valve = next(v for v in turbine.valves if v.name == "BT-2")
+    spec = {
+        "p_inlet": {"min": 100, "max": 130, "points": 4},
+        "t_inlet": {"min": 520, "max": 560, "points": 3},
+        "p_suction": {"min": 0.9, "max": 1.0, "points": 3},
+        "p_chambers": [1.03],
+    }
+
+    response = client.post(f"/api/v1/valves/{valve.id}/operating_map", json=spec)
+    assert response.status_code == 202
+    assert client.get(f"/api/v1/valves/{valve.id}/operating_map").json()["status"] == "ready"
+
+    point = client.get(f"/api/v1/valves/{valve.id}/operating_map/point",
+                       params={"p_inlet": 115, "t_inlet": 540, "p_suction": 0.95})
+    assert point.status_code == 200
+    assert point.json()["values"]["G1"] > 0
+    assert point.json()["error_bound"]["G1"] < 1e-2
+
+    bad = client.post(f"/api/v1/valves/{valve.id}/operating_map", json={**spec, "p_chambers": [7, 1.03]})
+    assert bad.status_code == 400
+
+
+def test_calculate_with_sensitivity(client, turbine):
+    plain = client.post("/api/v1/calculate", json=two_part_params())
+    assert plain.status_code == 200
+    assert plain.json()["sensitivity"] is None
+
+    response = client.post("/api/v1/calculate", params={"sensitivity": True}, json=two_part_params())
+    assert response.status_code == 200
+    jacobian = response.json()["sensitivity"]["jacobian"]
+    assert set(jacobian) == {"G1", "G2"}
+    assert jacobian["G1"]["clearance"] > 0
+
+
+def test_design_does_not_persist_results(client, turbine):
+    from app.batch import calculate_batch
+    from app.schemas import CalculationParams, ValveInfo
+
+    valve = ValveInfo.model_validate(next(v for v in turbine.valves if v.name == "BT-2"))
+    nominal = calculate_batch([(CalculationParams(**two_part_params()), valve)])[0].Gi[0]
+
+    response = client.post("/api/v1/design", json={
+        "params": two_part_params(),
+        "free_variable": "len_part1",
+        "target": "G1",
+        "target_value": 0.9 * nominal,
+    })
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["value"] > valve.len_part1
+    assert body["achieved"] == pytest.approx(0.9 * nominal, rel=1e-6)
+    assert client.get("/api/v1/valves/BT-2/results/").json() == []
+
+
+def _wait_job(client, job_id):
+    import time
+
+    for _ in range(200):
+        job = client.get(f"/api/v1/jobs/{job_id}").json()
+        if job["status"] not in ("queued", "running"):
+            return job
+        time.sleep(0.05)
+    return job
+
+
+def test_optimization_job(client, turbine, jobs):
+
+    response = client.post("/api/v1/optimize", json={
+        "params": two_part_params(),
+        "bounds": {"clearance": {"min": 0.15, "max": 0.3}, "len_part1": {"min": 150, "max": 250}},
+        "weights": 2,
+        "population": 5,
+        "max_generations": 3,
+    })
+    assert response.status_code == 202
+    job_id = response.json()["id"]
+
+    job = _wait_job(client, job_id)
+    assert job["status"] == "done"
+    assert job["progress"] == 1.0
+    page = client.get(f"/api/v1/jobs/{job_id}/result").json()
+    front = page["result"]["front"]
+    assert front and len(front) == page["total"]
+    assert all(p["deaerator_g"] == 0 for p in front)
+
+    first = client.get(f"/api/v1/jobs/{job_id}/result", params={"offset": 0, "limit": 1}).json()
+    assert first["total"] == page["total"]
+    assert first["result"]["front"] == front[:1]
+
+
+def test_calculate_job(client, turbine, jobs):
+    response = client.post("/api/v1/jobs", json={"kind": "calculate", "payload": two_part_params(), "priority": 5})
+    assert response.status_code == 202
+    assert response.json()["priority"] == 5
+
+    job = _wait_job(client, response.json()["id"])
+    assert job["status"] == "done"
+    result = client.get(f"/api/v1/jobs/{job['id']}/result").json()["result"]
+    assert result["output_data"] == client.post("/api/v1/calculate", json=two_part_params()).json()["output_data"]
+    assert len(client.get("/api/v1/valves/BT-2/results/").json()) == 2
+
+    listed = client.get("/api/v1/jobs", params={"kind": "calculate", "status": "done"}).json()
+    assert listed["total"] == 1 and listed["items"][0]["id"] == job["id"]
+
+
+def test_submit_job_validation(client, jobs):
+    assert client.post("/api/v1/jobs", json={"kind": "sweep", "payload": {}}).status_code == 400
+    assert client.post("/api/v1/jobs", json={"kind": "calculate", "payload": {}}).status_code == 400
+    unknown = client.post("/api/v1/jobs", json={"kind": "calculate", "payload": two_part_params(valve_drawing="BT-9")})
+    assert unknown.status_code == 404
+    assert client.get("/api/v1/jobs/unknown").status_code == 404
+
+
+def test_sweep_stream(client, turbine):
+    response = client.post("/api/v1/calculate/sweep/stream", json={
+        "params": two_part_params(),
+        "axes": [{"name": "clearance", "values": [0.2, 0.25]}],
+    })
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [block.split("\n")[0] for block in response.text.strip().split("\n\n")]
+    assert events.count("event: point") == 2 and events[-1] == "event: done"
+
+    bad = client.post("/api/v1/calculate/sweep/stream", json={
+        "params": two_part_params(), "axes": [{"name": "p_values.5", "values": [1]}],
+    })
+    assert bad.status_code == 400
+
+
+def test_batch_ndjson(client, turbine):
+    lines = [json.dumps(two_part_params()), json.dumps(two_part_params(valve_drawing="missing"))]
+    response = client.post("/api/v1/calculate/batch/ndjson", content="\n".join(lines),
+                           headers={"Content-Type": "application/x-ndjson"})
+    assert response.status_code == 200
+    first, second = [json.loads(line) for line in response.text.splitlines()]
+    assert first["line"] == 1 and first["result"]["Gi"]
+    assert second["line"] == 2 and "не найден" in second["error"]
+
+
+def test_recalculate_result(client, turbine):
+    base = client.post("/api/v1/calculate", json=two_part_params(valve_drawing="BT-3", count_valves=1,
+                                                                 p_values=[130, 10, 1.03], p_ejector=[0.97]))
+    assert base.status_code == 200
+    base_id = base.json()["id"]
+
+    response = client.post(f"/api/v1/results/{base_id}/recalculate", json={"changes": {"t_air": 25}})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["id"] != base_id and body["input_data"]["t_air"] == 25
+    assert body["recalculation"] == {"base_result_id": base_id, "changed_inputs": ["t_air"],
+                                     "recomputed_parts": [3], "reused_parts": [1, 2]}
+    assert body["output_data"]["Gi"][:2] == base.json()["output_data"]["Gi"][:2]
+
+    assert client.post(f"/api/v1/results/{base_id}/recalculate",
+                       json={"changes": {"p_values.7": 1}}).status_code == 400
+    # Результат хранится со ссылкой на шток: геометрию при пересчёте не меняем
+    assert client.post(f"/api/v1/results/{base_id}/recalculate",
+                       json={"changes": {"t_air": 25, "clearance": 0.3}}).status_code == 422
+    assert client.post("/api/v1/results/999/recalculate", json={"changes": {"t_air": 1}}).status_code == 404
+
+
+def test_calculate_with_diagnostics(client, turbine):
+    output = client.post("/api/v1/calculate", params={"diagnostics": "true"}, json=two_part_params()).json()
+    assert [d["part"] for d in output["output_data"]["metadata"]["solver"]] == [1, 2]
+    plain = client.post("/api/v1/calculate", json=two_part_params()).json()
+    assert plain["output_data"]["metadata"] is None
+
+
+def test_recalculate_same_base_twice(client, turbine, db_session):
+    db_session.add(models.Valve(name="BT-4", type="Стопорный", count_parts=4, diameter=36.0, clearance=0.205,
+                                round_radius=2.0, len_part1=438.5, len_part2=50.0, len_part3=25.0,
+                                len_part4=37.5, turbine_id=turbine.id))
+    db_session.commit()
+    base_id = client.post("/api/v1/calculate", json=two_part_params(
+        valve_drawing="BT-4", count_valves=4, p_values=[130, 7, 0.97, 1.03],
+        p_ejector=[0.97, 0.97, 0.97])).json()["id"]
+
+    assert client.post(f"/api/v1/results/{base_id}/recalculate",
+                       json={"changes": {"t_air": 25}}).json()["recalculation"]["recomputed_parts"] == [4]
+    # Второй пересчёт того же результата сравнивается с его состоянием, а не с t_air = 25
+    suction = client.post(f"/api/v1/results/{base_id}/recalculate", json={"changes": {"p_ejector.0": 0.9}})
+    assert suction.status_code == 200
+    assert suction.json()["recalculation"]["recomputed_parts"] == [2]
+    assert suction.json()["recalculation"]["reused_parts"] == [1, 3, 4]
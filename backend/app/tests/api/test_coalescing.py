@@ -0,0 +1,167 @@
+import asyncio
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from app import main, models
+from app.coalescing import advisory_lock, fingerprint, lock_key
+from app.schemas import CalculationParams
+from app.tests.api.test_calculations import two_part_params
+from app.tests.api.test_metrics import sample
+
+
+@pytest.fixture
+def session_per_request(client, db_session):
+    """Своя сессия на запрос, как в приложении: одновременные расчёты идут в пуле потоков."""
+    from app.dependencies import get_db
+
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=db_session.get_bind())
+
+    def _get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    client.app.dependency_overrides[get_db] = _get_db
+    return client
+
+
+def test_fingerprint_canonical():
+    params = CalculationParams(**two_part_params())
+    same = CalculationParams(**dict(reversed(list(two_part_params(p_values=[130.0, 1.03]).items()))))
+    by_id = params.model_copy(update={"valve_drawing": None, "valve_id": 1})
+
+    assert fingerprint(params, 1) == fingerprint(same, 1) == fingerprint(by_id, 1)
+    assert fingerprint(params, 1) != fingerprint(params, 2)
+    assert fingerprint(params, 1) != fingerprint(params, 1, diagnostics=True)
+    assert fingerprint(params, 1) != fingerprint(params.model_copy(update={"t_air": 41}), 1)
+
+
+def test_concurrent_identical_requests(session_per_request, turbine, db_session, monkeypatch):
+    calls = []
+    run_calculation = main._run_calculation
+
+    def slow_run_calculation(*args):
+        # Расчёт идёт дольше, чем приходят остальные запросы
+        calls.append(args[1])
+        time.sleep(0.2)
+        return run_calculation(*args)
+
+    monkeypatch.setattr(main, "_run_calculation", slow_run_calculation)
+    coalesced = sample("autocalc_calculations_coalesced_total", scope="worker")
+
+    async def run():
+        transport = httpx.ASGITransport(app=session_per_request.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            bodies = [two_part_params()] * 3 + [two_part_params(t_air=41)]
+            return await asyncio.gather(*(http.post("/api/v1/calculate", json=body) for body in bodies))
+
+    responses = asyncio.run(run())
+    assert all(r.status_code == 200 for r in responses)
+    ids = [r.json()["id"] for r in responses]
+    assert ids[0] == ids[1] == ids[2] != ids[3]
+    assert len(calls) == 2
+    assert db_session.query(models.CalculationResultDB).count() == 2
+    assert sample("autocalc_calculations_coalesced_total", scope="worker") == coalesced + 2
+
+
+def test_result_from_other_worker(session_per_request, turbine, db_session, monkeypatch):
+    since = datetime.now(timezone.utc) - timedelta(seconds=1)
+    first = session_per_request.post("/api/v1/calculate", json=two_part_params()).json()
+
+    # Блокировку держал другой воркер: его результат записан за время ожидания
+    @contextmanager
+    def waited_lock(db, key, timeout):
+        yield since
+
+    monkeypatch.setattr(main, "advisory_lock", waited_lock)
+    coalesced = sample("autocalc_calculations_coalesced_total", scope="cluster")
+
+    # Тот же шток по ID, а не по чертежу: отпечаток тот же, результат берётся готовым
+    valve = db_session.query(models.Valve).filter(models.Valve.name == "BT-2").one()
+    by_id = two_part_params(valve_drawing=None, valve_id=valve.id)
+    second = session_per_request.post("/api/v1/calculate", json=by_id).json()
+    assert second["id"] == first["id"] and second["output_data"] == first["output_data"]
+    assert sample("autocalc_calculations_coalesced_total", scope="cluster") == coalesced + 1
+
+    # С диагностикой — другой результат: считается заново
+    diagnosed = session_per_request.post("/api/v1/calculate?diagnostics=true", json=two_part_params()).json()
+    assert diagnosed["id"] != first["id"] and diagnosed["output_data"]["metadata"]
+    assert db_session.query(models.CalculationResultDB).count() == 2
+
+
+class PostgresSession:
+    """Сессия PostgreSQL для advisory_lock: записывает SQL на своём соединении и конец транзакции."""
+
+    class _Result:
+        def __init__(self, value):
+            self.value = value
+
+        def scalar(self):
+            return self.value
+
+    def __init__(self, locked: bool, wait_fails: bool = False):
+        self.locked = locked
+        self.wait_fails = wait_fails
+        self.statements = []
+        self.ended = []
+        self.dialect = type("Dialect", (), {"name": "postgresql"})()
+
+    def get_bind(self):
+        return self
+
+    def connect(self):
+        raise AssertionError("блокировка должна браться на соединении сессии, а не на новом из пула")
+
+    def connection(self):
+        return self
+
+    def execute(self, statement, parameters=None):
+        sql = str(statement)
+        self.statements.append((sql, parameters))
+        if "pg_advisory_xact_lock" in sql and self.wait_fails:
+            raise OperationalError(sql, parameters, Exception("lock timeout"))
+        return self._Result(self.locked if "pg_try_advisory_xact_lock" in sql else None)
+
+    def commit(self):
+        self.ended.append("commit")
+
+    def rollback(self):
+        self.ended.append("rollback")
+
+
+def test_advisory_lock_on_session_transaction():
+    key = fingerprint(CalculationParams(**two_part_params()), 1)
+
+    free = PostgresSession(locked=True)
+    with advisory_lock(free, key, timeout=1.0) as waited_since:
+        assert waited_since is None and free.ended == []
+    assert free.statements == [("SELECT pg_try_advisory_xact_lock(:k)", {"k": lock_key(key)})]
+    # Блокировка транзакционная: её снимает завершение транзакции сессии
+    assert free.ended == ["commit"]
+
+    busy = PostgresSession(locked=False)
+    with advisory_lock(busy, key, timeout=0.5) as waited_since:
+        assert waited_since is not None
+    sql = [statement for statement, _ in busy.statements]
+    assert sql[1:] == ["SELECT set_config('lock_timeout', :t, true)", "SELECT pg_advisory_xact_lock(:k)",
+                       "SET LOCAL lock_timeout TO DEFAULT"]
+    assert busy.statements[1][1] == {"t": "500ms"} and busy.ended == ["commit"]
+
+    # Не дождались: транзакция с ошибкой откатывается, расчёт идёт без блокировки
+    timed_out = PostgresSession(locked=False, wait_fails=True)
+    with advisory_lock(timed_out, key, timeout=0.5) as waited_since:
+        assert waited_since is None and timed_out.ended == ["rollback"]
+
+    failed = PostgresSession(locked=True)
+    with pytest.raises(ValueError):
+        with advisory_lock(failed, key, timeout=1.0):
+            raise ValueError("нет решения")
+    assert failed.ended == ["rollback"]
@@ -0,0 +1,65 @@
+import asyncio
+import os
+
+import httpx
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from app import loadtest
+from app.database import engine_options
+from app.pgdump import read_table_data, seed_database
+
+
+def test_seed_from_dump(tmp_path):
+    tables = read_table_data()
+    assert {"unique_turbine", "stocks", "resultcalcs"} <= set(tables)
+    assert any(row["turbine_id"] is None for row in tables["stocks"])
+
+    url = f"sqlite:///{os.path.join(tmp_path, 'seed.db')}"
+    engine = create_engine(url, **engine_options(url))
+    loaded = seed_database(engine)
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT count(*) FROM stocks")).scalar() == loaded["stocks"]
+        # Штоки без турбины в модели не допускаются и пропускаются
+        assert conn.execute(text("SELECT count(*) FROM stocks WHERE turbine_id IS NULL")).scalar() == 0
+        output = conn.execute(text("SELECT output_data FROM resultcalcs")).first()[0]
+    assert loaded["stocks"] > 0 and loaded["resultcalcs"] > 0
+    assert "Gi" in output
+    engine.dispose()
+
+
+def test_percentile_and_compare():
+    assert loadtest.percentile([4, 1, 3, 2], 50) == 2.5
+    assert loadtest.percentile([1, 2, 3, 4, 5], 95) == 4.8
+
+    baseline = {"routes": {"POST /calculate": {"p95_ms": 10.0}, "GET /turbines/": {"p95_ms": 5.0}}}
+    current = {"routes": {"POST /calculate": {"p95_ms": 13.0}, "GET /turbines/": {"p95_ms": 5.5}}}
+    regressions = loadtest.compare(current, baseline, threshold=0.25)
+    assert [r["route"] for r in regressions] == ["POST /calculate"]
+
+
+def test_replay_in_process(client, turbine, db_session):
+    from app.dependencies import get_db
+
+    # Как в приложении: своя сессия на запрос (расчёты идут в пуле потоков параллельно)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=db_session.get_bind())
+
+    def _get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    client.app.dependency_overrides[get_db] = _get_db
+
+    async def run():
+        transport = httpx.ASGITransport(app=client.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            return await loadtest.replay(http, concurrency=4, requests=60)
+
+    report = asyncio.run(run())
+    assert report["requests"] == 60 and report["errors"] == 0
+    assert set(report["routes"]) <= set(loadtest.MIX)
+    calculate = report["routes"]["POST /calculate"]
+    assert calculate["p50_ms"] <= calculate["p95_ms"] <= calculate["p99_ms"] <= calculate["max_ms"]
@@ -0,0 +1,102 @@
+import gc
+import logging
+import os
+import subprocess
+import sys
+import tracemalloc
+
+import pytest
+
+from app.core.config import settings
+from app.tests.api.test_calculations import two_part_params
+
+# Нагрузочный тест долгий: запускается только с RUN_LOAD_TESTS=1
+LOAD_TEST_CALLS = int(os.environ.get("LOAD_TEST_CALLS", "10000"))
+load_test = pytest.mark.skipif(os.environ.get("RUN_LOAD_TESTS") != "1",
+                               reason="нагрузочный тест: RUN_LOAD_TESTS=1")
+
+
+def test_memory_stats(client, turbine):
+    assert client.post("/api/v1/calculate", json=two_part_params()).status_code == 200
+
+    stats = client.get("/api/v1/admin/memory", params={"top_types": 5}).json()
+    assert stats["pid"] == os.getpid() and stats["gc_objects"] > 0
+    assert len(stats["top_types"]) == 5
+    assert stats["caches"]["calculation_sessions"] >= 1
+    assert os.getpid() in [w["pid"] for w in stats["workers"] if w["current"]]
+
+
+def test_admin_access(client, monkeypatch):
+    assert client.get("/api/v1/admin/memory").status_code == 200
+
+    monkeypatch.setattr(settings, "ENVIRONMENT", "production")
+    assert client.get("/api/v1/admin/memory").status_code == 403
+    assert client.get("/api/v1/admin/memory/tracemalloc", params={"seconds": 0.01}).status_code == 403
+
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", "secret")
+    assert client.get("/api/v1/admin/traces", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    assert client.get("/api/v1/admin/traces", headers={"X-Admin-Token": "secret"}).status_code == 200
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc"), reason="нужен /proc")
+def test_worker_pids_by_parent(monkeypatch):
+    from app import memory
+
+    # Текущий процесс в роли менеджера: его дочерние процессы — «воркер» и трекер ресурсов
+    sleep = "import time; time.sleep(30)"
+    child = subprocess.Popen([sys.executable, "-c", sleep])
+    tracker = subprocess.Popen([sys.executable, "-c", sleep, "multiprocessing.resource_tracker"])
+    try:
+        monkeypatch.setattr(os, "getppid", os.getpid)
+        # Родитель не uvicorn/gunicorn (запуск из оболочки): соседи — не воркеры
+        assert memory.worker_pids() == [os.getpid()]
+        monkeypatch.setattr(memory, "_is_manager", lambda pid: pid == os.getpid())
+        pids = memory.worker_pids()
+    finally:
+        for process in (child, tracker):
+            process.kill()
+            process.wait()
+    assert child.pid in pids and os.getpid() in pids
+    assert tracker.pid not in pids
+
+
+def test_tracemalloc_diff(client):
+    was_tracing = tracemalloc.is_tracing()
+    assert client.get("/api/v1/admin/memory/allocations").status_code == (200 if was_tracing else 409)
+
+    diff = client.get("/api/v1/admin/memory/tracemalloc", params={"seconds": 0.05, "limit": 5}).json()
+    assert diff["group"] == "lineno" and len(diff["sites"]) <= 5
+    # Включённый на время замера tracemalloc выключается
+    assert tracemalloc.is_tracing() == was_tracing
+
+    assert client.get("/api/v1/admin/memory/tracemalloc", params={"seconds": 1e6}).status_code == 400
+    assert client.get("/api/v1/admin/memory/tracemalloc", params={"group": "module"}).status_code == 422
+
+
+@load_test
+def test_memory_flat_under_load(client, turbine, caplog):
+    # Захват логов pytest сам копит записи по каждому расчёту
+    caplog.set_level(logging.WARNING, logger="app")
+    params = two_part_params()
+
+    tracemalloc.start()
+    try:
+        # Прогрев под трассировкой: кэши свойств и LRU сессий пересчёта заполняются
+        # до предела, и их содержимое уже учтено в базовой точке
+        for _ in range(settings.CALCULATION_SESSIONS + 100):
+            assert client.post("/api/v1/calculate", json=params).status_code == 200
+        gc.collect()
+        objects_before = len(gc.get_objects())
+        traced_before, _ = tracemalloc.get_traced_memory()
+
+        for _ in range(LOAD_TEST_CALLS):
+            assert client.post("/api/v1/calculate", json=params).status_code == 200
+        gc.collect()
+        traced_after, _ = tracemalloc.get_traced_memory()
+        objects_after = len(gc.get_objects())
+    finally:
+        tracemalloc.stop()
+
+    # Допуск — на фрагментацию и внутренние буферы; утечка в 100 байт на вызов за 10 000 вызовов его превысит
+    assert traced_after - traced_before < 512 * 1024
+    assert objects_after - objects_before < 2000
@@ -0,0 +1,59 @@
+from app import metrics
+from app.tests.api.test_calculations import two_part_params
+
+
+def sample(name: str, **labels) -> float:
+    """Значение ряда метрики в реестре сервиса (0, если ряда ещё нет)."""
+    return metrics.registry.get_sample_value(name, labels) or 0.0
+
+
+def test_metrics_endpoint(client, turbine):
+    calculations = sample("autocalc_calculation_duration_seconds_count", count_parts="2")
+    flow_errors = sample("autocalc_calculation_errors_total", kind="flow")
+
+    assert client.post("/api/v1/calculate", json=two_part_params()).status_code == 200
+    # Давление на выходе выше входного: течения нет
+    assert client.post("/api/v1/calculate", json=two_part_params(p_values=[1.03, 130])).status_code == 400
+    assert client.get("/api/v1/results/999999").status_code == 404
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+
+    assert sample("autocalc_calculation_duration_seconds_count", count_parts="2") == calculations + 1
+    assert sample("autocalc_calculation_errors_total", kind="flow") == flow_errors + 1
+    assert 'route="/api/v1/calculate",status="200"' in text
+    # Параметры пути не размножают ряды метрики
+    assert 'route="/api/v1/results/{result_id}",status="404"' in text
+    assert "/999999" not in text
+    assert 'autocalc_db_query_duration_seconds_count{operation="INSERT"}' in text
+    assert "autocalc_solver_iterations_count" in text
+    assert 'autocalc_solver_regime_total{regime="turbulent"}' in text
+    assert 'autocalc_cache_hits_total{cache="property_ph"}' in text
+    assert 'autocalc_job_workers{state="total"}' in text
+
+
+def test_route_template_by_matched_route(client, jobs):
+    # Значение параметра совпадает с литералом пути: /jobs/{job_id}/result с job_id="result"
+    assert client.get("/api/v1/jobs/result/result").status_code == 404
+    assert client.get("/api/v1/jobs/result").status_code == 404
+    text = client.get("/metrics").text
+    assert 'route="/api/v1/jobs/{job_id}/result",status="404"' in text
+    assert 'route="/api/v1/jobs/{job_id}",status="404"' in text
+    assert "/jobs/result/{job_id}" not in text
+
+
+def test_failed_query_not_timed(db_session):
+    from sqlalchemy import text
+    from sqlalchemy.exc import OperationalError
+
+    selects = sample("autocalc_db_query_duration_seconds_count", operation="SELECT")
+    with db_session.bind.connect() as conn:
+        try:
+            conn.execute(text("SELECT * FROM missing_table"))
+        except OperationalError:
+            pass
+        conn.execute(text("SELECT 1"))
+        assert "query_started" not in conn.info
+    assert sample("autocalc_db_query_duration_seconds_count", operation="SELECT") == selects + 1
@@ -0,0 +1,51 @@
+import pytest
+
+from app.core.config import settings
+from app.profiling import ProfileStore
+from app.tests.api.test_calculations import two_part_params
+
+
+@pytest.fixture
+def profiles(tmp_path, monkeypatch):
+    from app.main import app
+
+    store = ProfileStore(str(tmp_path), keep=2)
+    monkeypatch.setattr("app.profiling.profile_store", store)
+    monkeypatch.setattr("app.api.routes.admin.profile_store", store)
+    # Стек middleware (и счётчик выборки в нём) собирается заново при первом запросе
+    app.middleware_stack = None
+    yield store
+    app.middleware_stack = None
+
+
+def test_profile_on_request(client, turbine, profiles):
+    response = client.post("/api/v1/calculate?profile=1", json=two_part_params(),
+                           headers={"X-Request-ID": "calc-1"})
+    assert response.status_code == 200
+    assert response.headers["x-profile-id"] == "calc-1"
+    assert "x-profile-id" not in client.post("/api/v1/calculate", json=two_part_params()).headers
+
+    listed = client.get("/api/v1/admin/profiles").json()
+    assert [p["request_id"] for p in listed] == ["calc-1"]
+    assert listed[0]["path"] == "/api/v1/calculate" and not listed[0]["sampled"]
+
+    report = client.get("/api/v1/admin/profiles/calc-1", params={"limit": 200}).json()
+    functions = [f["function"] for f in report["functions"]]
+    assert len(functions) == 200
+    assert any("_part_props_detection" in f for f in functions)
+    cumulative = [f["cumtime"] for f in report["functions"]]
+    assert cumulative == sorted(cumulative, reverse=True)
+
+    assert client.get("/api/v1/admin/profiles/calc-1/download").content
+    assert client.get("/api/v1/admin/profiles/missing").status_code == 404
+
+
+def test_sampling_and_production(client, turbine, profiles, monkeypatch):
+    monkeypatch.setattr(settings, "ENVIRONMENT", "production")
+    monkeypatch.setattr(settings, "PROFILE_SAMPLE_RATE", 2)
+
+    ids = [client.post("/api/v1/calculate?profile=1", json=two_part_params()).headers.get("x-profile-id")
+           for _ in range(6)]
+    assert [i is not None for i in ids] == [False, True] * 3
+    # Хранятся последние keep профилей
+    assert len(profiles.list()) == 2 and all(p.sampled for p in profiles.list())
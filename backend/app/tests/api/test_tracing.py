@@ -0,0 +1,71 @@
+import json
+
+from app import tracing
+from app.tests.api.test_calculations import two_part_params
+
+
+def _names(node):
+    return [child["name"] for child in node["children"]]
+
+
+def test_calculate_trace_tree(client, turbine):
+    tracing.slow_traces.clear()
+    response = client.post("/api/v1/calculate", json=two_part_params())
+    assert response.status_code == 200
+    trace_id = response.headers["x-trace-id"]
+
+    summaries = client.get("/api/v1/admin/traces", params={"route": "/api/v1/calculate"}).json()
+    assert [s["trace_id"] for s in summaries] == [trace_id]
+    assert summaries[0]["name"] == "POST /api/v1/calculate"
+    assert summaries[0]["attributes"]["stock"] == "BT-2" and summaries[0]["attributes"]["count_parts"] == 2
+    assert summaries[0]["attributes"]["http.status_code"] == 200
+
+    trace = client.get(f"/api/v1/admin/traces/{trace_id}").json()
+    root = trace["root"]
+    assert _names(root) == ["valve.lookup", "calculator.init", "calculator.run", "db.persist", "response.serialize"]
+    run = root["children"][2]
+    assert _names(run) == ["calculator.area", "calculator.area", "calculator.suctions"]
+    assert [child["attributes"]["part"] for child in run["children"][:2]] == [1, 2]
+    assert all(child["attributes"]["stock"] == "BT-2" for child in run["children"])
+    assert sum(child["duration_ms"] for child in root["children"]) <= root["duration_ms"]
+
+    assert client.get("/api/v1/admin/traces/unknown").status_code == 404
+
+
+def test_error_recorded(client, turbine):
+    tracing.slow_traces.clear()
+    # Давление на выходе выше входного: расчёт падает на первом участке
+    response = client.post("/api/v1/calculate", json=two_part_params(p_values=[1.03, 130]))
+    assert response.status_code == 400
+
+    trace = client.get(f"/api/v1/admin/traces/{response.headers['x-trace-id']}").json()
+    run = next(child for child in trace["root"]["children"] if child["name"] == "calculator.run")
+    assert run["error"].startswith("CalculationError")
+
+
+def test_sampler_and_file_exporter(tmp_path):
+    sampler = tracing.SlowTraceSampler(keep=2)
+    exporter = tracing.FileExporter(str(tmp_path / "traces.jsonl"), min_duration_ms=0.0)
+    for duration in (5.0, 1.0, 9.0, 3.0):
+        trace = tracing.Trace("GET /x", {})
+        trace.root.duration_ms = duration
+        sampler(trace)
+        exporter(trace)
+    assert [t.duration_ms for t in sampler.traces()] == [9.0, 5.0]
+    # Запись идёт в фоновом потоке: close дописывает очередь
+    exporter.close(timeout=5)
+
+    lines = (tmp_path / "traces.jsonl").read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line)["duration_ms"] for line in lines] == [5.0, 1.0, 9.0, 3.0]
+
+    # Очередь переполнена (поток записи не успевает) — трассы отбрасываются, а не ждут
+    full = tracing.FileExporter(str(tmp_path / "full.jsonl"), queue_size=1)
+    full._start = lambda: None
+    for _ in range(3):
+        full(trace)
+    assert full.dropped == 2
+
+    # Вне трассы спаны ничего не записывают
+    with tracing.span("outside", part=1) as span:
+        span.set(stock="BT-2")
+    assert span is tracing.NOOP_SPAN
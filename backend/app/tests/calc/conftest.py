@@ -0,0 +1,33 @@
+import pytest
+from app.schemas import CalculationParams, ValveInfo
+
+
+# Представительные штоки из db/init.dump (2-5 участков) с типовыми условиями
+@pytest.fixture
+def cases():
+    return [
+        (
+            CalculationParams(temperature_start=555, t_air=40, count_valves=2,
+                              p_ejector=[0.97], p_values=[130, 1.03]),
+            ValveInfo(name="2 parts", round_radius=2, clearance=0.23, diameter=50,
+                      len_part1=190, len_part2=110),
+        ),
+        (
+            CalculationParams(temperature_start=555, t_air=40, count_valves=2,
+                              p_ejector=[0.97, 0.97], p_values=[130, 10, 1.03]),
+            ValveInfo(name="БТ-236455", round_radius=2, clearance=0.271, diameter=36,
+                      len_part1=513, len_part2=89, len_part3=68),
+        ),
+        (
+            CalculationParams(temperature_start=555, t_air=40, count_valves=4,
+                              p_ejector=[0.97, 0.97, 0.97], p_values=[130, 7, 0.97, 1.03]),
+            ValveInfo(name="БТ-250792", round_radius=2, clearance=0.205, diameter=36,
+                      len_part1=438.5, len_part2=50, len_part3=25, len_part4=37.5),
+        ),
+        (
+            CalculationParams(temperature_start=555, t_air=40, count_valves=4,
+                              p_ejector=[0.97, 0.8, 0.7], p_values=[130, 7, 3, 2, 1.03]),
+            ValveInfo(name="УТЗ-302063", round_radius=2, clearance=0.29, diameter=50,
+                      len_part1=132, len_part2=125, len_part3=60, len_part4=50, len_part5=53),
+        ),
+    ]
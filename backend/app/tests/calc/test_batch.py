@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+from WSAProperties import lambda_calc
+
+from app.batch import aggregate_suction_loads, calculate_batch, lambda_calc_vec
+from app.schemas import CalculationParams
+from app.utils import CalculationError, ValveCalculator
+
+
+def test_lambda_matches_reference_table():
+    re = np.array([50.0, 100.0, 2250.0, 12345.0, 1e8, 2e8])
+    expected = [float(lambda_calc(x)) for x in re]
+    assert np.allclose(lambda_calc_vec(re), expected, rtol=1e-12)
+
+
+def test_batch_matches_scalar_calculator(cases):
+    outcomes = calculate_batch(cases)
+
+    for (params, valve_info), batch_result in zip(cases, outcomes):
+        scalar = ValveCalculator(params, valve_info).perform_calculations()
+        assert batch_result.Gi == pytest.approx(scalar.Gi, rel=1e-9)
+        assert batch_result.Ti == pytest.approx(scalar.Ti, rel=1e-9)
+        assert batch_result.deaerator_props == pytest.approx(scalar.deaerator_props, rel=1e-9)
+        for batch_ej, scalar_ej in zip(batch_result.ejector_props, scalar.ejector_props):
+            assert batch_ej == pytest.approx(scalar_ej, rel=1e-9)
+
+
+def test_batch_reports_errors_per_case(cases):
+    params, valve_info = cases[3]
+    broken = params.model_copy(update={"p_values": [1, 7, 3, 2, 1.03]})
+
+    outcomes = calculate_batch([(broken, valve_info), cases[0]])
+
+    assert isinstance(outcomes[0], CalculationError)
+    assert "P_first > P_second" in outcomes[0].message
+    assert not isinstance(outcomes[1], CalculationError)
+
+
+def test_aggregate_suction_loads_sums_per_level(cases):
+    same_level = [cases[1], cases[1]]
+    single = calculate_batch(same_level[:1])[0]
+    deaerator, ejector = aggregate_suction_loads(calculate_batch(same_level))
+
+    assert len(deaerator) == 1 and len(ejector) == 1
+    assert deaerator[0].g == pytest.approx(2 * single.deaerator_props[0])
+    assert ejector[0].g == pytest.approx(2 * single.ejector_props[0]["g"])
+    assert ejector[0].h == pytest.approx(single.ejector_props[0]["h"])
+    assert ejector[0].sources == 2
+
+
+def test_invalid_count_of_pressures_is_error(cases):
+    _, valve_info = cases[1]
+    params = CalculationParams(temperature_start=555, t_air=40, count_valves=1, p_ejector=[0.97], p_values=[130])
+
+    assert isinstance(calculate_batch([(params, valve_info)])[0], CalculationError)
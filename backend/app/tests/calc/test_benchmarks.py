@@ -0,0 +1,34 @@
+import json
+
+from app.benchmarks import compare, main, run_benchmarks
+
+
+def report(**medians):
+    return {"meta": {}, "results": {name: {"median_us": value} for name, value in medians.items()}}
+
+
+def test_run_selected_benchmarks():
+    result = run_benchmarks(["perform_calculations_2parts", "json_"], repeat=2, min_time=0.0)
+
+    assert set(result["results"]) == {"perform_calculations_2parts", "json_dump_result", "json_load_result"}
+    for stats in result["results"].values():
+        assert stats["repeat"] == 2 and 0 < stats["min_us"] <= stats["median_us"]
+
+
+def test_compare_threshold():
+    baseline = report(a=100.0, b=100.0)
+    current = report(a=119.0, b=130.0, new=1.0)
+
+    regressions = compare(current, baseline, threshold=0.2)
+    assert [r["name"] for r in regressions] == ["b"]
+    assert compare(current, baseline, threshold=0.5) == []
+
+
+def test_cli_fails_on_regression(tmp_path):
+    baseline = tmp_path / "baseline.json"
+    baseline.write_text(json.dumps(report(json_dump_result=1e-3)), encoding="utf-8")
+    output = tmp_path / "bench.json"
+
+    assert main(["-o", str(output), "-k", "json_dump", "--repeat", "1", "--min-time", "0",
+                 "--baseline", str(baseline)]) == 1
+    assert list(json.loads(output.read_text(encoding="utf-8"))["results"]) == ["json_dump_result"]
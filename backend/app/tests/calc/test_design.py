@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from app.batch import calculate_batch
+from app.design import FrozenDesignProblem, solve_design
+from app.schemas import DesignParams
+from app.sensitivity import SOLVER_TOLERANCE
+from app.utils import CalculationError
+
+
+@pytest.mark.parametrize("free_variable", ["clearance", "len_part1", "round_radius"])
+def test_frozen_problem_matches_batch(cases, free_variable):
+    params, valve = cases[2]
+    problem = FrozenDesignProblem(params, valve, free_variable, "G2")
+    values = problem.nominal * np.array([0.8, 1.0, 1.3])
+
+    frozen = problem.evaluate(values)
+    exact = calculate_batch(
+        [(params, valve.model_copy(update={free_variable: float(x)})) for x in values],
+        tolerance=SOLVER_TOLERANCE,
+    )
+    assert frozen == pytest.approx([r.Gi[1] for r in exact], rel=1e-9)
+
+
+def test_solve_clearance_for_target_leakage(cases):
+    params, valve = cases[1]
+    nominal = calculate_batch([(params, valve)])[0].Gi[0]
+
+    result = solve_design(
+        DesignParams(params=params, free_variable="clearance", target="G1", target_value=0.8 * nominal),
+        valve,
+    )
+    assert result.value < valve.clearance
+    assert result.achieved == pytest.approx(0.8 * nominal, rel=1e-6)
+    assert result.result.Gi[0] == pytest.approx(0.8 * nominal, rel=1e-3)
+
+
+def test_unreachable_target(cases):
+    params, valve = cases[1]
+    with pytest.raises(CalculationError):
+        solve_design(
+            DesignParams(params=params, free_variable="len_part3", target="ejector_total",
+                         target_value=1e6),
+            valve,
+        )
+
+
+@pytest.mark.parametrize("index", [0, 1, 2, 3])
+def test_suction_loads_match_calculator(cases, index):
+    from app.design import FrozenGeometry
+
+    params, valve = cases[index]
+    geometry = FrozenGeometry(params, valve)
+    flows = geometry.part_flows({"clearance": np.array([valve.clearance])})
+    deaerator, ejector = geometry.suction_loads(flows)
+
+    exact = calculate_batch([(params, valve)], tolerance=SOLVER_TOLERANCE)[0]
+    assert deaerator[0] == pytest.approx(exact.deaerator_props[0], rel=1e-9, abs=1e-12)
+    assert ejector[0] == pytest.approx(sum(p["g"] for p in exact.ejector_props), rel=1e-9)
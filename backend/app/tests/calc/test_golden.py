@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from app.golden import ENGINES, GoldenCorpus, generate_corpus, main, register_engine, replay
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    return generate_corpus(60, seed=3)
+
+
+def test_corpus_roundtrip(corpus, tmp_path):
+    assert set(corpus.parts.tolist()) == {2, 3, 4, 5}
+    # Режимы выбираются решаемыми при любом числе участков
+    for n in range(2, 6):
+        assert corpus.ok[corpus.parts == n].mean() >= 0.9
+
+    corpus.save(str(tmp_path / "corpus.npz"))
+    loaded = GoldenCorpus.load(str(tmp_path / "corpus.npz"))
+    np.testing.assert_array_equal(loaded.reference, corpus.reference)
+    np.testing.assert_array_equal(loaded.p_ejector, corpus.p_ejector)
+    assert loaded.meta["seed"] == 3
+
+
+def test_engines_against_reference(corpus):
+    scalar = replay(corpus, "scalar")
+    assert scalar["accepted"] and scalar["max_rel_error"] == 0.0
+
+    batch = replay(corpus, "batch")
+    assert batch["accepted"] and batch["missed"] == 0 and batch["cases_per_second"] > 0
+    assert set(batch["outputs"]["G1"]) == {"max", "cases", "p50", "p95", "p99"}
+
+    coarse = replay(corpus, "batch_coarse", max_rel_error=1e-12)
+    assert not coarse["accepted"]
+
+
+def test_inaccurate_engine_rejected(corpus, tmp_path):
+    @register_engine("biased")
+    def biased(cases):
+        outcomes = ENGINES["batch"](cases)
+        for outcome in outcomes:
+            if hasattr(outcome, "Gi"):
+                outcome.Gi[0] *= 1.01
+        return outcomes
+
+    try:
+        report = replay(corpus, "biased")
+        assert not report["accepted"] and report["outputs"]["G1"]["max"] == pytest.approx(0.01)
+
+        path = str(tmp_path / "corpus.npz")
+        corpus.save(path)
+        assert main(["replay", path, "--engine", "batch"]) == 0
+    finally:
+        ENGINES.pop("biased")
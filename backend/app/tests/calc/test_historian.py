@@ -0,0 +1,53 @@
+import json
+
+import numpy as np
+import pytest
+
+from app.batch import calculate_batch
+from app.historian import COMPUTED, FAILED, REUSED, historian_series, main, read_series
+
+
+@pytest.fixture
+def log_csv(tmp_path):
+    path = tmp_path / "log.csv"
+    path.write_text(
+        "timestamp,p_values.0,temperature_start\n"
+        "2024-01-01T00:00:00,130.0,555\n"
+        "2024-01-01T00:00:01,130.001,555\n"  # в пределах допуска
+        "2024-01-01T00:00:02,125.0,550\n"
+        "2024-01-01T00:00:03,,550\n"  # пропуск измерения
+        "2024-01-01T00:00:04,0.5,550\n"  # P1 < P2 — нет решения
+        "2024-01-01T00:00:05,125.0,550\n",
+        encoding="utf-8",
+    )
+    return path
+
+
+def test_series_reuses_unchanged_samples(cases, log_csv):
+    params, valve = cases[0]
+    timestamps, columns = read_series(str(log_csv))
+
+    series = historian_series(params, valve, timestamps, columns, chunk_size=4)
+
+    assert series.source.tolist() == [COMPUTED, REUSED, COMPUTED, FAILED, FAILED, COMPUTED]
+    expected = calculate_batch([(params.model_copy(update={"p_values": [125.0, 1.03], "temperature_start": 550.0}),
+                                 valve)])[0]
+    assert series.column("G1")[2] == pytest.approx(expected.Gi[0])
+    assert series.values[1].tolist() == series.values[0].tolist()
+    assert np.isnan(series.values[3]).all()
+
+
+def test_cli_writes_columnar_output(cases, log_csv, tmp_path):
+    params, valve = cases[0]
+    (tmp_path / "params.json").write_text(params.model_dump_json(), encoding="utf-8")
+    (tmp_path / "valve.json").write_text(json.dumps(valve.model_dump(exclude={"section_lengths"})), encoding="utf-8")
+
+    main([str(log_csv), "-o", str(tmp_path / "out.npz"), "--params", str(tmp_path / "params.json"),
+          "--valve", str(tmp_path / "valve.json"), "--tolerance", "p_values.0=10"])
+
+    out = np.load(tmp_path / "out.npz")
+    assert out["timestamp"][0] == "2024-01-01T00:00:00"
+    # Допуск 10 кгс/см² по давлению не покрывает изменение температуры на 5 °C;
+    # отсчёт после неудачного считается заново
+    assert out["source"].tolist() == [COMPUTED, REUSED, COMPUTED, FAILED, FAILED, COMPUTED]
+    assert out["G1"].dtype == np.float32 and len(out["ejector_total_g"]) == 6
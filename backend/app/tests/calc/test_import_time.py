@@ -0,0 +1,52 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from app.calc_core import OperatingPoint, ValveCalculator as CoreCalculator, ValveGeometry
+from app.utils import ValveCalculator
+
+BACKEND_DIR = Path(__file__).resolve().parents[3]
+
+# Импорт ядра без свойств пара: стандартная библиотека, единицы миллисекунд
+CORE_IMPORT_BUDGET = 0.15
+
+WEB_STACK = ("fastapi", "starlette", "sqlalchemy", "app.main", "app.database", "app.models")
+
+
+def import_in_subprocess(module: str):
+    """(время импорта, загруженные модули) в чистом интерпретаторе."""
+    code = ("import json, sys, time; t = time.perf_counter(); import {}; "
+            "print(json.dumps([time.perf_counter() - t, sorted(sys.modules)]))").format(module)
+    out = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, capture_output=True,
+                         text=True, check=True).stdout
+    elapsed, modules = json.loads(out)
+    return elapsed, set(modules)
+
+
+def test_core_import_is_light():
+    elapsed, modules = import_in_subprocess("app.calc_core")
+    heavy = {"pydantic", "numpy", "scipy", "seuif97", "WSAProperties", *WEB_STACK}
+    assert not heavy & modules
+    assert elapsed < CORE_IMPORT_BUDGET
+
+
+@pytest.mark.parametrize("module", ["app.batch", "app.monte_carlo", "app.optimizer",
+                                    "app.offline", "app.historian"])
+def test_worker_modules_skip_web_stack(module):
+    _, modules = import_in_subprocess(module)
+    assert not set(WEB_STACK) & modules
+
+
+def test_core_on_dataclasses_matches_api(cases):
+    params, valve = cases[3]
+    point = OperatingPoint(params.temperature_start, params.t_air, params.count_valves,
+                           params.p_values, params.p_ejector)
+    geometry = ValveGeometry(valve.clearance, valve.diameter, valve.round_radius, valve.section_lengths)
+
+    core = CoreCalculator(point, geometry).perform_calculations()
+    api = ValveCalculator(params, valve).perform_calculations()
+    assert core.Gi == api.Gi
+    assert core.ejector_props == api.ejector_props
@@ -0,0 +1,40 @@
+import pytest
+
+from app.incremental import CalculationSession
+from app.utils import ValveCalculator
+
+
+def full(params, valve):
+    return ValveCalculator(params, valve).perform_calculations()
+
+
+def test_first_calculation_matches_full(cases):
+    for params, valve in cases:
+        result, recomputed = CalculationSession().calculate(params, valve)
+        assert result == full(params, valve)
+        assert recomputed == list(range(1, len(result.Gi) + 1))
+
+
+def test_t_air_recomputes_air_part_only(cases):
+    params, valve = cases[1]  # 3 участка, последний — воздух
+    session = CalculationSession()
+    session.calculate(params, valve)
+
+    changed = params.model_copy(update={"t_air": 25.0})
+    result, recomputed = session.calculate(changed, valve)
+    assert recomputed == [3]
+    assert result == full(changed, valve)
+
+    # Повтор без изменений — без решений
+    assert session.calculate(changed, valve)[1] == []
+
+
+def test_suction_change_recomputes_its_parts(cases):
+    params, valve = cases[2]  # 4 участка, отсосы: участки 2-3 и 4
+    session = CalculationSession()
+    session.calculate(params, valve)
+
+    changed = params.model_copy(update={"p_ejector": [0.97, 0.9, 0.97]})
+    result, recomputed = session.calculate(changed, valve)
+    assert 1 not in recomputed and recomputed
+    assert result.Gi == pytest.approx(full(changed, valve).Gi)
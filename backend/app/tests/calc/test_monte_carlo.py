@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from app import monte_carlo
+from app.jobs import JobCancelled
+from app.monte_carlo import evaluate_chunk, run_monte_carlo
+from app.schemas import Distribution, MonteCarloParams
+from app.utils import CalculationError
+
+
+@pytest.fixture
+def request_3_parts(cases):
+    params, valve = cases[1]
+    return MonteCarloParams(
+        params=params,
+        distributions={
+            "clearance": Distribution(kind="uniform", lower=-0.01, upper=0.02),
+            "diameter": Distribution(std=0.05),
+            "p_values.0": Distribution(std=2.0),
+        },
+        samples=600,
+        seed=42,
+    ), valve
+
+
+def test_statistics_match_direct_computation(request_3_parts, monkeypatch):
+    request, valve = request_3_parts
+    monkeypatch.setattr(monte_carlo, "CHUNK_SIZE", 200)
+
+    result = run_monte_carlo(request, valve, workers=0)
+
+    values = np.vstack([evaluate_chunk(request, valve, i, 200)[0] for i in range(3)])
+    g1 = result.metrics["G1"]
+    assert result.failed == 0
+    assert sum(g1.histogram_counts) + g1.outside_histogram == 600
+    assert g1.mean == pytest.approx(values[:, 0].mean(), rel=1e-12)
+    assert g1.std == pytest.approx(values[:, 0].std(ddof=1), rel=1e-9)
+    assert g1.max == values[:, 0].max()
+    assert g1.percentiles["p50"] == pytest.approx(np.percentile(values[:, 0], 50), rel=2e-3)
+
+
+def test_reproducible_and_independent_of_process_pool(request_3_parts, monkeypatch):
+    request, valve = request_3_parts
+    monkeypatch.setattr(monte_carlo, "CHUNK_SIZE", 200)
+
+    local = run_monte_carlo(request, valve, workers=0)
+    pooled = run_monte_carlo(request, valve, workers=2)
+
+    assert local.metrics["G1"].histogram_counts == pooled.metrics["G1"].histogram_counts
+    assert local.metrics["ejector_total_g"].mean == pytest.approx(pooled.metrics["ejector_total_g"].mean, rel=1e-12)
+    assert run_monte_carlo(request.model_copy(update={"seed": 1}), valve, workers=0).metrics["G1"].mean \
+        != local.metrics["G1"].mean
+
+
+def test_unknown_parameter(request_3_parts):
+    request, valve = request_3_parts
+    request.distributions["p_values.7"] = Distribution(std=1.0)
+    with pytest.raises(CalculationError):
+        run_monte_carlo(request, valve, workers=0)
+
+
+class _CancellingReporter:
+    """Отменяет задачу после заданного числа порций."""
+
+    def __init__(self, after):
+        self.after = after
+        self.updates = []
+
+    def update(self, progress, message=None):
+        self.updates.append(progress)
+
+    def check_cancelled(self):
+        if len(self.updates) >= self.after:
+            raise JobCancelled()
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_progress_and_cancel(request_3_parts, monkeypatch, workers):
+    request, valve = request_3_parts
+    monkeypatch.setattr(monte_carlo, "CHUNK_SIZE", 200)
+
+    reporter = _CancellingReporter(after=10)
+    run_monte_carlo(request, valve, workers=workers, reporter=reporter)
+    assert reporter.updates[-1] == 1.0 and len(reporter.updates) == 3
+
+    with pytest.raises(JobCancelled):
+        run_monte_carlo(request, valve, workers=workers, reporter=_CancellingReporter(after=2))
@@ -0,0 +1,53 @@
+from math import sqrt
+
+import pytest
+from seuif97 import ph
+
+from app.network import NetworkValveCalculator
+from app.schemas import NetworkOptions
+from app.utils import CalculationError, ValveCalculator
+
+
+def test_network_recovers_given_chamber_pressure(cases):
+    params, valve_info = cases[1]
+    scalar = ValveCalculator(params, valve_info)
+    expected = scalar.perform_calculations()
+
+    # Площадь линии, при которой заданное P2 — точное решение баланса камеры 2
+    p2, p_dea = params.p_values[1] * 0.0980665, 9 * 0.0980665
+    v = ph(p2, scalar.enthalpy_steam, 3)
+    area_mm2 = (expected.Gi[0] - expected.Gi[1]) / (3.6 * sqrt((p2 ** 2 - p_dea ** 2) * 1e12 / (p2 * 1e6 * v))) * 1e6
+
+    network = params.model_copy(update={
+        "p_values": [130, 20, 1.03],  # начальное приближение далеко от решения
+        "network": NetworkOptions(line_areas=[area_mm2], p_deaerator=9),
+    })
+    calculator = NetworkValveCalculator(network, valve_info)
+    result = calculator.perform_calculations()
+
+    assert calculator.residual < 1e-6
+    assert result.Pi_in[1] == pytest.approx(params.p_values[1], rel=1e-6)
+    assert result.Gi == pytest.approx(expected.Gi, rel=1e-6)
+    assert result.deaerator_props[0] == pytest.approx(expected.deaerator_props[0], rel=1e-6)
+
+
+def test_network_conserves_mass(cases):
+    params, valve_info = cases[3]
+    network = params.model_copy(update={"network": NetworkOptions(line_areas=[1.0, 0.5, 0.5], p_deaerator=6)})
+    calculator = NetworkValveCalculator(network, valve_info)
+    result = calculator.perform_calculations()
+
+    pressures = result.Pi_in[:4]
+    assert pressures == sorted(pressures, reverse=True)
+    g = result.Gi
+    assert g[0] == pytest.approx(sum(calculator.line_flows) + g[3], rel=1e-5)
+    total_ejector = sum(ej["g"] for ej in result.ejector_props)
+    assert total_ejector == pytest.approx((sum(calculator.line_flows[1:]) + g[3] + g[4]) * params.count_valves)
+
+
+def test_network_requires_line_per_chamber(cases):
+    params, valve_info = cases[2]
+    network = params.model_copy(update={"network": NetworkOptions(line_areas=[1.0])})
+
+    with pytest.raises(CalculationError):
+        NetworkValveCalculator(network, valve_info)
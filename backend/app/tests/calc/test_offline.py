@@ -0,0 +1,55 @@
+import csv
+import json
+
+import pytest
+
+from app.offline import main, run_batch
+from app.utils import ValveCalculator
+
+
+@pytest.fixture
+def batch_files(cases, tmp_path):
+    valves = [valve.model_copy(update={"id": i + 1}).model_dump(exclude={"section_lengths"})
+              for i, (_, valve) in enumerate(cases[:2])]
+    (tmp_path / "catalog.json").write_text(json.dumps(valves, ensure_ascii=False), encoding="utf-8")
+    with open(tmp_path / "points.csv", "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["valve_id", "valve_drawing", "temperature_start", "t_air", "count_valves",
+                         "p_values.0", "p_values.1", "p_values.2", "p_ejector.0", "p_ejector.1"])
+        writer.writerow([1, "", 555, 40, 2, 130, 1.03, "", 0.97, ""])
+        writer.writerow(["", "БТ-236455", 555, 40, 2, 130, 10, 1.03, 0.97, 0.97])
+        writer.writerow([7, "", 555, 40, 2, 130, 1.03, "", 0.97, ""])  # нет в справочнике
+        writer.writerow([1, "", 555, 40, 2, 130, 1.03, "", "", ""])  # нет давления отсоса
+    return tmp_path
+
+
+def read_output(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_run_batch_csv(cases, batch_files, workers):
+    summary = run_batch(str(batch_files / "points.csv"), str(batch_files / "catalog.json"),
+                        str(batch_files / "out.csv"), workers=workers, chunk_size=2)
+
+    assert summary["rows"] == 4 and summary["failed"] == 2
+    rows = read_output(batch_files / "out.csv")
+    assert [r["row"] for r in rows] == ["1", "2", "3", "4"]
+    assert [r["status"] for r in rows] == ["ok", "ok", "error", "error"]
+    assert "не найден" in rows[2]["error"]
+    params, valve = cases[1]
+    expected = ValveCalculator(params, valve).perform_calculations()
+    assert float(rows[1]["G3"]) == pytest.approx(expected.Gi[2])
+    assert rows[0]["G3"] == ""
+
+
+def test_cli_parquet(batch_files, capsys):
+    pytest.importorskip("pyarrow")
+    import pyarrow.parquet as pq
+
+    main(["run", str(batch_files / "points.csv"), "--catalog", str(batch_files / "catalog.json"),
+          "-o", str(batch_files / "out.parquet"), "--workers", "0"])
+    assert json.loads(capsys.readouterr().out)["ok"] == 2
+    table = pq.read_table(batch_files / "out.parquet")
+    assert table.num_rows == 4 and table.column("status").to_pylist()[:2] == ["ok", "ok"]
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from app import optimizer
+from app.optimizer import pareto_front, run_optimization
+from app.schemas import Bounds, OptimizationParams
+
+
+def test_pareto_front_filters_dominated_points():
+    points = np.array([[1.0, 5.0], [2.0, 3.0], [2.5, 3.5], [3.0, 1.0], [4.0, 1.0], [1.0, 6.0]])
+    assert pareto_front(points).tolist() == [0, 1, 3]
+
+
+@pytest.fixture
+def request_4_parts(cases):
+    params, valve = cases[2]
+    return OptimizationParams(
+        params=params,
+        bounds={"clearance": Bounds(min=0.15, max=0.3), "len_part1": Bounds(min=300, max=500)},
+        total_length=Bounds(min=400, max=560),
+        weights=3,
+        population=8,
+        max_generations=10,
+    ), valve
+
+
+def test_front_is_feasible_and_non_dominated(request_4_parts):
+    request, valve = request_4_parts
+    result = run_optimization(request, valve, workers=0)
+
+    front = np.array([[p.ejector_g, p.deaerator_g] for p in result.front])
+    assert len(pareto_front(front)) == len(front)
+    for point in result.front:
+        assert 0.15 <= point.geometry["clearance"] <= 0.3
+        total = point.geometry["len_part1"] + valve.len_part2 + valve.len_part3 + valve.len_part4
+        assert 400 <= total <= 560
+        assert point.deaerator_g >= 0
+
+
+def test_front_excludes_nominal_outside_bounds(cases):
+    params, valve = cases[2]
+    # Номинальный зазор клапана вне диапазона: точка для масштабов не должна попасть во фронт
+    assert not 0.3 <= valve.clearance <= 0.4
+    request = OptimizationParams(
+        params=params, bounds={"clearance": Bounds(min=0.3, max=0.4)},
+        weights=2, population=6, max_generations=5,
+    )
+    result = run_optimization(request, valve, workers=0)
+    assert result.front
+    assert all(0.3 <= point.geometry["clearance"] <= 0.4 for point in result.front)
+
+
+def test_process_pool_gives_same_front(request_4_parts, monkeypatch):
+    request, valve = request_4_parts
+    monkeypatch.setattr(optimizer, "POOL_MIN_BATCH", 16)
+
+    local = run_optimization(request, valve, workers=0)
+    pooled = run_optimization(request, valve, workers=2)
+    assert [p.ejector_g for p in pooled.front] == pytest.approx([p.ejector_g for p in local.front], rel=1e-12)
@@ -0,0 +1,23 @@
+import pytest
+
+from app.batch import calculate_batch
+from app.sensitivity import SOLVER_TOLERANCE, sensitivity_report
+
+
+def test_jacobian_matches_wide_difference(cases):
+    params, valve = cases[1]
+    report = sensitivity_report(params, valve)
+
+    assert report.outputs == ["G1", "G2", "G3"]
+    assert "len_part3" in report.inputs and "p_ejector.0" in report.inputs
+
+    h = 1e-3
+    plus, minus = calculate_batch([
+        (params, valve.model_copy(update={"clearance": valve.clearance + h})),
+        (params, valve.model_copy(update={"clearance": valve.clearance - h})),
+    ], tolerance=SOLVER_TOLERANCE)
+    expected = (plus.Gi[0] - minus.Gi[0]) / (2 * h)
+    assert report.jacobian["G1"]["clearance"] == pytest.approx(expected, rel=1e-4)
+    assert report.jacobian["G1"]["p_values.0"] > 0
+    assert report.jacobian["G1"]["len_part1"] < 0
+
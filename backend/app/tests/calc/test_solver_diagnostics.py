@@ -0,0 +1,57 @@
+from app import calc_core
+from app.calc_core import GUARD_MAX_ITERATIONS, GUARD_PRESSURE_NUDGE, GUARD_VELOCITY_BOUND, SolverDiagnostics
+from app.incremental import CalculationSession
+from app.utils import ValveCalculator
+
+# Аргументы первого участка двухучасткового штока: p1, p2 (МПа), v, μ, L, δ, S, ξ
+PART_ARGS = (12.75, 4.0, 0.025, 3.0e-5, 0.19, 0.00023, 3.6e-5, 0.5)
+
+
+def test_metadata_per_part(cases):
+    for params, valve in cases:
+        calc = ValveCalculator(params, valve)
+        assert calc.perform_calculations().metadata is None
+
+        calc = ValveCalculator(params, valve)
+        calc.include_metadata = True
+        result = calc.perform_calculations()
+        solver = result.metadata.solver
+        assert [d.part for d in solver] == list(range(1, len(result.Gi) + 1))
+        for d in solver:
+            assert d.iterations > 0 and d.bracket_width <= 1e-3
+            assert abs(d.residual) < 1e-2
+            assert d.regime in ("laminar", "transitional", "turbulent")
+
+
+def test_guards():
+    diagnostics = SolverDiagnostics()
+    calc_core._part_props_detection(4.0, 4.0, *PART_ARGS[2:], diagnostics=diagnostics)
+    assert diagnostics.guards == [GUARD_PRESSURE_NUDGE]
+
+    # Корень вне интервала скоростей
+    diagnostics = SolverDiagnostics()
+    calc_core._part_props_detection(*PART_ARGS, w_max=2.0, diagnostics=diagnostics)
+    assert GUARD_VELOCITY_BOUND in diagnostics.guards
+
+    # Предохранитель по числу итераций при недостижимой точности
+    diagnostics = SolverDiagnostics()
+    calc_core._part_props_detection(*PART_ARGS, w_min=0.0, w_max=1e300, diagnostics=diagnostics)
+    assert GUARD_MAX_ITERATIONS in diagnostics.guards and diagnostics.iterations == 1001
+
+
+def test_observer(monkeypatch, cases):
+    seen = []
+    monkeypatch.setattr(calc_core, "solver_observer", seen.append)
+    params, valve = cases[1]
+    ValveCalculator(params, valve).perform_calculations()
+    assert len(seen) == 3 and all(isinstance(d, SolverDiagnostics) for d in seen)
+
+
+def test_session_reports_recomputed_parts(cases):
+    params, valve = cases[3]
+    session = CalculationSession()
+    session.calculate(params, valve)
+    changed = params.model_copy(update={"t_air": 30})
+    result, recomputed = session.calculate(changed, valve, diagnostics=True)
+    assert [d.part for d in result.metadata.solver] == recomputed
+
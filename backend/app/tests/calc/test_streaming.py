@@ -0,0 +1,113 @@
+import asyncio
+import json
+
+import pytest
+
+from app import streaming
+from app.batch import calculate_batch
+from app.catalog import CatalogSnapshot
+from app.schemas import SweepAxis, SweepParams
+from app.streaming import chunked, ndjson_lines, ndjson_results, sweep_events, validate_sweep
+from app.utils import CalculationError
+
+
+def parse_events(chunks):
+    events = []
+    for chunk in chunks:
+        event, data = chunk.strip().split("\n")
+        events.append((event[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+
+def test_chunked():
+    assert list(chunked(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(chunked([], 3)) == []
+
+
+def test_sweep_points_match_batch(cases):
+    params, valve = cases[0]
+    request = SweepParams(params=params, axes=[
+        SweepAxis(name="clearance", start=0.2, stop=0.3, points=3),
+        SweepAxis(name="p_values.0", values=[120, 130]),
+    ], chunk_size=4)
+
+    events = parse_events(sweep_events(request, valve))
+    points = [data for event, data in events if event == "point"]
+    assert [p["index"] for p in points] == list(range(6))
+    assert points[1]["inputs"] == {"clearance": 0.2, "p_values.0": 130.0}
+
+    expected = calculate_batch([(params.model_copy(update={"p_values": [130.0, 1.03]}),
+                                 valve.model_copy(update={"clearance": 0.2}))])[0]
+    assert points[1]["result"]["Gi"] == pytest.approx(expected.Gi)
+    assert events[-1][0] == "done"
+    assert events[-1][1]["done"] == 6 and events[-1][1]["failed"] == 0
+
+
+def test_failed_points_reported(cases):
+    params, valve = cases[0]
+    # При P1 <= P2 расчёт участка невозможен
+    request = SweepParams(params=params, axes=[SweepAxis(name="p_values.0", values=[130, 0.5])])
+    points = [data for event, data in parse_events(sweep_events(request, valve)) if event == "point"]
+    assert "result" in points[0] and "error" in points[1]
+
+
+def test_pipeline_is_lazy(cases, monkeypatch):
+    params, valve = cases[0]
+    calls = []
+
+    def counting_batch(batch):
+        calls.append(len(batch))
+        return calculate_batch(batch)
+
+    monkeypatch.setattr(streaming, "calculate_batch", counting_batch)
+    request = SweepParams(params=params, axes=[SweepAxis(name="clearance", start=0.2, stop=0.3, points=10)],
+                          chunk_size=3)
+    events = sweep_events(request, valve)
+    next(events)  # progress
+    next(events)  # первая точка
+    assert calls == [3]
+
+
+def test_validation(cases):
+    params, valve = cases[0]
+    with pytest.raises(CalculationError):
+        validate_sweep(SweepParams(params=params, axes=[SweepAxis(name="len_part3", values=[1])]), valve)
+    with pytest.raises(CalculationError):
+        validate_sweep(SweepParams(params=params, axes=[SweepAxis(name="clearance")]), valve)
+
+
+def collect(agen):
+    async def run():
+        return [item async for item in agen]
+    return asyncio.run(run())
+
+
+async def body(*parts):
+    for part in parts:
+        yield part
+
+
+def test_ndjson_lines_split_across_chunks():
+    lines = collect(ndjson_lines(body(b'{"a":1}\n{"b"', b':2}\n\n', b'{"c":3}')))
+    assert lines == [(1, b'{"a":1}'), (2, b'{"b":2}'), (4, b'{"c":3}')]
+
+
+def test_ndjson_results(cases):
+    params, valve = cases[0]
+    catalog = CatalogSnapshot({1: valve.model_copy(update={"id": 1})})
+    good = params.model_copy(update={"valve_id": 1}).model_dump_json().encode()
+    unknown = params.model_copy(update={"valve_id": 2}).model_dump_json().encode()
+    records = [good, b"not json", unknown, good, good]
+
+    out = b"".join(collect(ndjson_results(body(b"\n".join(records)), catalog, chunk_size=2)))
+    items = [json.loads(line) for line in out.decode().splitlines()]
+    assert [item["line"] for item in items] == [1, 2, 3, 4, 5]
+    assert "result" in items[0] and "error" in items[1] and "error" in items[2]
+    expected = calculate_batch([(params, valve)])[0]
+    assert items[4]["result"]["Gi"] == pytest.approx(expected.Gi)
+
+
+def test_ndjson_line_too_long(cases, monkeypatch):
+    monkeypatch.setattr(streaming, "MAX_LINE_BYTES", 16)
+    out = b"".join(collect(ndjson_results(body(b"x" * 40), CatalogSnapshot({}), chunk_size=2)))
+    assert "error" in json.loads(out)
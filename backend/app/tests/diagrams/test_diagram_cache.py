@@ -0,0 +1,66 @@
+from unittest.mock import patch
+
+from app.diagram_cache import DiagramCache
+from app.fingerprint import geometry_fingerprint
+from app import save_to_drowio
+from app.save_to_drowio import DiagramGenerator, DiagramModifier, TEMPLATES_DIR
+from app.schemas import ValveInfo
+
+
+def make_valve(**overrides) -> ValveInfo:
+    data = dict(
+        name="BT-1",
+        count_parts=2,
+        diameter=65.0,
+        clearance=0.35,
+        round_radius=2.0,
+        len_part1=210.0,
+        len_part2=125.0,
+    )
+    data.update(overrides)
+    return ValveInfo(**data)
+
+
+def test_fingerprint_ignores_non_geometry_fields():
+    a = make_valve(id=1, name="BT-1", turbine_id=3)
+    b = make_valve(id=2, name="BT-2", turbine_id=None, diameter=65, len_part3=99.0)
+
+    assert geometry_fingerprint(a) == geometry_fingerprint(b)
+    assert geometry_fingerprint(a) != geometry_fingerprint(make_valve(clearance=0.36))
+    assert geometry_fingerprint(a, template_version="1") != geometry_fingerprint(a, template_version="2")
+
+
+def test_lru_eviction():
+    cache = DiagramCache(max_entries=2)
+    cache.put("a", b"A")
+    cache.put("b", b"B")
+    assert cache.get("a") == b"A"
+    cache.put("c", b"C")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == b"A"
+    assert cache.get("c") == b"C"
+
+
+def test_disk_level_is_shared(tmp_path):
+    writer = DiagramCache(max_entries=4, cache_dir=str(tmp_path))
+    writer.put("key", b"<mxfile/>")
+
+    reader = DiagramCache(max_entries=4, cache_dir=str(tmp_path))
+    assert reader.get("key") == b"<mxfile/>"
+    assert reader.hits == 1
+
+
+def test_cache_hit_skips_xml(tmp_path):
+    generator = DiagramGenerator(TEMPLATES_DIR, str(tmp_path))
+    with patch.object(save_to_drowio, "diagram_generator", generator), \
+            patch.object(save_to_drowio, "diagram_cache", DiagramCache(max_entries=4)):
+        with patch.object(save_to_drowio, "DiagramModifier", wraps=DiagramModifier) as modifier:
+            content = save_to_drowio.get_scheme_content(make_valve())
+            modifier.assert_called_once()
+        assert b"delt = 0.35" in content
+
+        # Тот же шток под другим именем: схема из кэша, шаблон не разбирается
+        with patch.object(save_to_drowio, "DiagramModifier") as modifier:
+            assert save_to_drowio.get_scheme_content(make_valve(name="BT-2")) == content
+            modifier.assert_not_called()
@@ -0,0 +1,210 @@
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.jobs import JobExecutor
+from app.models import JobDB
+
+
+@pytest.fixture
+def session_factory():
+    engine = create_engine(
+        f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'jobs.db')}",
+        connect_args={"check_same_thread": False},
+        execution_options={"schema_translate_map": {"autocalc": None}},
+    )
+    JobDB.__table__.create(bind=engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
+
+
+def make_executor(session_factory, workers=1, **limits):
+    executor = JobExecutor(session_factory, workers=workers)
+    executor.poll_interval = 0.02
+    executor.kind_limits = limits
+    return executor
+
+
+def wait(executor, job_id, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = executor.get(job_id)
+        if job.status not in ("queued", "running"):
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"Задача {job_id} не завершилась")
+
+
+def test_priority_order(session_factory):
+    executor = make_executor(session_factory)
+    order = []
+    executor.register("echo", lambda payload, reporter: order.append(payload["n"]) or {"n": payload["n"]})
+    low = executor.submit("echo", {"n": 1}, priority=0)
+    high = executor.submit("echo", {"n": 2}, priority=10)
+    executor.start()
+    try:
+        assert wait(executor, low.id).status == "done"
+        assert wait(executor, high.id).status == "done"
+    finally:
+        executor.stop()
+    assert order == [2, 1]
+    assert executor.result(high.id)[1].result == {"n": 2}
+
+
+def test_kind_limit(session_factory):
+    executor = make_executor(session_factory, workers=3, slow=1)
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def slow(payload, reporter):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.1)
+        with lock:
+            active[0] -= 1
+        return {}
+
+    executor.register("slow", slow)
+    ids = [executor.submit("slow", {}).id for _ in range(3)]
+    executor.start()
+    try:
+        assert all(wait(executor, job_id).status == "done" for job_id in ids)
+    finally:
+        executor.stop()
+    assert peak[0] == 1
+
+
+def test_kind_limit_across_processes(session_factory):
+    # Два диспетчера на одной БД, как воркеры uvicorn: ограничение вида общее
+    executors = [make_executor(session_factory, workers=2, slow=1) for _ in range(2)]
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def slow(payload, reporter):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+        return {}
+
+    for i, executor in enumerate(executors):
+        executor.worker_id = f"host:{i}"
+        executor.register("slow", slow)
+    ids = [executors[0].submit("slow", {}).id for _ in range(4)]
+    for executor in executors:
+        executor.start()
+    try:
+        assert all(wait(executors[0], job_id).status == "done" for job_id in ids)
+    finally:
+        for executor in executors:
+            executor.stop()
+    assert peak[0] == 1
+
+
+def test_start_without_database():
+    # БД недоступна при старте: приложение поднимается, таблица создаётся при появлении БД
+    available = threading.Event()
+    engine = create_engine(
+        f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'late.db')}",
+        connect_args={"check_same_thread": False},
+        execution_options={"schema_translate_map": {"autocalc": None}},
+    )
+    sessions = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def flaky_session():
+        if not available.is_set():
+            raise OSError("connection refused")
+        return sessions()
+
+    executor = make_executor(flaky_session)
+    executor.register("echo", lambda payload, reporter: payload)
+    executor.start()
+    try:
+        time.sleep(0.1)
+        available.set()
+        job = wait(executor, executor.submit("echo", {"n": 1}).id)
+    finally:
+        executor.stop()
+        engine.dispose()
+    assert job.status == "done"
+
+
+def test_cancel_running_and_queued(session_factory):
+    executor = make_executor(session_factory)
+    started = threading.Event()
+
+    def loop(payload, reporter):
+        started.set()
+        while True:
+            reporter.update(0.5, "работаю")
+            reporter.check_cancelled()
+            time.sleep(0.01)
+
+    executor.register("loop", loop)
+    running = executor.submit("loop", {}, priority=1)
+    queued = executor.submit("loop", {})
+    executor.start()
+    try:
+        assert started.wait(5)
+        assert executor.cancel(queued.id).status == "cancelled"
+        assert executor.cancel(running.id).status == "running"
+        assert wait(executor, running.id).status == "cancelled"
+    finally:
+        executor.stop()
+
+
+def test_failed_job_keeps_error(session_factory):
+    executor = make_executor(session_factory)
+
+    def broken(payload, reporter):
+        raise ValueError("нет решения")
+
+    executor.register("broken", broken)
+    job = executor.submit("broken", {})
+    executor.start()
+    try:
+        job = wait(executor, job.id)
+    finally:
+        executor.stop()
+    assert job.status == "failed" and job.error == "нет решения"
+
+
+def test_stale_job_resumed(session_factory):
+    # Задача «выполнялась» процессом, который перестал обновлять heartbeat
+    with session_factory() as db:
+        db.add(JobDB(id="stale", kind="echo", status="running", priority=0, progress=0.3, payload={"n": 1},
+                     attempts=1, worker="old:1", cancel_requested=False,
+                     created_at=datetime.now(timezone.utc),
+                     heartbeat_at=datetime.now(timezone.utc) - timedelta(minutes=10)))
+        db.commit()
+
+    executor = make_executor(session_factory)
+    executor.register("echo", lambda payload, reporter: payload)
+    executor.start()
+    try:
+        job = wait(executor, "stale")
+    finally:
+        executor.stop()
+    assert job.status == "done" and job.attempts == 2
+
+
+def test_result_pagination(session_factory):
+    executor = make_executor(session_factory)
+    executor.register("points", lambda payload, reporter: {"front": list(range(10)), "n": 10}, paginate="front")
+    job = executor.submit("points", {})
+    executor.start()
+    try:
+        wait(executor, job.id)
+    finally:
+        executor.stop()
+    _, page = executor.result(job.id, offset=8, limit=5)
+    assert page.total == 10 and page.result == {"front": [8, 9], "n": 10}
@@ -0,0 +1,60 @@
+import pytest
+
+from app.batch import calculate_batch
+from app.operating_map import OperatingMap, OperatingMapStore, build_operating_map
+from app.schemas import CalculationParams, MapAxis, OperatingMapSpec, ValveInfo
+from app.utils import CalculationError
+
+
+def make_valve(**overrides) -> ValveInfo:
+    data = dict(id=7, name="БТ-236455", round_radius=2, clearance=0.271, diameter=36,
+                len_part1=513, len_part2=89, len_part3=68)
+    data.update(overrides)
+    return ValveInfo(**data)
+
+
+SPEC = OperatingMapSpec(
+    p_inlet=MapAxis(min=90, max=130, points=5),
+    t_inlet=MapAxis(min=500, max=560, points=4),
+    p_suction=MapAxis(min=0.9, max=1.0, points=3),
+    p_chambers=[10, 1.03],
+)
+
+
+def test_interpolation_matches_exact_within_bound():
+    valve = make_valve()
+    operating_map = build_operating_map(valve, SPEC)
+    point = (117.0, 531.0, 0.93)
+
+    values, errors = operating_map.interpolate(point)
+    exact = calculate_batch([(CalculationParams(
+        temperature_start=point[1], t_air=40, count_valves=1,
+        p_ejector=[point[2]], p_values=[point[0], 10, 1.03],
+    ), valve)])[0]
+
+    g1 = operating_map.names.index("G1")
+    assert values[g1] == pytest.approx(exact.Gi[0], rel=1e-2)
+    assert errors[g1] < 1e-2
+    assert operating_map.error_bound["G1"] >= errors[g1]
+
+
+def test_point_outside_map():
+    operating_map = build_operating_map(make_valve(), SPEC)
+    with pytest.raises(CalculationError):
+        operating_map.interpolate((150.0, 531.0, 0.93))
+
+
+def test_store_roundtrip_and_rebuild_on_geometry_change(tmp_path):
+    store = OperatingMapStore(str(tmp_path))
+    valve = make_valve()
+    store.build(valve, SPEC)
+
+    loaded = OperatingMap.load(str(tmp_path / "7.npz"))
+    assert loaded.meta["spec"] == SPEC.model_dump()
+    answer = store.query(7, 110.0, 520.0, 0.95)
+    assert answer.values["G1"] > 0
+
+    assert store.rebuild_if_stale(valve) is False
+    assert store.rebuild_if_stale(make_valve(clearance=0.3)) is True
+    assert store.query(7, 110.0, 520.0, 0.95).values["G1"] > answer.values["G1"]
+    assert not store.is_building(7)
@@ -0,0 +1,348 @@
+"""
+Трассировка запросов внутри процесса: дерево спанов запрос -> расчёт -> БД.
+
+Спан открывает контекстный менеджер span(); родитель — текущий спан контекста
+(contextvars), поэтому вложенность сохраняется и в пуле потоков обработчиков.
+Вне трассируемого запроса span() ничего не записывает: расчётное ядро в пуле
+процессов, фоновые задачи и командные утилиты трассировку не оплачивают.
+
+Законченная трасса уходит экспортёрам: выборке самых медленных запросов
+(slow_traces, смотрится через /api/v1/admin/traces) и, если задан файл, в JSON Lines
+по строке на трассу. Как и метрики, трассы живут в памяти воркера: выборка
+относится к ответившему воркеру. При импорте модуль тянет только стандартную
+библиотеку: его подключает ядро расчёта.
+"""
+from __future__ import annotations
+
+import heapq
+import itertools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+TRACE_HEADER = b"x-trace-id"
+
+# Предел спанов в одной трассе (пакетные расчёты открывают спаны на каждый участок)
+MAX_SPANS = 2000
+
+# Очередь трасс на запись в файл; при переполнении трассы отбрасываются
+EXPORT_QUEUE_SIZE = 1000
+
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    __slots__ = ("name", "span_id", "parent_id", "start", "duration_ms", "attributes", "error", "_t0")
+
+    def __init__(self, name: str, span_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.start = time.time()
+        self.duration_ms: Optional[float] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+        self._t0 = time.perf_counter()
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def finish(self) -> None:
+        self.duration_ms = (time.perf_counter() - self._t0) * 1000
+
+
+class _NoopSpan:
+    """Спан вне трассы: атрибуты отбрасываются."""
+
+    def set(self, **attributes: Any) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    """Спаны одного запроса в порядке открытия; первый — корневой."""
+
+    def __init__(self, name: str, attributes: Dict[str, Any]):
+        self.trace_id = uuid.uuid4().hex
+        self.pid = os.getpid()
+        self.spans: List[Span] = []
+        self.dropped = 0
+        self._ids = itertools.count(1)
+        self.root = self.add(name, None, attributes)
+
+    def add(self, name: str, parent_id: Optional[str], attributes: Dict[str, Any]) -> Optional[Span]:
+        if len(self.spans) >= MAX_SPANS:
+            self.dropped += 1
+            return None
+        span = Span(name, str(next(self._ids)), parent_id, attributes)
+        self.spans.append(span)
+        return span
+
+    @property
+    def duration_ms(self) -> float:
+        return self.root.duration_ms or 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "pid": self.pid,
+            "name": self.root.name,
+            "started": self.root.start,
+            "duration_ms": self.duration_ms,
+            "span_count": len(self.spans),
+            "dropped_spans": self.dropped,
+            "attributes": dict(self.root.attributes),
+        }
+
+    def _span_dict(self, span: Span) -> Dict[str, Any]:
+        return {
+            "name": span.name,
+            "span_id": span.span_id,
+            "parent_id": span.parent_id,
+            "start_offset_ms": (span.start - self.root.start) * 1000,
+            "duration_ms": span.duration_ms,
+            "attributes": dict(span.attributes),
+            "error": span.error,
+        }
+
+    def tree(self) -> Dict[str, Any]:
+        """Корневой спан с вложенными children."""
+        nodes = {span.span_id: dict(self._span_dict(span), children=[]) for span in self.spans}
+        for span in self.spans[1:]:
+            parent = nodes.get(span.parent_id)
+            if parent is not None:
+                parent["children"].append(nodes[span.span_id])
+        return nodes[self.root.span_id]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Трасса для экспорта: сводка и плоский список спанов."""
+        return dict(self.summary(), spans=[self._span_dict(span) for span in self.spans])
+
+
+_trace: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+_span: ContextVar[Optional[Span]] = ContextVar("span", default=None)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Any]:
+    """
+    Спан внутри текущей трассы; исключение записывается в error спана и пробрасывается.
+    Вне трассы возвращает NOOP_SPAN.
+    """
+    trace = _trace.get()
+    current = trace.add(name, _span.get().span_id, attributes) if trace is not None else None
+    if current is None:
+        yield NOOP_SPAN
+        return
+    token = _span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.finish()
+        _span.reset(token)
+
+
+def set_attributes(**attributes: Any) -> None:
+    """Атрибуты текущего спана (вне трассы — ничего)."""
+    current = _span.get()
+    if current is not None:
+        current.set(**attributes)
+
+
+def annotate_trace(**attributes: Any) -> None:
+    """Атрибуты корневого спана: по ним ищут трассу в выборке (шток, число участков)."""
+    trace = _trace.get()
+    if trace is not None:
+        trace.root.set(**attributes)
+
+
+def current_trace_id() -> Optional[str]:
+    trace = _trace.get()
+    return trace.trace_id if trace is not None else None
+
+
+# ------------------------------ Экспорт ------------------------------ #
+class SlowTraceSampler:
+    """Полные деревья keep самых медленных запросов воркера."""
+
+    def __init__(self, keep: int):
+        self.keep = keep
+        self._heap: List[tuple] = []  # (длительность, порядковый номер, трасса), минимум сверху
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def __call__(self, trace: Trace) -> None:
+        item = (trace.duration_ms, next(self._seq), trace)
+        with self._lock:
+            if len(self._heap) < self.keep:
+                heapq.heappush(self._heap, item)
+            elif self._heap and item[0] > self._heap[0][0]:
+                heapq.heapreplace(self._heap, item)
+
+    def traces(self) -> List[Trace]:
+        """Трассы, самые медленные первыми."""
+        with self._lock:
+            return [trace for _, _, trace in sorted(self._heap, key=lambda item: item[0], reverse=True)]
+
+    def get(self, trace_id: str) -> Trace:
+        for trace in self.traces():
+            if trace.trace_id == trace_id:
+                return trace
+        raise KeyError(trace_id)
+
+    def resize(self, keep: int) -> None:
+        with self._lock:
+            self.keep = keep
+            while len(self._heap) > keep:
+                heapq.heappop(self._heap)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._heap.clear()
+
+
+class FileExporter:
+    """
+    Трассы в файл JSON Lines (по строке на трассу); воркеры дописывают один файл.
+
+    Экспорт вызывается в потоке цикла событий, поэтому только ставит трассу в
+    ограниченную очередь; сериализует и пишет фоновый поток. Переполнена очередь
+    (диск не успевает) — трасса отбрасывается и учитывается в dropped.
+    """
+
+    def __init__(self, path: str, min_duration_ms: float = 0.0, queue_size: int = EXPORT_QUEUE_SIZE):
+        self.path = path
+        self.min_duration_ms = min_duration_ms
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def __call__(self, trace: Trace) -> None:
+        if trace.duration_ms < self.min_duration_ms:
+            return
+        self._start()
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._write_loop, name="trace-export", daemon=True)
+                self._thread.start()
+
+    def _write_loop(self) -> None:
+        stop = False
+        while not stop:
+            batch = [self._queue.get()]
+            while len(batch) < 100:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            lines = [json.dumps(trace.to_dict(), ensure_ascii=False, default=str) + "\n"
+                     for trace in batch if trace is not None]
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.writelines(lines)
+            except OSError as e:
+                logger.error(f"Не удалось записать трассы в {self.path}: {e}")
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Дописывает трассы из очереди и останавливает поток записи."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._queue.put(None)
+        thread.join(timeout)
+
+
+slow_traces = SlowTraceSampler(keep=20)
+exporters: List[Callable[[Trace], None]] = [slow_traces]
+
+
+def configure(slow_keep: int, export_file: Optional[str] = None, export_min_ms: float = 0.0) -> None:
+    """Размер выборки медленных трасс и файловый экспорт (app.main — по настройкам)."""
+    slow_traces.resize(slow_keep)
+    close_exporters()
+    exporters[:] = [slow_traces]
+    if export_file:
+        exporters.append(FileExporter(export_file, export_min_ms))
+
+
+def close_exporters(timeout: float = 5.0) -> None:
+    """Дописывает очереди файловых экспортёров (при остановке приложения)."""
+    for exporter in exporters:
+        if isinstance(exporter, FileExporter):
+            exporter.close(timeout)
+
+
+def _export(trace: Trace) -> None:
+    for exporter in exporters:
+        exporter(trace)
+
+
+@contextmanager
+def start_trace(name: str, **attributes: Any) -> Iterator[Trace]:
+    """Новая трасса с корневым спаном name; по выходе передаётся экспортёрам."""
+    trace = Trace(name, attributes)
+    trace_token, span_token = _trace.set(trace), _span.set(trace.root)
+    try:
+        yield trace
+    except BaseException as e:
+        trace.root.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        trace.root.finish()
+        _span.reset(span_token)
+        _trace.reset(trace_token)
+        _export(trace)
+
+
+class TracingMiddleware:
+    """
+    Корневой спан HTTP-запроса; имя — метод и шаблон маршрута. ID трассы
+    возвращается в заголовке X-Trace-Id.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        from app.metrics import route_template
+
+        with start_trace(f"{scope['method']} {scope['path']}", **{"http.method": scope["method"]}) as trace:
+            async def send_with_trace_id(message):
+                if message["type"] == "http.response.start":
+                    trace.root.set(**{"http.status_code": message["status"]})
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (TRACE_HEADER, trace.trace_id.encode())]
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_trace_id)
+            finally:
+                route = route_template(scope)
+                trace.root.name = f"{scope['method']} {route}"
+                trace.root.set(**{"http.route": route})